@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Golden-output regression check for the bundled animations.
+
+Plays each animation once through led.py on a virtual clock, at full speed,
+into a fake /sys/class/leds tree, and records every LED write to a trace.
+`record` saves the traces and per-animation write counts as the golden set,
+for every animation or only the ones named; `check` plays the animations of
+a golden set again and diffs them against it, so a change to parsing,
+rendering or the LED writer that alters the output shows up as the first
+differing writes:
+
+    python benchmarks/golden.py record [DIR [NAME ...]] [--brightness N]
+    python benchmarks/golden.py check [DIR] [--brightness N]
+
+DIR defaults to the reference set committed in benchmarks/golden, which
+benchmarks/suite.py checks on every run; record it again, at the default
+brightness, only when an output change is intended.
+
+Single traces can be inspected and diffed with python3 -m resources.lib.trace.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ANIMATIONS = os.path.join(ROOT, "resources", "animations")
+GOLDEN_DIR = os.path.join(ROOT, "benchmarks", "golden")
+TRACE_SUFFIX = ".lbt"
+COUNTS_NAME = "writes.json"
+
+
+def play_all(animations_dir, out_dir, brightness, names=None):
+    """Trace one pass of every animation, or of those named, into out_dir; returns write counts per animation"""
+    import led
+    from resources.lib.trace import read_trace
+
+    counts = {}
+    for name in sorted(os.listdir(animations_dir)):
+        if not name.endswith(".animation"):
+            continue
+        animation = name[:-len(".animation")]
+        if names is not None and animation not in names:
+            continue
+        trace = os.path.join(out_dir, animation + TRACE_SUFFIX)
+        led.main(["-f", os.path.join(animations_dir, name), "-n", "1", "-b", str(brightness),
+                  "--fast", "--trace", trace])
+        counts[animation] = len(read_trace(trace))
+    return counts
+
+
+def golden_names(directory):
+    """Animations in a golden set"""
+    with open(os.path.join(directory, COUNTS_NAME)) as f:
+        return set(json.load(f))
+
+
+def run(action, directory=GOLDEN_DIR, brightness=255, names=None, out=sys.stderr):
+    """Record or check a golden set; returns the mismatching animations (all missing ones for a check)"""
+    from resources.lib.ledbus import LEDS_ROOT_ENV, make_led_tree
+    from resources.lib.trace import diff_traces, format_write, read_trace
+
+    if action == "check":
+        names = golden_names(directory)
+    workdir = tempfile.mkdtemp(prefix="lightbar-golden-")
+    leds_root = os.environ.get(LEDS_ROOT_ENV)
+    try:
+        # Copies, so compiled caches start cold and the tree stays clean
+        animations_dir = shutil.copytree(ANIMATIONS, os.path.join(workdir, "animations"),
+                                         ignore=shutil.ignore_patterns("*.animationc", ".index.json"))
+        os.environ[LEDS_ROOT_ENV] = make_led_tree(os.path.join(workdir, "leds"))
+        out_dir = directory if action == "record" else os.path.join(workdir, "traces")
+        os.makedirs(out_dir, exist_ok=True)
+
+        start = time.perf_counter()
+        counts = play_all(animations_dir, out_dir, brightness, names)
+        elapsed = time.perf_counter() - start
+        print(f"Played {len(counts)} animations ({sum(counts.values())} writes) in {elapsed:.1f} s", file=out)
+
+        if action == "record":
+            with open(os.path.join(out_dir, COUNTS_NAME), "w") as f:
+                json.dump(counts, f, indent=1, sort_keys=True)
+                f.write("\n")
+            return []
+
+        failed = sorted(names - set(counts))
+        for animation in failed:
+            print(f"{animation}: no longer bundled", file=out)
+        for animation in sorted(counts):
+            golden = os.path.join(directory, animation + TRACE_SUFFIX)
+            if not os.path.exists(golden):
+                print(f"{animation}: no golden trace", file=out)
+                failed.append(animation)
+                continue
+            expected = read_trace(golden)
+            actual = read_trace(os.path.join(out_dir, animation + TRACE_SUFFIX))
+            mismatches = diff_traces(expected, actual, limit=3)
+            if mismatches:
+                failed.append(animation)
+                print(f"{animation}: {len(expected)} -> {len(actual)} writes", file=out)
+                for i, want, got in mismatches:
+                    print(f"  write {i}: {format_write(want)}  !=  {format_write(got)}", file=out)
+        print(f"{len(names) - len(failed)} of {len(names)} animations match", file=out)
+        return failed
+    finally:
+        if leds_root is None:
+            os.environ.pop(LEDS_ROOT_ENV, None)
+        else:
+            os.environ[LEDS_ROOT_ENV] = leds_root
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lightbar golden-output regression check")
+    parser.add_argument("action", choices=("record", "check"))
+    parser.add_argument("directory", nargs="?", default=GOLDEN_DIR,
+                        help="Directory holding the golden traces (default benchmarks/golden)")
+    parser.add_argument("names", nargs="*", metavar="NAME", help="With record, only these animations")
+    parser.add_argument("--brightness", type=int, default=255, help="Brightness to play at (default 255)")
+    args = parser.parse_args()
+    return 1 if run(args.action, args.directory, args.brightness, args.names or None) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
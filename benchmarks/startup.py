@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Startup benchmark for led.py.
+
+Measures wall-clock time from spawning led.py to its first LED write, in
+direct mode and against a running daemon, and prints the -X importtime
+breakdown of the direct-mode invocations. Runs against a fake
+/sys/class/leds tree, so it works on any Linux box.
+
+    python benchmarks/startup.py [--runs N] [--json] [--max-ms MS]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from resources.lib.ledbus import led_paths, make_led_tree  # noqa: E402
+
+LED_PY = os.path.join(ROOT, "led.py")
+ANIMATION = os.path.join(ROOT, "resources", "animations", "ce-anim_start.animation")
+
+
+def reset_tree(paths):
+    for path in paths:
+        with open(path, 'w') as f:
+            f.write("0\n")
+
+
+def time_to_first_write(argv, env, paths, timeout=5.0):
+    """Spawn led.py and busy-wait until any channel changes; returns (seconds, process)"""
+    reset_tree(paths)
+    fds = [os.open(path, os.O_RDONLY) for path in paths]
+    try:
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, LED_PY] + argv, env=env)
+        while time.perf_counter() - start < timeout:
+            for fd in fds:
+                if os.pread(fd, 16, 0)[:2] != b"0\n":
+                    return time.perf_counter() - start, proc
+            # Leave the CPU to led.py on single-core boxes like the Cube's
+            os.sched_yield()
+        raise RuntimeError(f"No LED write within {timeout}s for {argv}")
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def import_breakdown(argv, env, top=12):
+    """Top-level modules by cumulative import time (ms) for one led.py run"""
+    result = subprocess.run([sys.executable, "-X", "importtime", LED_PY] + argv,
+                            env=env, capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):
+            rows.append((int(cumulative) / 1000.0, name.strip()))
+    rows.sort(reverse=True)
+    return {"total_ms": sum(ms for ms, _ in rows), "modules": [[name, ms] for ms, name in rows[:top]]}
+
+
+def measure(argv, env, paths, runs, kill=False):
+    samples = []
+    for _ in range(runs):
+        seconds, proc = time_to_first_write(argv, env, paths)
+        if kill:
+            proc.terminate()
+        proc.wait()
+        samples.append(seconds * 1000.0)
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples), "max_ms": max(samples)}
+
+
+def measure_python_startup(runs):
+    """Bare interpreter startup, as the floor for the numbers above"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"])
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return {"median_ms": statistics.median(samples), "min_ms": min(samples), "max_ms": max(samples)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="led.py time-to-first-light benchmark")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per scenario")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--max-ms", type=float, help="Fail if any direct-mode median exceeds this")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="lightbar-startup-")
+    try:
+        leds = make_led_tree(os.path.join(workdir, "leds"))
+        paths = led_paths(leds)
+        animation = shutil.copy(ANIMATION, workdir)
+        env = dict(os.environ, LIGHTBAR_LEDS_ROOT=leds, LIGHTBAR_SOCKET=os.path.join(workdir, "lightbar.sock"))
+
+        # Compile once so the animation scenario measures the compiled path
+        subprocess.run([sys.executable, LED_PY, "-f", animation], env=env)
+        color_argv = ["-b", "100", "-c", "ff0000"]
+        animation_argv = ["-a", "-n", "1", "-b", "100", "-f", animation]
+
+        results = {
+            "direct_color": measure(color_argv, env, paths, args.runs),
+            "direct_animation": measure(animation_argv, env, paths, args.runs, kill=True),
+        }
+
+        daemon = subprocess.Popen([sys.executable, LED_PY, "--daemon"], env=env)
+        try:
+            while not os.path.exists(env["LIGHTBAR_SOCKET"]):
+                time.sleep(0.01)
+            results["daemon_color"] = measure(color_argv, env, paths, args.runs)
+            results["daemon_animation"] = measure(animation_argv, env, paths, args.runs, kill=True)
+        finally:
+            daemon.terminate()
+            daemon.wait()
+
+        results["python_startup"] = measure_python_startup(args.runs)
+        results["imports"] = {
+            "direct_color": import_breakdown(color_argv, env),
+            "direct_animation": import_breakdown(["-f", animation], env),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            if name == "imports":
+                continue
+            print(f"{name:18} median {result['median_ms']:7.2f} ms  "
+                  f"(min {result['min_ms']:.2f}, max {result['max_ms']:.2f})")
+        for name, breakdown in results["imports"].items():
+            print(f"\nimports for {name}: {breakdown['total_ms']:.2f} ms")
+            for module, ms in breakdown["modules"]:
+                print(f"  {ms:7.2f} ms  {module}")
+
+    if args.max_ms is not None:
+        slow = [name for name in ("direct_color", "direct_animation") if results[name]["median_ms"] > args.max_ms]
+        if slow:
+            print(f"Over {args.max_ms} ms: {', '.join(slow)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
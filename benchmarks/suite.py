@@ -0,0 +1,935 @@
+#!/usr/bin/env python3
+"""Offline benchmark and regression suite for the playback hot paths.
+
+Runs on any Linux box: the LEDs are a fake /sys/class/leds tree in a temp
+directory and the Kodi modules (xbmc, xbmcaddon, xbmcvfs) are stubbed, so
+the service code runs as it would inside Kodi. Measures
+
+  - parse, compiled-load and render time for every bundled animation
+  - frames per second achievable by led.py's set_brightness
+  - sysfs writes (pwrite syscalls) per frame during real playback
+  - CPU time per second of playback through the Kodi service, played frame
+    by frame and again as the service plays it, handed to kernel triggers
+    where possible
+  - peak memory while parsing and rendering the largest animations
+  - time to reload the largest animations after one frame is edited, and
+    how many lines and frames were parsed and rendered again
+  - Kodi service start to first LED write, with first-time setup pending
+    and already done
+  - time for a boot animation to hand the LEDs over to the Kodi service,
+    against the length of one of its frames, with and without the closing
+    animation the boot unit plays, and the Kodi service start meanwhile
+  - the LED writes of the animations in the committed golden set
+    (benchmarks/golden.py), which must match it write for write
+  - render time of looping keyframe fades, and whether they restart
+    without a jump
+  - how many animations can be handed to kernel LED triggers, and the time
+    to classify them
+  - render time and allocations per frame of every generated effect
+  - compositing time and allocations per tick of a layer in each blend mode,
+    and engine wakeups under a still and an animating layer
+  - ambilight reduction time per captured frame, CPU and LED writes per
+    second while following a synthetic video, and whether a still picture's
+    colors reach the LEDs
+  - playback thread wakeups and CPU per second against the frame rate, and
+    with the animation handed to the kernel triggers, and the time from
+    stop() until the thread has exited
+
+and emits the results as JSON so runs can be compared across commits.
+Behaviour the numbers must show (e.g. one wakeup per frame) is checked as
+well; any failed check is printed at the end and the suite exits with 1:
+
+    python benchmarks/suite.py [--quick] [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import io
+import json
+import os
+import shutil
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ANIMATIONS = os.path.join(ROOT, "resources", "animations")
+
+# Played through the service to measure CPU and writes per frame
+PLAYBACK_ANIMATIONS = ("kitt-red", "zzz_fire", "ce-anim_start", "zzz_magenta-pulse")
+
+# Largest files, measured for peak memory
+LARGEST_COUNT = 3
+
+# Longest the playback thread may take to exit after stop() (ms)
+STOP_LATENCY_MS = 5.0
+
+# Failed behaviour checks, reported once the suite has run
+FAILED = []
+
+# Addon settings seen by the service through the stubbed xbmcaddon
+DEFAULT_SETTINGS = {
+    "enable_led_controller": "true",
+    "color_name": "white",
+    "color": "#FFFFFF",
+    "brightness": "100",
+    "enable_animation": "true",
+    "gamma": "1.0",
+    "balance_red": "100",
+    "balance_green": "100",
+    "balance_blue": "100",
+    "frame_rate": "30",
+    "resample": "box",
+}
+
+
+def install_kodi_stubs(settings):
+    """Register minimal xbmc, xbmcaddon, xbmcgui and xbmcvfs modules reading addon settings from a dict"""
+    xbmc = types.ModuleType("xbmc")
+    xbmc.LOGDEBUG, xbmc.LOGINFO, xbmc.LOGWARNING, xbmc.LOGERROR = range(4)
+    xbmc.log = lambda message, level=0: None
+
+    class Monitor:
+        def __init__(self):
+            self.aborted = threading.Event()
+
+        def abortRequested(self):
+            return self.aborted.is_set()
+
+        def waitForAbort(self, timeout=None):
+            return self.aborted.wait(timeout)
+
+    xbmc.Monitor = Monitor
+
+    class Player:
+        # Set by benchmarks to pretend a video is playing
+        playing_video = False
+
+        def isPlayingVideo(self):
+            return Player.playing_video
+
+    from resources.lib.ambilight import SyntheticCapture
+
+    xbmc.Player = Player
+    xbmc.RenderCapture = SyntheticCapture
+
+    xbmcaddon = types.ModuleType("xbmcaddon")
+
+    class Addon:
+        def __init__(self, id=None):
+            self.id = id
+
+        def getSetting(self, key):
+            return str(settings.get(key, ""))
+
+        def getAddonInfo(self, key):
+            return {"version": "0.0.0", "id": "service.firecube_lightbar"}.get(key, "")
+
+    xbmcaddon.Addon = Addon
+    xbmcgui = types.ModuleType("xbmcgui")
+
+    xbmcvfs = types.ModuleType("xbmcvfs")
+    xbmcvfs.translatePath = lambda path: path
+
+    sys.modules.update(xbmc=xbmc, xbmcaddon=xbmcaddon, xbmcgui=xbmcgui, xbmcvfs=xbmcvfs)
+
+
+def check(name, ok, detail):
+    """Record a behaviour check that the suite fails on; returns ok for the results"""
+    if not ok:
+        FAILED.append(f"{name}: {detail}")
+    return ok
+
+
+def summarize(samples_ms):
+    return {
+        "total_ms": sum(samples_ms),
+        "mean_ms": statistics.mean(samples_ms),
+        "median_ms": statistics.median(samples_ms),
+        "max_ms": max(samples_ms),
+    }
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - start) * 1000.0, result
+
+
+def bench_parse(animations):
+    """Source parse, compile, compiled load and render time per bundled animation"""
+    from resources.lib.animation import clear_render_cache, compile_animation, load_animation, parse_animation
+    from resources.lib.animation import render_animation
+    from resources.lib.color import ColorPipeline
+
+    pipeline = ColorPipeline(255)
+    parse, compile_, load, render = [], [], [], []
+    per_file = {}
+    for path in animations:
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+        parse_ms, _ = timed(parse_animation, lines)
+        compile_ms, _ = timed(compile_animation, path)
+        load_ms, _ = timed(load_animation, path)
+        clear_render_cache()
+        render_ms, _ = timed(render_animation, path, pipeline)
+        parse.append(parse_ms)
+        compile_.append(compile_ms)
+        load.append(load_ms)
+        render.append(render_ms)
+        per_file[os.path.basename(path)] = parse_ms
+
+    slowest = sorted(per_file.items(), key=lambda item: item[1], reverse=True)[:5]
+    return {
+        "files": len(animations),
+        "parse": summarize(parse),
+        "compile": summarize(compile_),
+        "compiled_load": summarize(load),
+        "render": summarize(render),
+        "slowest_parse": [[name, ms] for name, ms in slowest],
+    }
+
+
+def bench_set_brightness(bus, frames):
+    """Frames per second through led.py's set_brightness with no delay, all channels changing or one"""
+    import led
+    from resources.lib.animation import LED_POSITIONS, render_frame
+    from resources.lib.color import ColorPipeline
+    from resources.lib.scheduler import FrameScheduler
+
+    pipeline = ColorPipeline(255)
+    full = (1 << LED_POSITIONS) - 1
+    results = {}
+    variants = {
+        # Every channel changes every frame: 15 writes per frame
+        "all_channels": [render_frame(full, bytes([value]) * 15, pipeline) for value in (10, 20)],
+        # One channel changes: the delta path skips the other 14
+        "one_channel": [render_frame(full, bytes([value]) + bytes(14), pipeline) for value in (10, 20)],
+    }
+    for name, payloads in variants.items():
+        bus.reset()
+        writes = bus.writes
+        scheduler = FrameScheduler()
+        start = time.perf_counter()
+        for i in range(frames):
+            led.set_brightness(bus, payloads[i & 1], 0, scheduler)
+        seconds = time.perf_counter() - start
+        results[name] = {
+            "frames_per_second": frames / seconds,
+            "us_per_frame": seconds * 1e6 / frames,
+            "writes_per_frame": (bus.writes - writes) / frames,
+        }
+    return results
+
+
+def bench_playback(settings, animations_dir, seconds):
+    """CPU time and sysfs writes per played second through the Kodi service with stubbed modules.
+
+    Each animation plays frame by frame, with trigger offload turned off so
+    the per-frame costs stay measurable, and then as the service plays it,
+    handed to the kernel triggers where possible.
+    """
+    from resources.lib import led_controller
+    from resources.lib.engine import PlaybackEngine
+
+    results = {}
+    for name in PLAYBACK_ANIMATIONS:
+        settings["animation"] = os.path.join(animations_dir, f"{name}.animation")
+        runs = {}
+        for run, offload in (("frames", False), ("service", True)):
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            engine = PlaybackEngine(log=led_controller.log, offload=offload)
+            engine.start()
+            led_controller.setup(engine)
+            time.sleep(seconds)
+            offloaded = engine.programs is not None
+            engine.stop()
+            engine.join()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            stats = engine.stats()
+            runs[run] = {
+                "cpu_ms_per_second": cpu * 1000.0 / wall,
+                "writes_per_second": stats["writes"] / wall,
+            }
+            if offloaded:
+                runs[run]["offloaded"] = True
+            else:
+                frames = stats["frames"] or 1
+                runs[run].update({
+                    "offloaded": False,
+                    "frames": stats["frames"],
+                    "dropped": stats["dropped"],
+                    "writes_per_frame": stats["writes"] / frames,
+                    "skipped_per_frame": stats["skipped"] / frames,
+                    "late_mean_ms": stats["late_mean_ms"],
+                    "late_max_ms": stats["late_max_ms"],
+                })
+        results[name] = runs
+
+    # Time until a brightness change is applied by the running engine
+    settings["animation"] = os.path.join(animations_dir, f"{PLAYBACK_ANIMATIONS[0]}.animation")
+    engine = led_controller.setup()
+    time.sleep(0.2)
+    settings["brightness"] = "40"
+    previous = engine.pipeline_key
+    start = time.perf_counter()
+    led_controller.setup(engine)
+    while engine.pipeline_key == previous:
+        time.sleep(0.0001)
+    results["settings_change_ms"] = (time.perf_counter() - start) * 1000.0
+    engine.stop()
+    engine.join()
+    return results
+
+
+def bench_wakeups(animations_dir, leds, seconds, runs):
+    """Playback thread wakeups per second against frames per second, and stop() to join() latency.
+
+    Wakeups are the scheduler's timed waits on the engine's wake event,
+    counted through its wait_event hook. An animation played frame by frame
+    should wake once per frame; one handed to the kernel triggers not at all,
+    with the triggers recorded in the fake LED tree and cleared on stop.
+    """
+    from resources.lib.color import ColorPipeline
+    from resources.lib.engine import PlaybackEngine
+    from resources.lib.ledbus import LedBus, read_led_triggers
+    from resources.lib.scheduler import FrameScheduler, wait_on_event
+
+    waits = [0]
+
+    def counted_wait(event, timeout):
+        waits[0] += 1
+        return wait_on_event(event, timeout)
+
+    def play(name, offload):
+        engine = PlaybackEngine(bus=LedBus(root=leds), scheduler=FrameScheduler(wait_event=counted_wait),
+                                offload=offload)
+        engine.start()
+        engine.play(os.path.join(animations_dir, f"{name}.animation"), ColorPipeline(255), use_loops=True)
+        return engine
+
+    results = {}
+    for run, name, offload in (("frames", "kitt-red", False), ("offloaded", "zzz_magenta-pulse", True)):
+        engine = play(name, offload)
+        time.sleep(0.2)
+        waits[0] = 0
+        frames = engine.scheduler.frames
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        time.sleep(seconds)
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        wakeups = waits[0] / wall
+        frame_rate = (engine.scheduler.frames - frames) / wall
+        offloaded = engine.programs is not None
+        programmed = sum(channel.get("trigger", "none") != "none" for channel in read_led_triggers(leds))
+        engine.stop()
+        engine.join()
+        # One frame may straddle each end of the window
+        limit = frame_rate + 2.0 / wall
+        results[run] = {
+            "wakeups_per_second": wakeups,
+            "frames_per_second": frame_rate,
+            "cpu_ms_per_second": cpu * 1000.0 / wall,
+            "offloaded": offloaded,
+            "one_per_frame": check(f"wakeups.{run}", wakeups <= limit and offloaded == offload,
+                                   f"{wakeups:.1f} wakeups/s at {frame_rate:.1f} frames/s"
+                                   f"{'' if offloaded == offload else ', offload did not match'}"),
+        }
+        if offload:
+            cleared = all(channel.get("trigger", "none") == "none" for channel in read_led_triggers(leds))
+            results[run]["triggers_programmed"] = programmed
+            results[run]["triggers_recorded"] = check(f"wakeups.{run}.triggers", programmed > 0 and cleared,
+                                                      f"{programmed} channels programmed, "
+                                                      f"{'cleared' if cleared else 'left programmed'} on stop")
+
+    stop_ms = []
+    for _ in range(runs):
+        engine = play("kitt-red", False)
+        # Stop at an arbitrary point in a frame
+        time.sleep(random.uniform(0.2, 0.4))
+        start = time.perf_counter()
+        engine.stop()
+        engine.join()
+        stop_ms.append((time.perf_counter() - start) * 1000.0)
+    results["stop"] = summarize(stop_ms)
+    results["stop"]["within_target"] = check("wakeups.stop", max(stop_ms) < STOP_LATENCY_MS,
+                                             f"{max(stop_ms):.1f} ms from stop() to join()")
+    return results
+
+
+def bench_effects(frames):
+    """Render time per frame of each generated effect, and memory retained across frames"""
+    from resources.lib.color import ColorPipeline
+    from resources.lib.effects import EFFECT_NAMES, EffectFrames, make_effect
+
+    results = {}
+    for name in EFFECT_NAMES:
+        effect = EffectFrames(make_effect(name, level=60), ColorPipeline(255))
+        playing = iter(effect)
+        next(playing)
+        start = time.perf_counter()
+        for _ in range(frames):
+            next(playing)
+        seconds = time.perf_counter() - start
+        tracemalloc.start()
+        for _ in range(1000):
+            next(playing)
+        retained, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {"us_per_frame": seconds * 1e6 / frames, "retained_bytes_per_1000_frames": retained}
+    return results
+
+
+def bench_compositor(frames, leds):
+    """Time per tick compositing an animating layer over a base frame in each blend mode, and memory retained.
+
+    Also checks that steady-state ticks retain no memory (the same after
+    1000 ticks as after 3000) and that the engine only wakes for its layers
+    while one of them is animating.
+    """
+    from resources.lib.color import ENCODED, ColorPipeline
+    from resources.lib.compositor import BLEND_MODES, ColorSource, Compositor, Layer
+    from resources.lib.effects import make_effect
+    from resources.lib.engine import PlaybackEngine
+    from resources.lib.ledbus import LedBus
+    from resources.lib.scheduler import FrameScheduler, wait_on_event
+
+    base = [ENCODED[value] for value in range(0, 255, 17)]
+    results = {}
+    for blend in BLEND_MODES:
+        compositor = Compositor()
+        compositor.add("bench", Layer(make_effect("rainbow"), ColorPipeline(255), opacity=0.6, blend=blend), 0)
+        compositor.set_base(base)
+        compositor.composite(0)
+        start = time.perf_counter()
+        for tick in range(frames):
+            compositor.set_base(base)
+            compositor.composite(tick * compositor.tick_ms)
+        seconds = time.perf_counter() - start
+        retained = []
+        for ticks in (1000, 3000):
+            tracemalloc.start()
+            for tick in range(ticks):
+                compositor.set_base(base)
+                compositor.composite(tick * compositor.tick_ms)
+            retained.append(tracemalloc.get_traced_memory()[0])
+            tracemalloc.stop()
+        results[blend] = {
+            "us_per_tick": seconds * 1e6 / frames,
+            "retained_bytes_per_1000_ticks": retained[0],
+            "allocation_free": check(f"compositor.{blend}", retained[1] <= retained[0],
+                                     f"{retained[0]} bytes retained after 1000 ticks, {retained[1]} after 3000"),
+        }
+
+    waits = [0]
+
+    def counted_wait(event, timeout):
+        waits[0] += 1
+        return wait_on_event(event, timeout)
+
+    engine = PlaybackEngine(bus=LedBus(root=leds), scheduler=FrameScheduler(wait_event=counted_wait))
+    engine.start()
+    engine.show_color((0, 0, 255), ColorPipeline(255))
+    wakeups = {}
+    for name, source in (("still_layer", ColorSource((255, 0, 0))), ("animating_layer", make_effect("rainbow"))):
+        engine.show_layer("bench", source, ColorPipeline(255), opacity=0.5)
+        time.sleep(0.1)
+        waits[0] = 0
+        time.sleep(0.5)
+        wakeups[name] = waits[0] / 0.5
+    engine.stop()
+    engine.join()
+    results["wakeups_per_second"] = wakeups
+    results["ticks_only_while_animating"] = check(
+        "compositor.ticks", wakeups["still_layer"] == 0 and wakeups["animating_layer"] > 0,
+        f"{wakeups['still_layer']:.0f} wakeups/s under a still layer, "
+        f"{wakeups['animating_layer']:.0f} under an animating one")
+    return results
+
+
+def bench_ambilight(settings, leds, seconds):
+    """Zone reduction time per capture, and the cost of following a synthetic video through the service.
+
+    Also checks that a still image of five colored strips is reduced to
+    those colors, and that the service shows them on the fake LED tree.
+    """
+    import xbmc
+    import xbmcaddon
+    from resources.lib import led_controller
+    from resources.lib.ambilight import CAPTURE_WIDTH, SyntheticCapture, capture_size, reduce_zones, synthetic_image
+    from resources.lib.animation import LED_POSITIONS, render_frame
+    from resources.lib.color import ColorPipeline, percent_to_level
+    from resources.lib.compositor import DECODED
+    from resources.lib.ledbus import read_led_tree
+
+    strips = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255)]
+    expected = bytes(value for color in strips for value in color)
+    width, height = capture_size(16 / 9)
+    image = synthetic_image(strips, width, height)
+    reduce_ms = [timed(reduce_zones, image, width, height)[0] for _ in range(200)]
+    reduced = bytes(round(value) for value in reduce_zones(image, width, height)) == expected
+
+    settings.update(ambilight="true", ambilight_rate="20", ambilight_smoothing="300")
+    xbmc.Player.playing_video = True
+    try:
+        engine = led_controller.setup()
+        writes = engine.bus.writes
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        time.sleep(seconds)
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        stats = led_controller._ambilight.source.stats()
+        writes = engine.bus.writes - writes
+        led_controller.stop_ambilight()
+        engine.stop()
+        engine.join()
+
+        # A still picture without smoothing must end up on the LEDs as is, through the color pipeline
+        settings.update(ambilight_smoothing="0")
+        xbmc.RenderCapture = lambda: SyntheticCapture([strips])
+        engine = led_controller.setup()
+        time.sleep(0.5)
+        shown = read_led_tree(leds)
+        led_controller.stop_ambilight()
+        engine.stop()
+        engine.join()
+    finally:
+        xbmc.RenderCapture = SyntheticCapture
+        xbmc.Player.playing_video = False
+        settings.update(ambilight="false", ambilight_smoothing="300")
+    gamma, balance = led_controller.read_color_correction(xbmcaddon.Addon())
+    pipeline = ColorPipeline(percent_to_level(int(settings["brightness"])), gamma, balance)
+    wanted = [DECODED[payload] for payload in render_frame((1 << LED_POSITIONS) - 1, expected, pipeline)]
+    return {
+        "capture_size": [CAPTURE_WIDTH, height],
+        "reduce": summarize(reduce_ms),
+        "frames_per_second": stats["frames"] / wall,
+        "cpu_ms_per_second": cpu * 1000.0 / wall,
+        "writes_per_second": writes / wall,
+        "zones_reduced": check("ambilight.reduce", reduced, "strip colors not recovered from the image"),
+        "zones_shown": check("ambilight.shown", shown == wanted, f"LEDs show {shown}, expected {wanted}"),
+    }
+
+
+def first_write_ms(leds, start):
+    """Busy-wait until any channel of the fake tree changes; returns ms since start"""
+    from resources.lib.ledbus import led_paths
+
+    fds = [os.open(path, os.O_RDONLY) for path in led_paths(leds)]
+    try:
+        while time.perf_counter() - start < 5.0:
+            for fd in fds:
+                if os.pread(fd, 16, 0)[:2] != b"0\n":
+                    return (time.perf_counter() - start) * 1000.0
+            os.sched_yield()
+        raise RuntimeError("No LED write within 5s of service start")
+    finally:
+        for fd in fds:
+            os.close(fd)
+
+
+def bench_service_start(settings, leds, workdir, runs):
+    """Kodi service start to first LED write, and the stamp check that gates first-time setup.
+
+    Setup itself is stubbed out: on a real box it writes units and reloads
+    systemd, which is exactly what must not delay the LEDs.
+    """
+    from resources.install import setup as install
+    from resources.lib.ledbus import make_led_tree
+
+    install.STAMP_DIR = os.path.join(workdir, "config")
+    os.makedirs(install.STAMP_DIR, exist_ok=True)
+
+    def run_setup():
+        time.sleep(0.2)
+        return True
+    install.run_setup = run_setup
+
+    import service
+
+    settings.update(brightness="100", enable_animation="false", color_name="red")
+    samples = {"setup_pending": [], "setup_current": []}
+    for name in samples:
+        for _ in range(runs):
+            make_led_tree(leds)
+            if name == "setup_pending":
+                for stamp in os.listdir(install.STAMP_DIR):
+                    os.unlink(os.path.join(install.STAMP_DIR, stamp))
+            start = time.perf_counter()
+            svc = service.LEDService()
+            samples[name].append(first_write_ms(leds, start))
+            svc.animation_thread.stop()
+            svc.animation_thread.join()
+            time.sleep(0.25)
+
+    check_ms = []
+    for _ in range(runs):
+        ms, _ = timed(install.setup_current, "0.0.0")
+        check_ms.append(ms)
+    results = {name: summarize(values) for name, values in samples.items()}
+    results["stamp_check"] = summarize(check_ms)
+    return results
+
+
+def start_boot_player(path, boot, then=None):
+    """led.py playing a boot animation as the boot unit runs it, once it listens for the service"""
+    command = [sys.executable, os.path.join(ROOT, "led.py"), "-a", "-i", "-b", "100", "--handover", "-f", boot]
+    if then is not None:
+        command += ["--then", then]
+    player = subprocess.Popen(command)
+    deadline = time.monotonic() + 5
+    while not os.path.exists(path):
+        if time.monotonic() > deadline:
+            player.kill()
+            player.wait()
+            raise RuntimeError("Boot player did not start listening within 5s")
+        time.sleep(0.005)
+    return player
+
+
+def bench_handover(settings, animations_dir, leds, workdir, runs):
+    """Boot animation handing the LEDs over to the Kodi service, with and without a closing animation.
+
+    handover is the time until the boot player has let go and whether it
+    left the LEDs lit; service_start is how long the service constructor
+    takes meanwhile, which must not wait for the closing animation.
+    """
+    from resources.lib.animation import expand_frames, render_animation
+    from resources.lib.color import ColorPipeline
+    from resources.lib.handover import HANDOVER_ENV, request_handover
+    from resources.lib.ledbus import make_led_tree, read_led_tree
+
+    import service
+
+    boot = os.path.join(animations_dir, "ce-anim_start.animation")
+    closing = os.path.join(animations_dir, "anim_start_error_short.animation")
+    path = os.environ[HANDOVER_ENV] = os.path.join(workdir, "handover.sock")
+    frame_ms = max(delay for delay, _ in expand_frames(render_animation(boot, ColorPipeline(100)), True))
+    closing_ms = sum(delay for delay, _ in expand_frames(render_animation(closing, ColorPipeline(100))))
+    settings.update(brightness="100", enable_animation="false", color_name="red")
+    results = {"frame_ms": frame_ms, "closing_ms": closing_ms, "runs": runs}
+    for name, then in (("stop", None), ("shipped", closing)):
+        handover_ms = []
+        start_ms = []
+        left_on = 0
+        for _ in range(runs):
+            make_led_tree(leds)
+            player = start_boot_player(path, boot, then)
+            try:
+                # Ask at an arbitrary point in a frame
+                time.sleep(random.uniform(0.3, 0.8))
+                ms, _ = timed(request_handover)
+                handover_ms.append(ms)
+                player.wait(10)
+                left_on += any(read_led_tree(leds))
+            finally:
+                if player.poll() is None:
+                    player.kill()
+                    player.wait()
+
+            player = start_boot_player(path, boot, then)
+            try:
+                time.sleep(random.uniform(0.3, 0.8))
+                ms, svc = timed(service.LEDService)
+                start_ms.append(ms)
+                svc.animation_thread.hold.wait(10)
+                svc.animation_thread.stop()
+                svc.animation_thread.join()
+                player.wait(10)
+            finally:
+                if player.poll() is None:
+                    player.kill()
+                    player.wait()
+        results[name] = {"handover": summarize(handover_ms), "service_start": summarize(start_ms),
+                         "left_lit": left_on}
+    return results
+
+
+def bench_reload(animations, workdir):
+    """Rendering each of the largest animations from scratch, then again after one frame's color is edited"""
+    from resources.lib.animation import EditMemo, clear_render_cache, parse_frame, render_animation, render_frame
+    from resources.lib.color import ColorPipeline
+    from resources.lib.interpolate import DEFAULT_FRAME_RATE
+    from resources.lib.resample import DEFAULT_RESAMPLE
+    import resources.lib.animation as animation
+
+    counts = {"parse": 0, "render": 0}
+
+    def counted(name, func):
+        def wrapper(*args):
+            counts[name] += 1
+            return func(*args)
+        return wrapper
+
+    pipeline = ColorPipeline(255)
+    largest = sorted(animations, key=os.path.getsize, reverse=True)[:LARGEST_COUNT]
+    results = {}
+    animation.parse_frame = counted("parse", parse_frame)
+    animation.render_frame = counted("render", render_frame)
+    try:
+        for path in largest:
+            with open(path, 'r') as f:
+                lines = f.read().splitlines()
+            edited = [i for i, line in enumerate(lines) if ":" in line and not line.startswith("#")]
+            if not edited:
+                continue
+            copy = os.path.join(workdir, os.path.basename(path))
+            with open(copy, 'w') as f:
+                f.write("\n".join(lines) + "\n")
+            clear_render_cache()
+            memo = EditMemo()
+            counts.update(parse=0, render=0)
+            load_ms, _ = timed(render_animation, copy, pipeline, DEFAULT_FRAME_RATE, DEFAULT_RESAMPLE, memo)
+            first = dict(counts)
+
+            # Flip the first color of a frame in the middle, as an editor save would
+            i = edited[len(edited) // 2]
+            delay, _, colors = lines[i].partition(":")
+            lines[i] = f"{delay}:{'000' if not colors.startswith('000') else 'FFF'}{colors[3:]}"
+            with open(copy, 'w') as f:
+                f.write("\n".join(lines) + "\n")
+            st = os.stat(copy)
+            os.utime(copy, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+            counts.update(parse=0, render=0)
+            reload_ms, _ = timed(render_animation, copy, pipeline, DEFAULT_FRAME_RATE, DEFAULT_RESAMPLE, memo)
+            results[os.path.basename(path)] = {
+                "lines": len(lines),
+                "load_ms": load_ms,
+                "reload_ms": reload_ms,
+                "load_parsed": first["parse"],
+                "load_rendered": first["render"],
+                "reload_parsed": counts["parse"],
+                "reload_rendered": counts["render"],
+            }
+    finally:
+        animation.parse_frame = parse_frame
+        animation.render_frame = render_frame
+        clear_render_cache()
+    return results
+
+
+def bench_golden():
+    """Time to play the committed golden set through led.py, and whether every write still matches it"""
+    import golden
+
+    log = io.StringIO()
+    play_ms, failed = timed(golden.run, "check", golden.GOLDEN_DIR, 255, None, log)
+    return {
+        "animations": len(golden.golden_names(golden.GOLDEN_DIR)),
+        "play_ms": play_ms,
+        "match": check("golden", not failed, f"{', '.join(failed)} differ:\n{log.getvalue()}"),
+    }
+
+
+def bench_keyframe_loops(workdir, leds):
+    """Render time of looping keyframe fades, and whether they play on without a jump where they start over.
+
+    A whole animation and a 'loop' block of red and blue fades are played
+    for three passes through FrameSequence, the engine's cursor and a
+    stream; no step between frames may be larger than one within the first
+    pass, which starts from black.
+    """
+    from resources.lib.animation import clear_render_cache, expand_frames, render_animation, stream_frames
+    from resources.lib.color import ColorPipeline
+    from resources.lib.engine import PlaybackEngine
+    from resources.lib.ledbus import LedBus
+
+    fades = "~300:ff0000,ff0000,ff0000,ff0000,ff0000\n~300:0000ff,0000ff,0000ff,0000ff,0000ff\n"
+    pipeline = ColorPipeline(255)
+    passes = 3
+
+    def largest_step(frames):
+        shown = [0] * 15
+        steps = []
+        for _, payloads in frames:
+            values = [int(value) for value in payloads]
+            steps.append(max(abs(a - b) for a, b in zip(values, shown)))
+            shown = values
+        return max(steps)
+
+    results = {}
+    for name, source in (("animation", fades), ("loop_block", f"loop {passes}\n{fades}")):
+        path = os.path.join(workdir, f"fades-{name}.animation")
+        with open(path, 'w') as f:
+            f.write(source)
+        clear_render_cache()
+        render_ms, blocks = timed(render_animation, path, pipeline, 10)
+        sequence = expand_frames(blocks, use_loops=True)
+        first = list(sequence)
+
+        engine = PlaybackEngine(bus=LedBus(root=leds), offload=False)
+        engine.start_animation(path, pipeline.key, [(repeat, frames) for repeat, frames in blocks if repeat])
+        played = []
+        for _ in range(len(first) * passes):
+            played.append(engine.current_frame())
+            engine.advance()
+        engine.bus.close()
+
+        with open(path) as f:
+            streamed = list(stream_frames(f, pipeline, True, 10))
+
+        limit = largest_step(first)
+        steps = {
+            "sequence": largest_step(first + [frame for _ in range(passes - 1) for frame in sequence.replay()]),
+            "engine": largest_step(played),
+            "stream": largest_step(streamed),
+        }
+        results[name] = {
+            "render_ms": render_ms,
+            "first_pass_step": limit,
+            "largest_step": steps,
+            "continuous": check(f"keyframe_loops.{name}", all(step <= limit for step in steps.values()),
+                                f"steps {steps} against {limit} within the first pass"),
+        }
+    clear_render_cache()
+    return results
+
+
+def bench_offload(animations):
+    """Animations the kernel LED triggers can play on their own, by trigger, and time to classify them"""
+    from resources.lib.animation import expand_frames, render_animation, static_frame
+    from resources.lib.color import ColorPipeline
+    from resources.lib.triggers import trigger_programs
+
+    counts = {"static": 0, "timer": 0, "pattern": 0, "frames": 0}
+    classify_ms = []
+    for path in animations:
+        blocks = render_animation(path, ColorPipeline(255))
+        if static_frame(blocks) is not None:
+            counts["static"] += 1
+            continue
+        start = time.perf_counter()
+        programs = trigger_programs(expand_frames(blocks))
+        classify_ms.append((time.perf_counter() - start) * 1000.0)
+        triggers = {value for program in programs or () if program for attribute, value in program
+                    if attribute == "trigger"}
+        kind = "timer" if "timer" in triggers else "pattern" if programs is not None else "frames"
+        counts[kind] += 1
+    return {"animations": counts, "classify": summarize(classify_ms)}
+
+
+def bench_memory(animations):
+    """Peak traced memory while parsing and rendering each of the largest animations from scratch"""
+    from resources.lib.animation import clear_render_cache, parse_animation, render_animation
+    from resources.lib.color import ColorPipeline
+
+    largest = sorted(animations, key=os.path.getsize, reverse=True)[:LARGEST_COUNT]
+    results = {}
+    for path in largest:
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+        clear_render_cache()
+        tracemalloc.start()
+        parse_animation(lines)
+        _, parse_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        render_animation(path, ColorPipeline(255))
+        _, render_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[os.path.basename(path)] = {
+            "lines": len(lines),
+            "parse_peak_kb": parse_peak / 1024.0,
+            "render_peak_kb": render_peak / 1024.0,
+        }
+    clear_render_cache()
+    return results
+
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(results, baseline):
+    """Print every metric that moved by more than 5% against a baseline run"""
+    current, previous = flatten(results), flatten(baseline)
+    for name in sorted(current):
+        if name not in previous or not previous[name]:
+            continue
+        change = (current[name] - previous[name]) / abs(previous[name]) * 100.0
+        if abs(change) >= 5.0:
+            print(f"{name:60} {previous[name]:12.3f} -> {current[name]:12.3f}  ({change:+.1f}%)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lightbar offline benchmark suite")
+    parser.add_argument("--quick", action="store_true", help="Fewer frames and shorter playback")
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    parser.add_argument("--compare", help="Report metrics that changed against an earlier JSON result")
+    args = parser.parse_args()
+
+    frames = 2000 if args.quick else 20000
+    play_seconds = 1.0 if args.quick else 3.0
+
+    workdir = tempfile.mkdtemp(prefix="lightbar-bench-")
+    try:
+        # Copies, so compiled caches start cold and the tree stays clean
+        animations_dir = shutil.copytree(ANIMATIONS, os.path.join(workdir, "animations"),
+                                         ignore=shutil.ignore_patterns("*.animationc", ".index.json"))
+        animations = sorted(os.path.join(animations_dir, name) for name in os.listdir(animations_dir)
+                            if name.endswith(".animation"))
+
+        from resources.lib.ledbus import LEDS_ROOT_ENV, LedBus, make_led_tree
+
+        leds = make_led_tree(os.path.join(workdir, "leds"))
+        os.environ[LEDS_ROOT_ENV] = leds
+
+        results = {
+            "python": sys.version.split()[0],
+            "parse": bench_parse(animations),
+            "memory": bench_memory(animations),
+            "reload": bench_reload(animations, workdir),
+            "golden": bench_golden(),
+            "keyframe_loops": bench_keyframe_loops(workdir, leds),
+            "offload": bench_offload(animations),
+            "effects": bench_effects(frames),
+            "compositor": bench_compositor(frames, leds),
+        }
+        results["wakeups"] = bench_wakeups(animations_dir, leds, play_seconds, 3 if args.quick else 10)
+        bus = LedBus(root=leds)
+        try:
+            results["set_brightness"] = bench_set_brightness(bus, frames)
+        finally:
+            bus.close()
+        settings = dict(DEFAULT_SETTINGS)
+        install_kodi_stubs(settings)
+        results["playback"] = bench_playback(settings, animations_dir, play_seconds)
+        results["ambilight"] = bench_ambilight(settings, leds, play_seconds)
+        results["service_start"] = bench_service_start(settings, leds, workdir, 3 if args.quick else 10)
+        results["handover"] = bench_handover(settings, animations_dir, leds, workdir, 3 if args.quick else 10)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    for failure in FAILED:
+        print(f"FAILED {failure}", file=sys.stderr)
+    if FAILED:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,141 @@
 #!/usr/bin/env python3
 
-import argparse
+# Only cheap imports at module level: led.py runs during boot and shutdown,
+# where interpreter startup is visible as a delay before the bar lights up.
+# Everything else is imported where it is needed.
 import os
 import sys
-import time
 
 # Default maximum brightness (255 if not specified)
 MAX_BRIGHTNESS = 255
 
-# Define LED paths for RGB channels
-LED_PATHS = [
-    "/sys/class/leds/led13/brightness", # Red 1st position
-    "/sys/class/leds/led14/brightness", # Green 1st position
-    "/sys/class/leds/led15/brightness", # Blue 1st position
-    
-    "/sys/class/leds/led10/brightness", # Red 2nd position
-    "/sys/class/leds/led11/brightness", # Green 2nd position
-    "/sys/class/leds/led12/brightness", # Blue 2nd position
-    
-    "/sys/class/leds/led7/brightness",  # Red 3rd position
-    "/sys/class/leds/led8/brightness",  # Green 3rd position
-    "/sys/class/leds/led9/brightness",  # Blue 3rd position 
-       
-    "/sys/class/leds/led4/brightness",  # Red 4th position
-    "/sys/class/leds/led5/brightness",  # Green 4th position
-    "/sys/class/leds/led6/brightness",  # Blue 4th position
-    
-    "/sys/class/leds/led1/brightness",  # Red 5th position
-    "/sys/class/leds/led2/brightness",  # Green 5th position
-    "/sys/class/leds/led3/brightness",  # Blue 5th position    
-]
-
-class CustomHelpFormatter(argparse.HelpFormatter):
-    def _get_default_metavar_for_optional(self, action):
-        return ''
-
-    def _format_action_invocation(self, action):
-        if action.dest == 'brightness':
-            return '-b, --brightness'
-        elif action.dest == 'file':
-            return '-f, --file'
-        elif action.dest == 'color':
-            return '-c, --color'
-        elif action.dest == 'time':
-            return '-t, --time'
-        elif action.dest == 'number':
-            return '-n, --number'
-        elif action.dest == 'infinity':
-            return '-i, --infinity'
-        elif action.dest == 'animate':
-            return '-a, --animate'
+# Gamma correction applied to animation and solid colors (None for linear)
+GAMMA = None
+
+# Output rate for keyframe fades (None for the default)
+FRAME_RATE = None
+
+# How frames with more colors than LED positions are mapped onto the bar (None for the default)
+RESAMPLE = None
+
+# Frame instrumentation for direct playback (None when off)
+INSTRUMENT = None
+
+# Virtual clock for --fast playback (None to play in real time)
+CLOCK = None
+
+# Options understood by the argv fast path, mapped to their destinations
+FAST_VALUE_OPTIONS = {
+    '-b': 'brightness', '--brightness': 'brightness',
+    '-f': 'file', '--file': 'file',
+    '-c': 'color', '--color': 'color',
+    '-t': 'time', '--time': 'time',
+    '-n': 'number', '--number': 'number',
+    '-r': 'rate', '--rate': 'rate',
+    '-g': 'gamma', '--gamma': 'gamma',
+    '--then': 'then',
+}
+FAST_FLAG_OPTIONS = {
+    '-i': 'infinity', '--infinity': 'infinity',
+    '-a': 'animate', '--animate': 'animate',
+    '--handover': 'handover',
+    '--watch': 'watch',
+}
+
+
+def parse_fast_args(argv):
+    """Parse plain solid-color and animation invocations without argparse.
+
+    Returns None for anything else (help, daemon options, abbreviations,
+    invalid combinations) so argparse can handle it and report errors.
+    """
+    from types import SimpleNamespace
+
+    args = SimpleNamespace(brightness=128, file=None, color=None, time=None, number=None, gamma=None, rate=None, resample=None,
+                           infinity=False, animate=False, stop=False, state=False, daemon=False,
+                           list=False, info=None, stats=False, stats_interval=0, trace=None, fast=False,
+                           effect=None, speed=1.0, effect_color=None, level=100, handover=False, then=None,
+                           watch=False)
+    i = 0
+    while i < len(argv):
+        option = argv[i]
+        if option in FAST_FLAG_OPTIONS:
+            setattr(args, FAST_FLAG_OPTIONS[option], True)
+        elif option in FAST_VALUE_OPTIONS and i + 1 < len(argv):
+            i += 1
+            setattr(args, FAST_VALUE_OPTIONS[option], argv[i])
         else:
-            return super()._format_action_invocation(action)
+            return None
+        i += 1
+
+    if (args.file is None) == (args.color is None):
+        return None
+    if (args.time is not None) + (args.number is not None) + args.infinity > 1:
+        return None
+    try:
+        args.brightness = int(args.brightness)
+        args.time = None if args.time is None else int(args.time)
+        args.number = None if args.number is None else int(args.number)
+        args.gamma = None if args.gamma is None else float(args.gamma)
+        args.rate = None if args.rate is None else int(args.rate)
+    except ValueError:
+        return None
+    return args
+
+
+def build_parser():
+    import argparse
+
+    from resources.lib.effects import EFFECT_NAMES
+    from resources.lib.resample import RESAMPLE_MODES
+
+    class CustomHelpFormatter(argparse.HelpFormatter):
+        def _get_default_metavar_for_optional(self, action):
+            return ''
+
+        def _format_action_invocation(self, action):
+            if action.dest == 'brightness':
+                return '-b, --brightness'
+            elif action.dest == 'file':
+                return '-f, --file'
+            elif action.dest == 'color':
+                return '-c, --color'
+            elif action.dest == 'time':
+                return '-t, --time'
+            elif action.dest == 'number':
+                return '-n, --number'
+            elif action.dest == 'infinity':
+                return '-i, --infinity'
+            elif action.dest == 'animate':
+                return '-a, --animate'
+            elif action.dest == 'gamma':
+                return '-g, --gamma'
+            elif action.dest == 'rate':
+                return '-r, --rate'
+            else:
+                return super()._format_action_invocation(action)
 
-def main():
     parser = argparse.ArgumentParser(
         description='Fire Cube LED controller',
         formatter_class=CustomHelpFormatter
     )
     parser.add_argument('-b', '--brightness', type=int, default=128, help='Set brightness')
+    parser.add_argument('-g', '--gamma', type=float, help='Gamma correction (default 1.0, linear)')
+    parser.add_argument('-r', '--rate', type=int, help='Frames per second for keyframe fades (default 30, max 50)')
+    parser.add_argument('--resample', choices=RESAMPLE_MODES,
+                        help='Mapping of frames with more than 5 colors onto the bar (default box)')
     
     # Define mutually exclusive group for animation and solid color options
     group = parser.add_mutually_exclusive_group(required=True)
-    group.add_argument('-f', '--file', type=str, help='Path to file with frame data')
+    group.add_argument('-f', '--file', type=str, help="Path to file with frame data, or '-' for stdin")
     group.add_argument('-c', '--color', type=str, help='Set a solid color for all LEDs')
+    group.add_argument('--stop', action='store_true', help='Stop any animation and turn off all LEDs')
+    group.add_argument('--state', action='store_true', help='Print the state of the running daemon')
+    group.add_argument('--daemon', action='store_true', help='Run the lightbar daemon in the foreground')
+    group.add_argument('--list', action='store_true', help='List the bundled animations with their metadata')
+    group.add_argument('--info', type=str, metavar='NAME', help='Show the metadata of one bundled animation')
+    group.add_argument('--stats', action='store_true', help='Print frame timing stats of the daemon or Kodi service')
+    group.add_argument('--effect', choices=EFFECT_NAMES, help='Play a generated effect instead of a file')
     
     # Define mutually exclusive group for timing options
     time_group = parser.add_mutually_exclusive_group()
@@ -72,183 +144,446 @@ def main():
     time_group.add_argument('-i','--infinity', action='store_true', help='Loop the animation indefinitely')
 
     parser.add_argument('-a', '--animate', action='store_true', help='Use in file loop instructions')
-    
-    args = parser.parse_args()
-    global MAX_BRIGHTNESS
+    parser.add_argument('--speed', type=float, default=1.0, help='Effect speed multiplier (default 1.0)')
+    parser.add_argument('--effect-color', type=str, metavar='HEX', help="Effect color (default the effect's own)")
+    parser.add_argument('--level', type=float, default=100, metavar='PERCENT',
+                        help='Fill level of the level effect (default 100)')
+    parser.add_argument('--handover', action='store_true',
+                        help='Play until the Kodi service asks for the LEDs, then hand them over without blanking')
+    parser.add_argument('--then', type=str, metavar='FILE',
+                        help='With --handover, animation crossfaded in and played once before handing over')
+    parser.add_argument('--watch', action='store_true',
+                        help='Reload the file whenever it is saved, at the end of the current loop pass')
+    parser.add_argument('--stats-interval', type=float, default=0, metavar='SECONDS',
+                        help='Record frame timing stats and report them every SECONDS (default off)')
+    parser.add_argument('--trace', type=str, metavar='FILE',
+                        help='Record every LED write to a binary trace FILE (see resources/lib/trace.py)')
+    parser.add_argument('--fast', action='store_true',
+                        help='Play on a virtual clock at full speed instead of in real time')
+    return parser
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    args = parse_fast_args(argv) or build_parser().parse_args(argv)
+    global MAX_BRIGHTNESS, GAMMA, FRAME_RATE, RESAMPLE, INSTRUMENT, CLOCK
     MAX_BRIGHTNESS = args.brightness
+    GAMMA = args.gamma
+    FRAME_RATE = args.rate
+    RESAMPLE = args.resample
+    # Set again below for direct playback; main() may run more than once in a process
+    INSTRUMENT = None
+    CLOCK = None
 
-    # Open LED paths once and keep the file handles open
-    led_file_handles = []
-    for path in LED_PATHS:
-        try:
-            handle = open(path, 'w')
-            led_file_handles.append(handle)
-        except IOError as e:
-            print(f"Error opening {path}: {e}", file=sys.stderr)
+    if args.daemon:
+        from resources.lib.daemon import run_daemon
+        run_daemon(stats_interval=args.stats_interval)
+        return
+
+    if args.stats:
+        print_stats()
+        return
+
+    if args.list or args.info:
+        from resources.lib.catalog import load_catalog, print_info, print_list
+
+        catalog = load_catalog()
+        if args.list:
+            print_list(catalog)
+        elif not print_info(catalog, args.info):
+            print(f"No animation named {args.info}", file=sys.stderr)
             sys.exit(1)
+        return
+
+    # Hand the request to a running daemon, falling back to direct mode without one
+    if run_client(args):
+        return
+    if args.state:
+        print("No lightbar daemon running", file=sys.stderr)
+        sys.exit(1)
 
+    from resources.lib.ledbus import LedBus
+
+    if args.stats_interval:
+        from resources.lib.daemon import report_stats
+        from resources.lib.instrument import FrameInstrument
+
+        INSTRUMENT = FrameInstrument(args.stats_interval, report_stats)
+
+    # Open LED paths once and keep the file handles open
+    try:
+        bus = LedBus()
+    except IOError as e:
+        print(f"Error opening {e.filename}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.fast:
+        from resources.lib.scheduler import VirtualClock
+
+        CLOCK = VirtualClock()
+    trace = None
+    if args.trace:
+        from resources.lib.trace import TraceRecorder
+
+        trace = TraceRecorder(args.trace, CLOCK and CLOCK.clock)
+        trace.attach(bus)
+
+    leave_on = False
     try:
         if args.color:
             # Set a solid color
-            set_solid_color(led_file_handles, args.color)
+            set_solid_color(bus, args.color)
             # Do not turn off LEDs; leave them on indefinitely
             sys.exit(0)
-        elif args.file:
-            # Read frames from file
+        elif args.effect:
+            leave_on = play_effect(bus, args)
+        elif args.file == '-':
+            # Play frames as they stream in on stdin; a stream plays once
+            from resources.lib.animation import stream_frames
+
+            scheduler = new_scheduler()
+            lines = producer_lines(sys.stdin, scheduler)
+            for delay, payloads in stream_frames(lines, color_pipeline(), args.animate, frame_rate(), resample_mode()):
+                set_brightness(bus, payloads, delay, scheduler)
+                if args.time and scheduler.elapsed() >= args.time:
+                    break
+        elif args.file and args.watch:
+            play_watching(bus, args, new_scheduler())
+        elif args.file and args.handover:
             frames = read_frames_from_file(args.file, args.animate)
-            if args.time:
-                # Run animation for a specified loop time
-                end_time = time.time() + args.time
-                current_time = time.time()
-                while current_time < end_time:
-                    for frame_line in frames:
-                        delay_str, frame = frame_line.split(':', 1)
-                        try:
-                            delay = int(delay_str)
-                        except ValueError:
-                            continue
-
-                        set_brightness(led_file_handles, frame, delay)
-                        current_time = time.time()
-                        if current_time >= end_time:
-                            break
-            elif args.number:
-                # Loop the animation a specified number of times
-                for _ in range(args.number):
-                    for frame_line in frames:
-                        delay_str, frame = frame_line.split(':', 1)
-                        try:
-                            delay = int(delay_str)
-                        except ValueError:
-                            continue
-
-                        set_brightness(led_file_handles, frame, delay)
-            elif args.infinity:
-                # Loop the animation indefinitely
-                while True:
-                    for frame_line in frames:
-                        delay_str, frame = frame_line.split(':', 1)
-                        try:
-                            delay = int(delay_str)
-                        except ValueError:
-                            continue
-
-                        set_brightness(led_file_handles, frame, delay)
+            leave_on = play_handover(bus, frames, args, new_scheduler())
+        elif args.file and (args.time or args.number or args.infinity):
+            play_file(bus, args, offload=INSTRUMENT is None and trace is None)
     finally:
-        # Turn off all LEDs and close file handles if not in color mode
-        if not args.color:
-            for handle in led_file_handles:
-                try:
-                    handle.write("0\n")
-                    handle.flush()
-                    handle.close()
-                except IOError as e:
-                    print(f"Error turning off LEDs: {e}", file=sys.stderr)
-                    sys.exit(1)
-
-def read_frames_from_file(file_path, use_animate=False):
-    """Read animation frames from a file, ignoring lines that start with 'loop', '#', or are blank unless -a is used"""
-    if not os.path.exists(file_path):
-        print(f"File path {file_path} does not exist", file=sys.stderr)
-        sys.exit(1)
-    with open(file_path, 'r') as f:
-        lines = f.read().splitlines()
+        if INSTRUMENT is not None:
+            from resources.lib.daemon import report_stats
+            report_stats(INSTRUMENT.snapshot())
+
+        # Turn off all LEDs and close file handles unless a color was left on
+        if not (args.color or leave_on):
+            try:
+                bus.close()
+            except IOError as e:
+                print(f"Error turning off LEDs: {e}", file=sys.stderr)
+                sys.exit(1)
+        if trace is not None:
+            trace.close()
 
-    if not use_animate:
-        # Ignore lines that start with 'loop', '#' or are blank
-        frames = [line for line in lines if line.strip() and not (line.strip().lower().startswith('loop') or line.strip().startswith('#'))]
+def run_client(args):
+    """Send the request to the lightbar daemon; returns False if no daemon is running"""
+    if (args.file == '-' or args.effect or args.stats_interval or args.trace or args.fast or args.handover
+            or args.watch):
+        # Streams, effects, instrumented, traced, virtual-clock, boot handover and watched runs are played in-process
+        return False
+    if args.color:
+        command = {"cmd": "color", "color": args.color, "brightness": args.brightness, "gamma": args.gamma}
+    elif args.stop:
+        command = {"cmd": "stop"}
+    elif args.state:
+        command = {"cmd": "state"}
     else:
-        frames = []
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            if line.lower().startswith('loop'):
-                try:
-                    loop_count = int(line.split()[1])
-                except (IndexError, ValueError):
-                    i += 1
-                    continue
-                loop_start = i + 1
-                loop_end = loop_start
-                while loop_end < len(lines) and lines[loop_end].strip():
-                    loop_end += 1
-                loop_lines = lines[loop_start:loop_end]
-                for _ in range(loop_count):
-                    frames.extend(loop_lines)
-                i = loop_end
-            elif line and not line.startswith('#'):
-                frames.append(line)
-            i += 1
+        command = {
+            "cmd": "play",
+            "file": os.path.abspath(args.file),
+            "brightness": args.brightness,
+            "gamma": args.gamma,
+            "animate": args.animate,
+            "rate": args.rate,
+            "resample": args.resample,
+            "number": args.number,
+            "time": args.time,
+            "infinity": args.infinity,
+            "wait": True,
+        }
+
+    from resources.lib.client import send_command
+
+    reply = send_command(command)
+    if reply is None:
+        return False
+    if not reply.get("ok"):
+        print(reply.get("error", "Lightbar daemon error"), file=sys.stderr)
+        sys.exit(1)
+    if args.state:
+        import json
+        print(json.dumps(reply["state"], indent=2))
+    return True
+
+def print_stats():
+    """Print the running daemon's frame stats, or the last ones written to the status file"""
+    import json
+
+    from resources.lib.client import send_command
+    from resources.lib.instrument import read_status, stats_file
+
+    reply = send_command({"cmd": "stats"})
+    if reply is not None and reply.get("ok"):
+        print(json.dumps(reply["stats"], indent=2))
+        return
+    snapshot = read_status()
+    if snapshot is None:
+        error = reply.get("error") if reply else f"No lightbar daemon running and no stats in {stats_file()}"
+        print(error, file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(snapshot, indent=2))
+
+def read_frames_from_file(file_path, use_animate=False, memo=None):
+    """Load rendered animation frames, expanding loop instructions only if -a is used"""
+    from resources.lib.animation import expand_frames, render_animation
+
+    pipeline = color_pipeline()
+    return expand_frames(render_animation(file_path, pipeline, frame_rate(), resample_mode(), memo), use_animate)
+
+def color_pipeline():
+    """Color pipeline for the requested brightness and gamma"""
+    from resources.lib.color import DEFAULT_GAMMA, ColorPipeline
+
+    return ColorPipeline(MAX_BRIGHTNESS, GAMMA or DEFAULT_GAMMA)
+
+def frame_rate():
+    """Output rate for keyframe fades, capped to what the LED driver keeps up with"""
+    from resources.lib.interpolate import clamp_rate
+
+    return clamp_rate(FRAME_RATE)
+
+def resample_mode():
+    from resources.lib.resample import DEFAULT_RESAMPLE
+
+    return RESAMPLE or DEFAULT_RESAMPLE
+
+def play_effect(bus, args):
+    """Play a generated effect for the requested time or cycles (one without either); returns True if left on"""
+    from resources.lib.animation import parse_color
+    from resources.lib.effects import EffectFrames, make_effect
+
+    color = None
+    if args.effect_color:
+        color = parse_color(args.effect_color.lstrip('#'))
+        if color is None:
+            print(f"Invalid color value: {args.effect_color}", file=sys.stderr)
+            sys.exit(1)
+    frames = EffectFrames(make_effect(args.effect, color, args.speed, args.level), color_pipeline(), frame_rate())
+    scheduler = new_scheduler()
+    if frames.static:
+        # Nothing moves: show it like a color, for the play time if one is given
+        if args.infinity:
+            # Like a static animation with -i: stay in the foreground so stopping turns it off
+            bus.write_frame(frames.render())
+            wait_until_stopped()
+        if not (args.time or args.number):
+            bus.write_frame(frames.render())
+            return True
+        hold = args.time * 1000 if args.time else frames.delay * args.number
+        set_brightness(bus, frames.render(), hold, scheduler)
+        return False
+
+    remaining = None if args.infinity or args.time else frames.cycle_frames() * (args.number or 1)
+    for delay, payloads in frames:
+        set_brightness(bus, payloads, delay, scheduler)
+        if args.time and scheduler.elapsed() >= args.time:
+            break
+        if remaining is not None:
+            remaining -= 1
+            if not remaining:
+                break
+    return False
+
+def play_file(bus, args, offload=True):
+    """Play a file for the -n/-t/-i play time on the PlaybackEngine loop the daemon and the Kodi service use.
+
+    The engine runs in this thread, so Ctrl-C (or SIGTERM with -i) unwinds
+    through it and it turns the LEDs off. An endless animation the kernel LED
+    triggers can play is handed to them, unless offload is False.
+    """
+    from resources.lib.engine import PlaybackEngine
+
+    if not os.path.exists(args.file):
+        print(f"File path {args.file} does not exist", file=sys.stderr)
+        sys.exit(1)
+    engine = PlaybackEngine(bus=bus, instrument=INSTRUMENT, scheduler=new_scheduler(), offload=offload)
+    number = None if args.infinity or args.time else args.number
+    engine.play(os.path.abspath(args.file), color_pipeline(), args.animate, frame_rate(), resample_mode(),
+                number=number, duration=args.time, on_end=lambda finished: engine.stop())
+    if args.infinity:
+        # Only an endless play waits to be stopped; signal is slow to import for a short one
+        import signal
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    engine.run()
+
+def wait_until_stopped():
+    """Sleep until Ctrl-C or SIGTERM while the LEDs need no more writes, then unwind to turn them off"""
+    import signal
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    while True:
+        signal.pause()
 
-    return frames
+def play_handover(bus, frames, args, scheduler):
+    """Play the boot animation until the Kodi service asks for the LEDs, then hand them over in place.
 
-def convert_hex_to_rgb(hex_value):
-    """Convert 3 or 6-character hex value to RGB brightness values"""
-    if len(hex_value) == 3:
-        # Convert 3-character hex to 6-character hex
-        hex_value = ''.join([c*2 for c in hex_value])
-    elif len(hex_value) == 6:
-        # No conversion needed for 6-character hex
-        pass
+    The animation stops at the first frame boundary after the request (or
+    when its -n/-t/-i play time ends), --then is crossfaded in from the
+    frame showing and played once, and the service is told once the last
+    frame is written. Returns True if the service took over the LEDs.
+    """
+    from resources.lib.handover import HandoverListener, crossfade
+
+    try:
+        listener = HandoverListener()
+    except OSError as e:
+        print(f"Cannot listen for the Kodi service, playing without handover: {e}", file=sys.stderr)
+        listener = None
     else:
-        raise ValueError(f"Invalid hex value length: {hex_value}")
-    
+        listener.start()
+
+    def playing():
+        loops = 0
+        while args.infinity or args.time or loops < (args.number or 1):
+            yield from frames.replay() if loops else frames
+            loops += 1
+
     try:
-        red = int(hex_value[0:2], 16)
-        green = int(hex_value[2:4], 16)
-        blue = int(hex_value[4:6], 16)
-    except ValueError as e:
-        raise ValueError(f"Error converting hex value to RGB: {hex_value} - {e}")
-
-    # Scale values to MAX_BRIGHTNESS
-    red = int(red * MAX_BRIGHTNESS / 255)
-    green = int(green * MAX_BRIGHTNESS / 255)
-    blue = int(blue * MAX_BRIGHTNESS / 255)
-    
-    return red, green, blue
-
-def set_brightness(led_file_handles, frame, delay):
-    """Set the brightness for all LEDs and apply delay"""
-    hex_values = frame.split(',')
-    for i in range(min(len(hex_values), len(LED_PATHS) // 3)):
-        hex_value = hex_values[i]
-        if len(hex_value) not in {3, 6}:
-            continue
-        
+        for delay, payloads in playing():
+            set_brightness(bus, payloads, delay, scheduler)
+            if listener is not None and listener.ready.is_set():
+                break
+            if args.time and scheduler.elapsed() >= args.time:
+                break
+        if args.then:
+            # Played once, each block once, like -n 1 without -a
+            then = read_frames_from_file(args.then)
+            for delay, payloads in crossfade(bus.last, then, rate=frame_rate()):
+                set_brightness(bus, payloads, delay, scheduler)
+    finally:
+        taken_over = listener is not None and listener.release()
+    return taken_over
+
+def play_watching(bus, args, scheduler):
+    """Play the file for the requested time or loops, picking up each save at the end of the current loop pass.
+
+    Only changed lines are parsed again and only changed frames rendered;
+    the new version plays from its start on the same LED handles, so the
+    bar never blanks. An endless static animation is written once and
+    waits for the next save.
+    """
+    from resources.lib.animation import EditMemo, static_frame
+    from resources.lib.interpolate import pass_frames
+    from resources.lib.watch import FileWatcher
+
+    memo = EditMemo()
+    frames = read_frames_from_file(args.file, args.animate, memo)
+    watcher = FileWatcher(args.file)
+
+    def reload():
+        """The saved version's frames, or None to keep playing the current ones"""
         try:
-            red, green, blue = convert_hex_to_rgb(hex_value)
-        except ValueError:
-            continue
+            if not os.path.exists(args.file):
+                # Mid-save; the rename that completes it is seen as another change
+                return None
+            reloaded = read_frames_from_file(args.file, args.animate, memo)
+            if not len(reloaded):
+                print(f"No frames to play in {args.file}, keeping the previous version", file=sys.stderr)
+                return None
+            print(f"Reloaded {args.file}", file=sys.stderr)
+            return reloaded
+        finally:
+            # Parsing is not playback: the next frame starts on time, not late
+            scheduler.start()
 
-        led_file_handles[i * 3].write(f"{red}\n")
-        led_file_handles[i * 3 + 1].write(f"{green}\n")
-        led_file_handles[i * 3 + 2].write(f"{blue}\n")
+    def time_left():
+        """Seconds of -t play time left"""
+        return ends - scheduler.clock()
 
-    # Flush the file handles to ensure the values are written
-    for handle in led_file_handles:
-        handle.flush()
+    try:
+        scheduler.start()
+        ends = scheduler.clock() + (args.time or 0)
+        loops = 0
+        restarted = False
+        while args.infinity or args.time or loops < (args.number or 1):
+            if args.time and time_left() <= 0:
+                return
+            static = static_frame(frames.blocks, frames.use_loops)
+            if args.infinity and (static is not None or not len(frames)):
+                # Nothing moves: show it and sleep until the next save
+                if static is not None:
+                    bus.write_frame(static)
+                watcher.wait()
+                frames = reload() or frames
+                continue
+            if args.time and not len(frames):
+                # Nothing to play: sleep until the next save or the end of the play time
+                if watcher.wait(time_left()):
+                    frames = reload() or frames
+                continue
 
-    time.sleep(delay / 1000.0)  # Convert milliseconds to seconds
+            swapped = None
+            for index, (repeat, block) in enumerate(frames.blocks):
+                for n in range(repeat if frames.use_loops else 1):
+                    for delay, payloads in pass_frames(block, n, restarted and not index):
+                        set_brightness(bus, payloads, delay, scheduler)
+                        if args.time and time_left() <= 0:
+                            return
+                    if watcher.changed():
+                        swapped = reload()
+                        if swapped is not None:
+                            break
+                if swapped is not None:
+                    break
+            if swapped is not None:
+                frames = swapped
+                restarted = False
+            else:
+                loops += 1
+                restarted = True
+    finally:
+        watcher.close()
+
+def producer_lines(lines, scheduler, blocked=0.001):
+    """Lines from a producer, resyncing the frame timeline after any read that blocked for over blocked seconds.
+
+    Waiting for a producer slower than the delays it declares is not
+    lateness, so its frames are played instead of dropped.
+    """
+    lines = iter(lines)
+    while True:
+        started = scheduler.clock()
+        line = next(lines, None)
+        if line is None:
+            return
+        if scheduler.clock() - started > blocked:
+            scheduler.resync()
+        yield line
+
+def new_scheduler():
+    """Frame scheduler on the real clock, or on the virtual one with --fast"""
+    from resources.lib.scheduler import FrameScheduler
+
+    return FrameScheduler() if CLOCK is None else FrameScheduler.virtual(CLOCK)
 
-def set_solid_color(led_file_handles, color):
+def set_brightness(bus, payloads, delay, scheduler):
+    """Write a pre-rendered frame to the LEDs unless it is dropped, then wait for its deadline"""
+    if INSTRUMENT is not None:
+        INSTRUMENT.iteration()
+    if scheduler.next_frame(delay):
+        if INSTRUMENT is None:
+            bus.write_frame(payloads)
+        else:
+            INSTRUMENT.write_frame(bus, payloads, scheduler.late)
+    elif INSTRUMENT is not None:
+        INSTRUMENT.drop_frame(scheduler.late)
+    scheduler.wait()
+
+def set_solid_color(bus, color):
     """Set a solid color for all LEDs"""
-    try:
-        red, green, blue = convert_hex_to_rgb(color)
-    except ValueError:
+    from resources.lib.animation import solid_frame
+
+    payloads = solid_frame(color, color_pipeline())
+    if payloads is None:
         print(f"Invalid color value: {color}", file=sys.stderr)
         sys.exit(1)
 
-    for i in range(len(LED_PATHS)):
-        if i % 3 == 0:
-            led_file_handles[i].write(f"{red}\n")
-        elif i % 3 == 1:
-            led_file_handles[i].write(f"{green}\n")
-        elif i % 3 == 2:
-            led_file_handles[i].write(f"{blue}\n")
-
-    # Flush the file handles to ensure the values are written
-    for handle in led_file_handles:
-        handle.flush()
+    bus.write_frame(payloads)
 
 if __name__ == "__main__":
     main()
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import subprocess
 
@@ -16,12 +17,9 @@ ExecStart=/bin/sh -c \" \\
     #echo out > /sys/class/gpio/gpio464/direction; \\
     #echo 1 > /sys/class/gpio/gpio464/value; \\
     \\
-    python /storage/.kodi/addons/service.firecube_lightbar/led.py -a -n 1 -b 100 -f /storage/.kodi/addons/service.firecube_lightbar/resources/animations/ce-anim_start.animation & LED_PID=$!; \\
-    while ! systemctl is-active --quiet kodi.service; do sleep 1; done; \\
-    sleep 2; \\
-    kill $LED_PID; \\
-    \\
-    python /storage/.kodi/addons/service.firecube_lightbar/led.py -n 1 -b 100 -f /storage/.kodi/addons/service.firecube_lightbar/resources/animations/anim_start_error_short.animation; \\
+    # Loops until the Kodi service asks for the LEDs, then crossfades into the \\
+    # closing animation and hands over without blanking once it has played \\
+    python /storage/.kodi/addons/service.firecube_lightbar/led.py -a -i -b 100 --handover -f /storage/.kodi/addons/service.firecube_lightbar/resources/animations/ce-anim_start.animation --then /storage/.kodi/addons/service.firecube_lightbar/resources/animations/anim_start_error_short.animation; \\
     \\
     # Turn off all LEDs, enable this if not using a second stop animation \\
     # for i in $(seq 1 15); do \\
@@ -33,6 +31,31 @@ ExecStart=/bin/sh -c \" \\
 WantedBy=sysinit.target
 """
 
+# SHA-256 of boot units shipped by earlier versions, replaced on setup since
+# they were not customised
+STOCK_SERVICE_HASHES = {
+    # Polled systemctl for Kodi, then killed the boot animation
+    "cebbb7998c1c074ed9f11c0ecba4457c487dae92c7f3f6d2aa16a41fb45cb3b9",
+}
+
+DAEMON_SERVICE_NAME = "lightbar-daemon.service"
+DAEMON_SERVICE_PATH = f"/storage/.config/system.d/{DAEMON_SERVICE_NAME}"
+
+# Long-running owner of the LED handles; led.py talks to it over a Unix socket
+DAEMON_SERVICE_CONTENT = """[Unit]
+Description=Lightbar Daemon
+DefaultDependencies=no
+
+[Service]
+Type=notify
+NotifyAccess=all
+ExecStart=/bin/sh -c \"exec python /storage/.kodi/addons/service.firecube_lightbar/led.py --daemon\"
+Restart=on-failure
+
+[Install]
+WantedBy=sysinit.target
+"""
+
 SHUTDOWN_SCRIPT = "/storage/.config/shutdown.sh"
 SHUTDOWN_LINES = [
     "# Set LED bar red until shutdown is complete",
@@ -42,20 +65,69 @@ SHUTDOWN_LINES = [
 PROFILE_PATH = "/storage/.profile"
 ALIAS_LINE = "alias lightbar='python /storage/.kodi/addons/service.firecube_lightbar/led.py'"
 
-def install_service_once():
-    if os.path.isfile(SERVICE_PATH):
-        return
+# Setup is recorded by an empty stamp file whose name carries a hash of the
+# addon version and everything setup installs, so checking whether it is
+# current is a single stat and any change to the units or lines reruns it
+STAMP_DIR = "/storage/.config"
+STAMP_PREFIX = ".lightbar-setup-"
+
+def setup_key(version):
+    content = "\0".join([version, SERVICE_CONTENT, DAEMON_SERVICE_CONTENT, ALIAS_LINE] + SHUTDOWN_LINES)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+def stamp_path(version):
+    return os.path.join(STAMP_DIR, STAMP_PREFIX + setup_key(version))
+
+def setup_current(version):
+    return os.path.exists(stamp_path(version))
 
+def write_stamp(version):
+    """Record setup as done for this version, dropping stamps of earlier ones"""
+    path = stamp_path(version)
     try:
-        os.makedirs(os.path.dirname(SERVICE_PATH), exist_ok=True)
-        with open(SERVICE_PATH, 'w') as f:
-            f.write(SERVICE_CONTENT)
+        for name in os.listdir(STAMP_DIR):
+            if name.startswith(STAMP_PREFIX) and os.path.join(STAMP_DIR, name) != path:
+                os.unlink(os.path.join(STAMP_DIR, name))
+        open(path, 'w').close()
+    except OSError as e:
+        print(f"Failed to write setup stamp {path}: {e}")
+
+def install_unit(path, name, content, stock_hashes=()):
+    """Write, reload and enable a systemd unit unless it exists (it may have been customised).
+
+    An existing unit is replaced if it is one of the stock versions in
+    stock_hashes, and enabled again if it already is this version, since an
+    earlier attempt may have stopped part way. Returns False if the unit
+    could not be checked or installed.
+    """
+    if os.path.isfile(path):
+        try:
+            with open(path, 'rb') as f:
+                installed = hashlib.sha256(f.read()).hexdigest()
+        except OSError as e:
+            print(f"Failed to read {path}: {e}")
+            return False
+        if installed not in stock_hashes and installed != hashlib.sha256(content.encode()).hexdigest():
+            return True
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
 
         subprocess.run(["systemctl", "daemon-reload"], check=True)
-        subprocess.run(["systemctl", "enable", SERVICE_NAME], check=True)
+        subprocess.run(["systemctl", "enable", name], check=True)
 
     except Exception as e:
-        print(f"Failed to install {SERVICE_NAME}: {e}")
+        print(f"Failed to install {name}: {e}")
+        return False
+    return True
+
+def install_service_once():
+    return install_unit(SERVICE_PATH, SERVICE_NAME, SERVICE_CONTENT, STOCK_SERVICE_HASHES)
+
+def install_daemon_once():
+    return install_unit(DAEMON_SERVICE_PATH, DAEMON_SERVICE_NAME, DAEMON_SERVICE_CONTENT)
 
 def ensure_shutdown_script():
     try:
@@ -64,7 +136,7 @@ def ensure_shutdown_script():
                 contents = f.read()
 
             if all(line in contents for line in SHUTDOWN_LINES):
-                return  # All lines already present
+                return True  # All lines already present
 
             with open(SHUTDOWN_SCRIPT, 'a') as f:
                 f.write("\n" + "\n".join(SHUTDOWN_LINES) + "\n")
@@ -77,10 +149,12 @@ def ensure_shutdown_script():
 
     except Exception as e:
         print(f"Failed to update {SHUTDOWN_SCRIPT}: {e}")
+        return False
+    return True
 
 def ensure_lightbar_alias():
     try:
-        line = "alias lightbar='python /storage/.kodi/addons/service.firecube_lightbar/led.py'"
+        line = ALIAS_LINE
         found = False
 
         if os.path.exists(PROFILE_PATH):
@@ -99,8 +173,27 @@ def ensure_lightbar_alias():
 
     except Exception as e:
         print(f"Failed to ensure lightbar alias: {e}")
+        return False
+    return True
 
 def run_setup():
-    install_service_once()
-    ensure_shutdown_script()
-    ensure_lightbar_alias()
+    """Run every setup step, even after one fails; returns True if all of them succeeded"""
+    results = [
+        install_daemon_once(),
+        install_service_once(),
+        ensure_shutdown_script(),
+        ensure_lightbar_alias(),
+    ]
+    return all(results)
+
+def run_setup_once(version):
+    """Run setup unless it already ran for this addon version and content; returns True if it ran.
+
+    Setup is only recorded as done if every step succeeded, so a failure
+    (systemd not ready yet, a read-only file) is retried on the next start.
+    """
+    if setup_current(version):
+        return False
+    if run_setup():
+        write_stamp(version)
+    return True
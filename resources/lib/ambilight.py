@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+import math
+import threading
+import time
+
+from resources.lib.animation import LED_POSITIONS
+
+# Captured frames are tiny: a strip of columns per LED position is all the
+# bar can show, and a smaller capture is cheaper for Kodi to read back
+CAPTURE_WIDTH = LED_POSITIONS * 8
+MAX_CAPTURE_HEIGHT = 32
+
+# Milliseconds getImage waits for the renderer before the frame counts as missed
+CAPTURE_TIMEOUT_MS = 200
+
+DEFAULT_AMBILIGHT_RATE = 20
+MAX_AMBILIGHT_RATE = 30
+DEFAULT_SMOOTHING_MS = 300
+
+# Share of one core the worker may use; above it the rate is lowered
+MAX_BUSY_FRACTION = 0.05
+
+# Longest pause between captures when frames keep being missed (s)
+MAX_BACKOFF = 2.0
+
+# Byte offsets of red, green and blue in a pixel, by RenderCapture image format
+CHANNEL_OFFSETS = {"BGRA": (2, 1, 0), "RGBA": (0, 1, 2)}
+
+
+def capture_size(aspect_ratio, width=CAPTURE_WIDTH):
+    """Capture width and height for a video aspect ratio (width / height)"""
+    if not aspect_ratio or aspect_ratio <= 0:
+        aspect_ratio = 16 / 9
+    return width, min(max(round(width / aspect_ratio), 1), MAX_CAPTURE_HEIGHT)
+
+
+def reduce_zones(image, width, height, image_format="BGRA", zones=LED_POSITIONS):
+    """Average color of each vertical strip of a 4-byte-per-pixel image, as zones * 3 floats.
+
+    Each color plane and then each column are taken out with extended
+    slices, so Python only touches one sum per column and channel.
+    """
+    offsets = CHANNEL_OFFSETS.get(image_format, CHANNEL_OFFSETS["BGRA"])
+    pixels = width * height
+    columns = [[sum(plane[x::width]) for x in range(width)]
+               for plane in (image[offset:pixels * 4:4] for offset in offsets)]
+    means = []
+    for zone in range(zones):
+        start, end = zone * width // zones, (zone + 1) * width // zones
+        count = max(end - start, 1) * height
+        for channel in columns:
+            means.append(sum(channel[start:end]) / count)
+    return means
+
+
+class Smoother:
+    """Exponential smoothing with a time constant, independent of how often it is updated"""
+
+    def __init__(self, time_constant_ms=DEFAULT_SMOOTHING_MS):
+        self.time_constant = time_constant_ms / 1000.0
+        self.state = None
+
+    def update(self, values, elapsed):
+        if self.state is None or self.time_constant <= 0:
+            self.state = list(values)
+            return self.state
+        alpha = 1.0 - math.exp(-elapsed / self.time_constant)
+        state = self.state
+        for i, value in enumerate(values):
+            state[i] += alpha * (value - state[i])
+        return state
+
+
+class AmbilightSource(threading.Thread):
+    """Captures the video, reduces it to the bar's positions and hands smoothed colors to a sink.
+
+    capture is an object with the xbmc.RenderCapture interface. sink is
+    called from this thread with LED_POSITIONS * 3 bytes of RGB. The rate
+    is capped at rate per second and lowered whenever capture and
+    reduction take more than MAX_BUSY_FRACTION of a core, and captures
+    back off while the renderer delivers no frames (e.g. paused or menus).
+    """
+
+    def __init__(self, capture, sink, rate=DEFAULT_AMBILIGHT_RATE, smoothing_ms=DEFAULT_SMOOTHING_MS,
+                 clock=time.monotonic):
+        super().__init__(daemon=True)
+        self.capture = capture
+        self.sink = sink
+        self.rate = min(max(int(rate or DEFAULT_AMBILIGHT_RATE), 1), MAX_AMBILIGHT_RATE)
+        self.smoother = Smoother(smoothing_ms)
+        self.clock = clock
+        self.stop_event = threading.Event()
+        self.frames = 0
+        self.missed = 0
+        self.interval = 1.0 / self.rate
+
+    def run(self):
+        width, height = capture_size(self.capture.getAspectRatio())
+        image_format = self.capture.getImageFormat()
+        self.capture.capture(width, height)
+        pixels = width * height * 4
+        min_interval = 1.0 / self.rate
+        last = self.clock()
+        while not self.stop_event.is_set():
+            started = self.clock()
+            cpu = time.thread_time()
+            image = self.capture.getImage(CAPTURE_TIMEOUT_MS)
+            if image is None or len(image) < pixels:
+                # Nothing rendered: wait longer each time, up to MAX_BACKOFF
+                self.missed += 1
+                self.interval = min(self.interval * 2, MAX_BACKOFF)
+            else:
+                now = self.clock()
+                colors = self.smoother.update(reduce_zones(image, width, height, image_format), now - last)
+                last = now
+                self.sink(bytes(min(round(value), 255) for value in colors))
+                self.frames += 1
+                # Never spend more than MAX_BUSY_FRACTION of a core on this
+                busy = time.thread_time() - cpu
+                self.interval = max(min_interval, busy / MAX_BUSY_FRACTION)
+            self.stop_event.wait(max(self.interval - (self.clock() - started), 0))
+
+    def stop(self):
+        self.stop_event.set()
+
+    def stats(self):
+        return {"frames": self.frames, "missed": self.missed, "interval_ms": self.interval * 1000.0}
+
+
+def synthetic_image(colors, width=CAPTURE_WIDTH, height=18, image_format="BGRA"):
+    """An image whose vertical strips have the given RGB colors, one per strip"""
+    red, green, blue = CHANNEL_OFFSETS[image_format]
+    row = bytearray(width * 4)
+    zones = len(colors)
+    for x in range(width):
+        color = colors[x * zones // width]
+        row[x * 4 + red], row[x * 4 + green], row[x * 4 + blue] = color
+        row[x * 4 + 3] = 255
+    return bytes(row) * height
+
+
+class SyntheticCapture:
+    """Stand-in for xbmc.RenderCapture serving generated images, for running the ambilight off-device.
+
+    frames is a list of per-strip color lists served in turn (repeating);
+    by default a hue wheel rotates across the strips.
+    """
+
+    def __init__(self, frames=None, aspect_ratio=16 / 9, image_format="BGRA"):
+        self.frames = frames
+        self.aspect_ratio = aspect_ratio
+        self.image_format = image_format
+        self.size = None
+        self.served = 0
+
+    def getAspectRatio(self):
+        return self.aspect_ratio
+
+    def getImageFormat(self):
+        return self.image_format
+
+    def capture(self, width, height):
+        self.size = (width, height)
+
+    def getImage(self, msec=0):
+        if self.size is None:
+            return None
+        if self.frames:
+            colors = self.frames[self.served % len(self.frames)]
+        else:
+            colors = [hue_color((self.served * 3 + zone * 72) % 360) for zone in range(LED_POSITIONS)]
+        self.served += 1
+        return synthetic_image(colors, *self.size, self.image_format)
+
+
+def hue_color(hue):
+    """Fully saturated RGB for a hue in degrees"""
+    sector, fraction = divmod(hue / 60.0, 1)
+    rising, falling = round(255 * fraction), round(255 * (1 - fraction))
+    return ((255, rising, 0), (falling, 255, 0), (0, 255, rising),
+            (0, falling, 255), (rising, 0, 255), (255, 0, falling))[int(sector) % 6]
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import sys
+from collections import OrderedDict
+
+from resources.lib.color import ENCODED
+from resources.lib.interpolate import (DEFAULT_FRAME_RATE, Interpolator, Pass, clamp_rate, interpolate_blocks, parse_blend,
+                                      pass_frames)
+from resources.lib.resample import DEFAULT_RESAMPLE, RESAMPLE_MODES, resample
+
+# Number of physical RGB positions on the Fire TV Cube lightbar
+LED_POSITIONS = 5
+
+# Compiled animations are stored next to the source with this suffix
+COMPILED_SUFFIX = "c"
+
+# Compiled file layout:
+#   header: magic, source mtime (ns), source size, resample mode, block count
+#   block:  repeat count, frame count
+#   frame:  delay (ms), position mask and keyframe flags, 15 raw RGB bytes
+MAGIC = b"LBA3"
+HEADER = struct.Struct("<4sQQBI")
+BLOCK = struct.Struct("<II")
+FRAME = struct.Struct(f"<IB{LED_POSITIONS * 3}s")
+
+# Rendered animations kept per (animation, color pipeline), least recently used first
+RENDER_CACHE_SIZE = 8
+_render_cache = OrderedDict()
+
+# Distinct rendered frames kept while streaming before the set is dropped
+STREAM_RENDER_LIMIT = 1024
+
+
+def parse_color(hex_value):
+    """Convert a 3 or 6-character hex value to unscaled RGB values, or None if invalid"""
+    if len(hex_value) == 3:
+        hex_value = ''.join([c*2 for c in hex_value])
+    elif len(hex_value) != 6:
+        return None
+    try:
+        return int(hex_value[0:2], 16), int(hex_value[2:4], 16), int(hex_value[4:6], 16)
+    except ValueError:
+        return None
+
+
+def parse_frame(frame_line, mode=DEFAULT_RESAMPLE):
+    """Parse a '[~]delay:rgb,rgb,...' line into (delay, mask, rgb bytes), or None if invalid.
+
+    Frames with more colors than there are positions are resampled onto the bar.
+    """
+    flags = 0
+    try:
+        delay_str, frame = frame_line.split(':', 1)
+        if delay_str.startswith('~'):
+            delay_str, flags = parse_blend(delay_str)
+        delay = int(delay_str)
+    except ValueError:
+        return None
+
+    # Positions with a missing or invalid color keep their previous value, so
+    # they are left out of the mask rather than forced to black
+    # A trailing comma does not add a position
+    hex_values = frame.rstrip(',').split(',')
+    if len(hex_values) > LED_POSITIONS:
+        mask, rgb = resample([parse_color(value) for value in hex_values], LED_POSITIONS, mode)
+        return max(delay, 0), mask | flags, rgb
+
+    mask = 0
+    rgb = bytearray(LED_POSITIONS * 3)
+    for i in range(min(len(hex_values), LED_POSITIONS)):
+        color = parse_color(hex_values[i])
+        if color is None:
+            continue
+        mask |= 1 << i
+        rgb[i * 3:i * 3 + 3] = bytes(color)
+
+    return max(delay, 0), mask | flags, bytes(rgb)
+
+
+def iter_source(lines, mode=DEFAULT_RESAMPLE, parse=parse_frame):
+    """Yield (loop count, frames) for loop blocks and (None, frame) for plain frames.
+
+    Frame lines go through parse, which returns None for lines to skip.
+    """
+    lines = iter(lines)
+    for line in lines:
+        line = line.strip()
+        if line.lower().startswith('loop'):
+            try:
+                loop_count = int(line.split()[1])
+            except (IndexError, ValueError):
+                continue
+            loop_frames = []
+            for body_line in lines:
+                body_line = body_line.strip()
+                if not body_line:
+                    break
+                frame = parse(body_line, mode)
+                if frame is not None:
+                    loop_frames.append(frame)
+            yield max(loop_count, 0), loop_frames
+        elif line and not line.startswith('#'):
+            frame = parse(line, mode)
+            if frame is not None:
+                yield None, frame
+
+
+def iter_blocks(lines, mode=DEFAULT_RESAMPLE):
+    """Lazily parse animation source lines into (repeat, frames) blocks.
+
+    A 'loop N' line starts a block that runs up to the next blank line and is
+    repeated N times when loop instructions are honoured. Every other frame is
+    yielded as its own block that plays once. Only one loop body is held in
+    memory at a time, so lines can come from a pipe.
+    """
+    for loop_count, item in iter_source(lines, mode):
+        if loop_count is None:
+            yield 1, [item]
+        else:
+            yield loop_count, item
+
+
+def parse_animation(lines, mode=DEFAULT_RESAMPLE, parse=parse_frame):
+    """Parse animation source lines into a list of (repeat, frames) blocks.
+
+    Runs of frames outside loop blocks are collected into blocks that play once.
+    """
+    blocks = []
+    frames = None
+    for loop_count, item in iter_source(lines, mode, parse):
+        if loop_count is None:
+            if frames is None:
+                frames = []
+                blocks.append((1, frames))
+            frames.append(item)
+        else:
+            frames = None
+            blocks.append((loop_count, item))
+    return blocks
+
+
+def encode_animation(blocks, mtime_ns=0, size=0, mode=DEFAULT_RESAMPLE):
+    """Encode parsed blocks into the compiled binary format"""
+    out = [HEADER.pack(MAGIC, mtime_ns, size, RESAMPLE_MODES.index(mode), len(blocks))]
+    for repeat, frames in blocks:
+        out.append(BLOCK.pack(repeat, len(frames)))
+        for delay, mask, rgb in frames:
+            out.append(FRAME.pack(delay, mask, rgb))
+    return b"".join(out)
+
+
+def decode_animation(data):
+    """Decode a compiled animation into (mtime_ns, size, resample mode, blocks)"""
+    view = memoryview(data)
+    magic, mtime_ns, size, mode, block_count = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a compiled animation")
+
+    blocks = []
+    offset = HEADER.size
+    for _ in range(block_count):
+        repeat, frame_count = BLOCK.unpack_from(view, offset)
+        offset += BLOCK.size
+        end = offset + frame_count * FRAME.size
+        blocks.append((repeat, list(FRAME.iter_unpack(view[offset:end]))))
+        offset = end
+    return mtime_ns, size, RESAMPLE_MODES[mode], blocks
+
+
+def compiled_path(file_path):
+    return file_path + COMPILED_SUFFIX
+
+
+def compile_animation(file_path, mode=DEFAULT_RESAMPLE, memo=None):
+    """Compile an animation file next to its source and return the parsed blocks"""
+    st = os.stat(file_path)
+    with open(file_path, 'r') as f:
+        blocks = parse_animation(f.read().splitlines(), mode, parse_frame if memo is None else memo.parser(mode))
+
+    data = encode_animation(blocks, st.st_mtime_ns, st.st_size, mode)
+    target = compiled_path(file_path)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, target)
+    except OSError:
+        # Read-only location; play from memory this time
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+    return blocks
+
+
+def load_animation(file_path, mode=DEFAULT_RESAMPLE, memo=None):
+    """Load an animation, reusing the compiled file unless the source or resample mode changed.
+
+    A memo that has not seen the file yet has it parsed from source, so
+    later edits can reuse its lines.
+    """
+    if not os.path.exists(file_path):
+        print(f"File path {file_path} does not exist", file=sys.stderr)
+        sys.exit(1)
+
+    st = os.stat(file_path)
+    if memo is None or memo.parsed:
+        try:
+            with open(compiled_path(file_path), 'rb') as f:
+                mtime_ns, size, compiled_mode, blocks = decode_animation(f.read())
+            if mtime_ns == st.st_mtime_ns and size == st.st_size and compiled_mode == mode:
+                return blocks
+        except (OSError, ValueError, IndexError, struct.error):
+            pass
+    return compile_animation(file_path, mode, memo)
+
+
+class EditMemo:
+    """Parsed and rendered frames of the previous version of a file that is being edited.
+
+    Passed to render_animation for each new version, so only the lines that
+    changed are parsed again and only the frames that changed are rendered;
+    unchanged loop blocks come out of the memo.
+    """
+
+    def __init__(self):
+        self.mode = None
+        self.parsed = {}
+        self.pipeline_key = None
+        self.rendered = {}
+
+    def parser(self, mode):
+        """A parse_frame for the new version, reusing the frames of lines the previous one had"""
+        previous = self.parsed if mode == self.mode else {}
+        parsed = self.parsed = {}
+        self.mode = mode
+
+        def parse(line, mode):
+            frame = parsed[line] if line in parsed else previous[line] if line in previous else parse_frame(line, mode)
+            parsed[line] = frame
+            return frame
+        return parse
+
+    def renderer(self, pipeline):
+        """A render_frame for the new version, reusing the payloads of frames the previous one had"""
+        previous = self.rendered if pipeline.key == self.pipeline_key else {}
+        rendered = self.rendered = {}
+        self.pipeline_key = pipeline.key
+
+        def render(mask, rgb):
+            payloads = rendered.get((mask, rgb)) or previous.get((mask, rgb)) or render_frame(mask, rgb, pipeline)
+            rendered[(mask, rgb)] = payloads
+            return payloads
+        return render
+
+
+class FrameSequence:
+    """Re-iterable frame view over blocks that repeats loop blocks lazily instead of copying them.
+
+    Iterating plays the animation from its start; replay() gives the passes
+    after that, whose keyframes blend in from the animation's last frame.
+    """
+
+    def __init__(self, blocks, use_loops=False, restarted=False):
+        self.blocks = blocks
+        self.use_loops = use_loops
+        self.restarted = restarted
+
+    def __iter__(self):
+        for index, (repeat, frames) in enumerate(self.blocks):
+            for n in range(repeat if self.use_loops else 1):
+                yield from pass_frames(frames, n, self.restarted and not index)
+
+    def replay(self):
+        return FrameSequence(self.blocks, self.use_loops, restarted=True)
+
+    def __len__(self):
+        return sum(len(frames) * (repeat if self.use_loops else 1) for repeat, frames in self.blocks)
+
+
+def expand_frames(blocks, use_loops=False):
+    """Frames of an animation in play order, repeating loop blocks only if use_loops is set.
+
+    Memory stays constant regardless of loop counts.
+    """
+    return FrameSequence(blocks, use_loops)
+
+
+def collapse_frames(frames):
+    """Merge runs of identical consecutive rendered frames into one frame with the summed delay"""
+    collapsed = []
+    for delay, payloads in frames:
+        # Rendered frames are shared per distinct source frame, so identity is enough
+        if collapsed and collapsed[-1][1] is payloads:
+            collapsed[-1] = (collapsed[-1][0] + delay, payloads)
+        else:
+            collapsed.append((delay, payloads))
+    return collapsed
+
+
+def static_frame(blocks, use_loops=False):
+    """The payloads of rendered blocks that show one frame throughout, or None if anything changes"""
+    static = None
+    for repeat, frames in blocks:
+        if use_loops and not repeat:
+            continue
+        for _, payloads in frames:
+            if static is None:
+                static = payloads
+            elif payloads is not static:
+                return None
+    return static
+
+
+def render_frame(mask, rgb, pipeline):
+    """Scale a frame through the color pipeline and encode it as one sysfs payload per channel.
+
+    Channels of positions outside the mask are None and left untouched.
+    """
+    scaled = pipeline.apply(rgb)
+    payloads = [ENCODED[value] for value in scaled]
+    full = (1 << LED_POSITIONS) - 1
+    if mask & full != full:
+        for i in range(LED_POSITIONS):
+            if not mask & (1 << i):
+                payloads[i * 3:i * 3 + 3] = (None, None, None)
+    return tuple(payloads)
+
+
+def solid_frame(color, pipeline):
+    """Render a 3 or 6-character hex color for every position, or None if invalid"""
+    rgb = parse_color(color.lstrip('#'))
+    if rgb is None:
+        return None
+    return render_frame((1 << LED_POSITIONS) - 1, bytes(rgb) * LED_POSITIONS, pipeline)
+
+
+def render_animation(file_path, pipeline, rate=DEFAULT_FRAME_RATE, mode=DEFAULT_RESAMPLE, memo=None):
+    """Return blocks of (delay, payloads) frames for an animation through a color pipeline.
+
+    Keyframes are blended at the given output rate and wide frames resampled
+    with the given mode. Each distinct frame is rendered only once, runs of
+    identical frames become one longer frame, and results are cached until
+    the source file changes or clear_render_cache() is called. Pass an
+    EditMemo when the file is being edited to reuse what did not change.
+    """
+    rate = clamp_rate(rate)
+    try:
+        key = (file_path, os.stat(file_path).st_mtime_ns, pipeline.key, rate, mode)
+    except OSError:
+        key = None
+    if key in _render_cache:
+        _render_cache.move_to_end(key)
+        return _render_cache[key]
+
+    rendered = {}
+    render = None if memo is None else memo.renderer(pipeline)
+
+    def render_pass(frames):
+        block_frames = []
+        for delay, mask, rgb in frames:
+            payloads = rendered.get((mask, rgb))
+            if payloads is None:
+                if render is None:
+                    payloads = rendered[(mask, rgb)] = render_frame(mask, rgb, pipeline)
+                else:
+                    payloads = rendered[(mask, rgb)] = render(mask, rgb)
+            block_frames.append((delay, payloads))
+        return collapse_frames(block_frames)
+
+    blocks = []
+    for repeat, frames in interpolate_blocks(load_animation(file_path, mode, memo), rate):
+        if isinstance(frames, Pass):
+            # Keep the passes that blend from a different frame alongside the first
+            rendered_pass = Pass(render_pass(frames))
+            for variant in ('again', 'restart'):
+                if getattr(frames, variant) is not None:
+                    setattr(rendered_pass, variant, render_pass(getattr(frames, variant)))
+            blocks.append((repeat, rendered_pass))
+        else:
+            blocks.append((repeat, render_pass(frames)))
+
+    _render_cache[key] = blocks
+    while len(_render_cache) > RENDER_CACHE_SIZE:
+        _render_cache.popitem(last=False)
+    return blocks
+
+
+def clear_render_cache():
+    _render_cache.clear()
+
+
+def stream_frames(lines, pipeline, use_loops=False, rate=DEFAULT_FRAME_RATE, mode=DEFAULT_RESAMPLE):
+    """Yield rendered (delay, payloads) frames while reading source lines, e.g. from stdin.
+
+    Only the current loop body and a bounded set of rendered frames are kept,
+    so memory stays constant for endless or generated streams.
+    """
+    rendered = {}
+    interpolator = Interpolator(rate)
+
+    def render_pass(frames):
+        block_frames = []
+        for delay, mask, rgb in frames:
+            payloads = rendered.get((mask, rgb))
+            if payloads is None:
+                payloads = rendered[(mask, rgb)] = render_frame(mask, rgb, pipeline)
+            block_frames.append((delay, payloads))
+        return block_frames
+
+    for repeat, frames in iter_blocks(lines, mode):
+        if len(rendered) > STREAM_RENDER_LIMIT:
+            rendered.clear()
+        expanded = interpolator.expand_block(repeat if use_loops else 1, frames)
+        first = render_pass(expanded)
+        # Later loop passes blend from the end of the one before
+        later = first if expanded.again is None else render_pass(expanded.again)
+        for n in range(repeat if use_loops else 1):
+            yield from later if n else first
+
+
+def compile_all(paths):
+    """Compile every .animation file found in the given files or directories"""
+    count = 0
+    for path in paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.animation')]
+        else:
+            files = [path]
+        for file_path in files:
+            load_animation(file_path)
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'animations')
+    compiled = compile_all(sys.argv[1:] or [default_dir])
+    print(f"Compiled {compiled} animation(s)")
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import sys
+
+from resources.lib.animation import LED_POSITIONS, iter_source, parse_frame
+from resources.lib.interpolate import BLEND
+
+# Bundled animations shipped with the addon
+ANIMATIONS_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'animations'))
+
+# The index is kept next to the animations it describes
+INDEX_NAME = ".index.json"
+INDEX_VERSION = 3
+
+ANIMATION_SUFFIX = ".animation"
+
+# Below this many files to describe, a process pool costs more than it saves
+POOL_MIN_FILES = 16
+
+
+def describe_source(data):
+    """Metadata for animation source bytes: frame counts, durations, loops, keyframes and positions used"""
+    frames = duration = 0
+    looped_frames = looped_duration = 0
+    loops = keyframes = 0
+    positions = 0
+    counts = {"invalid": 0, "sources": 0}
+
+    def parse(line, mode):
+        # Parsed as the player parses it, counting what it skips and how many colors a line gives
+        frame = parse_frame(line, mode)
+        if frame is None:
+            if not line.startswith('#'):
+                counts["invalid"] += 1
+        else:
+            counts["sources"] = max(counts["sources"], len(line.split(':', 1)[1].rstrip(',').split(',')))
+        return frame
+
+    for repeat, item in iter_source(data.decode('utf-8', 'replace').splitlines(), parse=parse):
+        if repeat is None:
+            block, times = (item,), 1
+        else:
+            block, times = item, repeat
+            loops += 1
+        for delay, mask, _ in block:
+            positions |= mask
+            keyframes += bool(mask & BLEND)
+            frames += 1
+            duration += delay
+            looped_frames += times
+            looped_duration += delay * times
+    invalid_lines, sources = counts["invalid"], counts["sources"]
+
+    return {
+        "frames": frames,
+        "duration_ms": duration,
+        "looped_frames": looped_frames,
+        "looped_duration_ms": looped_duration,
+        "loops": loops,
+        "keyframes": keyframes,
+        "positions": bin(positions & ((1 << LED_POSITIONS) - 1)).count("1"),
+        "source_positions": sources,
+        "invalid_lines": invalid_lines,
+        "valid": frames > 0 and invalid_lines == 0,
+    }
+
+
+def describe_animation(file_path):
+    """Read one animation file and return its metadata, including size, mtime and content hash"""
+    st = os.stat(file_path)
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    info = describe_source(data)
+    info.update(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=hashlib.sha256(data).hexdigest())
+    return info
+
+
+def animation_name(file_path):
+    name = os.path.basename(file_path)
+    return name[:-len(ANIMATION_SUFFIX)] if name.endswith(ANIMATION_SUFFIX) else name
+
+
+def scan_directory(directory):
+    """Map animation names to (path, mtime_ns, size) from one directory listing, without reading files"""
+    found = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.endswith(ANIMATION_SUFFIX) and entry.is_file():
+                st = entry.stat()
+                found[animation_name(entry.name)] = (entry.path, st.st_mtime_ns, st.st_size)
+    return found
+
+
+def describe_all(paths, workers=None):
+    """Describe many files, in a process pool unless workers is 1 or there are only a few"""
+    if workers == 1 or len(paths) < POOL_MIN_FILES:
+        return [describe_animation(path) for path in paths]
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(describe_animation, paths, chunksize=8))
+
+
+def index_path(directory):
+    return os.path.join(directory, INDEX_NAME)
+
+
+def read_index(directory):
+    try:
+        with open(index_path(directory), 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(index, dict) or index.get("version") != INDEX_VERSION:
+        return {}
+    return index.get("animations", {})
+
+
+def write_index(directory, animations):
+    """Write the index atomically; a read-only directory just keeps it in memory"""
+    target = index_path(directory)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'w') as f:
+            json.dump({"version": INDEX_VERSION, "animations": animations}, f, indent=1, sort_keys=True)
+        os.replace(tmp, target)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+class Catalog:
+    """Metadata for every animation in a directory, looked up by name or path without reading files"""
+
+    def __init__(self, directory, animations):
+        self.directory = directory
+        self.animations = animations
+
+    def __len__(self):
+        return len(self.animations)
+
+    def __iter__(self):
+        return iter(sorted(self.animations))
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def path(self, name):
+        return os.path.join(self.directory, animation_name(name) + ANIMATION_SUFFIX)
+
+    def get(self, name):
+        """Metadata for an animation name, file name or path, or None if it is not in the catalog"""
+        return self.animations.get(animation_name(name))
+
+
+def load_catalog(directory=ANIMATIONS_DIR, workers=None):
+    """Load the index for a directory, describing only files added or changed since it was written.
+
+    Files are matched on mtime and size, so an up-to-date catalog costs one
+    directory listing. Pass workers=1 where forking is unsafe.
+    """
+    cached = read_index(directory)
+    found = scan_directory(directory)
+
+    animations = {}
+    stale = []
+    for name, (path, mtime_ns, size) in found.items():
+        info = cached.get(name)
+        if info is not None and info.get("mtime_ns") == mtime_ns and info.get("size") == size:
+            animations[name] = info
+        else:
+            stale.append(name)
+
+    if stale:
+        for name, info in zip(stale, describe_all([found[name][0] for name in stale], workers)):
+            animations[name] = info
+    if stale or len(animations) != len(cached):
+        write_index(directory, animations)
+    return Catalog(directory, animations)
+
+
+def format_duration(ms):
+    return f"{ms / 1000.0:.2f}s"
+
+
+def print_list(catalog, out=sys.stdout):
+    """One line per animation: name, frames, duration, loops, positions and validity"""
+    width = max((len(name) for name in catalog), default=4)
+    print(f"{'name':{width}}  frames  duration  loops  leds  ok", file=out)
+    for name in catalog:
+        info = catalog.get(name)
+        print(f"{name:{width}}  {info['frames']:6}  {format_duration(info['duration_ms']):>8}  "
+              f"{info['loops']:5}  {info['positions']:4}  {'yes' if info['valid'] else 'no'}", file=out)
+
+
+def print_info(catalog, name, out=sys.stdout):
+    """All metadata for one animation; returns False if it is not in the catalog"""
+    info = catalog.get(name)
+    if info is None:
+        return False
+    print(f"name: {animation_name(name)}", file=out)
+    print(f"path: {catalog.path(name)}", file=out)
+    for key in sorted(info):
+        print(f"{key}: {info[key]}", file=out)
+    return True
+
+
+if __name__ == "__main__":
+    catalog = load_catalog(sys.argv[1] if len(sys.argv) > 1 else ANIMATIONS_DIR)
+    print(f"Indexed {len(catalog)} animation(s)")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+# Kept import-light: led.py uses this at boot and shutdown, where every
+# millisecond of interpreter startup delays the first LED write. socket.py
+# pulls in enum and selectors and json pulls in re, so the client talks to
+# the daemon through the C socket module and encodes commands itself.
+import _socket
+import os
+
+# Unix socket the daemon listens on
+DEFAULT_SOCKET = "/run/lightbar.sock"
+SOCKET_ENV = "LIGHTBAR_SOCKET"
+
+# The daemon's reply to a successful command
+OK_REPLY = b'{"ok": true}'
+
+
+def socket_path():
+    return os.environ.get(SOCKET_ENV) or DEFAULT_SOCKET
+
+
+def encode_value(value):
+    if value is None:
+        return "null"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, int):
+        return str(value)
+    escaped = []
+    for c in str(value):
+        if c in '"\\':
+            escaped.append('\\' + c)
+        elif c < ' ':
+            escaped.append(f"\\u{ord(c):04x}")
+        else:
+            escaped.append(c)
+    return '"' + ''.join(escaped) + '"'
+
+
+def encode_command(command):
+    """Encode a flat command dict as one JSON line"""
+    items = ', '.join(f"{encode_value(key)}: {encode_value(value)}" for key, value in command.items())
+    return ('{' + items + '}\n').encode()
+
+
+def send_command(command, path=None):
+    """Send one command to a running daemon and return its reply, or None if no daemon is listening.
+
+    Commands are single JSON objects terminated by a newline, answered by one
+    JSON line. A 'play' command with 'wait' set is only answered once playback
+    ends; closing the connection before that stops the animation.
+    """
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+    conn = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        try:
+            conn.connect(path)
+        except OSError:
+            return None
+        conn.sendall(encode_command(command))
+        reply = b""
+        while not reply.endswith(b"\n"):
+            chunk = conn.recv(4096)
+            if not chunk:
+                break
+            reply += chunk
+    finally:
+        conn.close()
+
+    reply = reply.strip()
+    if reply == OK_REPLY:
+        return {"ok": True}
+    if not reply:
+        return {"ok": False, "error": "no reply"}
+    import json
+    return json.loads(reply)
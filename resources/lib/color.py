@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+from functools import lru_cache
+
+# No gamma correction and equal channel gains reproduce plain linear scaling
+DEFAULT_GAMMA = 1.0
+DEFAULT_BALANCE = (1.0, 1.0, 1.0)
+
+# Pre-encoded sysfs payload for every channel value; shared so unchanged
+# channels compare by identity in LedBus
+ENCODED = tuple(f"{value}\n".encode() for value in range(256))
+
+
+def percent_to_level(percent):
+    """Map the Kodi brightness setting (a percentage) to a 0-255 level"""
+    return int((percent / 100.0) * 255)
+
+
+@lru_cache(maxsize=64)
+def build_table(level, gamma=DEFAULT_GAMMA, gain=1.0):
+    """256-entry lookup table mapping a source value to its scaled, corrected output value"""
+    level = min(max(level, 0), 255) * min(max(gain, 0.0), 1.0)
+    if gamma == 1.0:
+        return bytes(int(value * level / 255) for value in range(256))
+    return bytes(int(((value / 255.0) ** gamma) * level) for value in range(256))
+
+
+class ColorPipeline:
+    """Brightness scaling, gamma and per-channel white balance applied through lookup tables.
+
+    Both players and the solid-color path go through this, so a color looks the
+    same whether it comes from the boot animation or the Kodi service.
+    """
+
+    def __init__(self, level, gamma=DEFAULT_GAMMA, balance=DEFAULT_BALANCE):
+        self.level = level
+        self.gamma = gamma
+        self.balance = tuple(balance)
+        self.key = (level, gamma, self.balance)
+        self.tables = tuple(build_table(level, gamma, gain) for gain in self.balance)
+        self.uniform = self.tables[0] == self.tables[1] == self.tables[2]
+
+    def apply(self, rgb):
+        """Map a whole frame of interleaved RGB bytes through the tables at once"""
+        if self.uniform:
+            return rgb.translate(self.tables[0])
+        red, green, blue = self.tables
+        out = bytearray(rgb)
+        out[0::3] = rgb[0::3].translate(red)
+        out[1::3] = rgb[1::3].translate(green)
+        out[2::3] = rgb[2::3].translate(blue)
+        return bytes(out)
+
+    def __repr__(self):
+        return f"ColorPipeline(level={self.level}, gamma={self.gamma}, balance={self.balance})"
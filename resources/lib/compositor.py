@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+from functools import lru_cache
+
+from resources.lib.animation import LED_POSITIONS
+from resources.lib.color import ENCODED
+from resources.lib.interpolate import DEFAULT_FRAME_RATE, clamp_rate
+
+# Layers are stacked by priority: whatever the engine plays is the base,
+# transient overlays (volume, notifications) go above it and alerts above those
+BASE = 0
+OVERLAY = 10
+ALERT = 20
+
+BLEND_MODES = ("normal", "add", "multiply", "max")
+
+# Sysfs payload back to the value it encodes
+DECODED = {payload: value for value, payload in enumerate(ENCODED)}
+
+
+@lru_cache(maxsize=None)
+def scale_table(alpha):
+    """value * alpha / 255 for every byte value, so blending is lookups instead of arithmetic"""
+    return bytes(value * alpha // 255 for value in range(256))
+
+
+class ColorSource:
+    """A solid color on every position, for use as a layer"""
+
+    period = 0
+
+    def __init__(self, rgb):
+        self.rgb = bytes(rgb) * LED_POSITIONS
+
+    def render(self, time_ms, rgb):
+        rgb[:] = self.rgb
+
+
+class Layer:
+    """A source (anything with render(time_ms, rgb) and a period, like an effect) placed in the stack.
+
+    opacity runs from 0 to 1; duration (ms) removes the layer by itself.
+    """
+
+    def __init__(self, source, pipeline, priority=OVERLAY, opacity=1.0, blend="normal", duration=None):
+        if blend not in BLEND_MODES:
+            raise ValueError(f"Unknown blend mode: {blend}")
+        self.source = source
+        self.pipeline = pipeline
+        self.priority = priority
+        self.alpha = min(max(round(opacity * 255), 0), 255)
+        self.blend = blend
+        self.duration = duration
+        self.started = None
+        self.rgb = bytearray(LED_POSITIONS * 3)
+        self.rendered = False
+
+    @property
+    def animating(self):
+        return bool(self.source.period)
+
+    def render(self, now_ms):
+        """The layer's RGB at a time, through its color pipeline"""
+        if self.animating or not self.rendered:
+            self.source.render(now_ms - self.started, self.rgb)
+            tables = self.pipeline.tables
+            rgb = self.rgb
+            for i in range(len(rgb)):
+                rgb[i] = tables[i % 3][rgb[i]]
+            self.rendered = True
+        return self.rgb
+
+
+class Compositor:
+    """Stack of named layers over the base frame, composited into one preallocated buffer.
+
+    The base is whatever the engine plays, as sysfs payloads; layers are
+    blended over it in priority order. Output goes into one reused buffer
+    and payload list, so a steady-state tick allocates nothing that lives
+    past it.
+    """
+
+    def __init__(self, rate=DEFAULT_FRAME_RATE):
+        self.layers = {}
+        self.stack = []
+        self.tick_ms = 1000 // clamp_rate(rate)
+        self.base = bytearray(LED_POSITIONS * 3)
+        self.out = bytearray(LED_POSITIONS * 3)
+        self.payloads = [None] * (LED_POSITIONS * 3)
+
+    @property
+    def active(self):
+        return bool(self.stack)
+
+    def add(self, name, layer, now_ms):
+        """Add a layer, replacing any with the same name"""
+        layer.started = now_ms
+        self.layers[name] = layer
+        self.restack()
+
+    def remove(self, name):
+        if self.layers.pop(name, None) is not None:
+            self.restack()
+
+    def restack(self):
+        self.stack = sorted(self.layers.values(), key=lambda layer: layer.priority)
+
+    def expire(self, now_ms):
+        """Drop layers whose duration has passed; returns True if any were dropped"""
+        expired = [name for name, layer in self.layers.items()
+                   if layer.duration is not None and now_ms - layer.started >= layer.duration]
+        for name in expired:
+            del self.layers[name]
+        if expired:
+            self.restack()
+        return bool(expired)
+
+    def set_base(self, payloads):
+        """Take the engine's frame as the bottom of the stack; None leaves a channel as it was"""
+        base = self.base
+        for i, payload in enumerate(payloads):
+            if payload is not None:
+                base[i] = DECODED[payload]
+
+    def next_tick(self, now_ms):
+        """Milliseconds until the output next changes without a new base frame, or None if it never does"""
+        wait = None
+        for layer in self.stack:
+            if layer.animating:
+                wait = self.tick_ms
+            if layer.duration is not None:
+                left = max(layer.started + layer.duration - now_ms, 0)
+                wait = left if wait is None else min(wait, left)
+        return wait
+
+    def composite(self, now_ms):
+        """Payloads of the stack at a time"""
+        out = self.out
+        out[:] = self.base
+        for layer in self.stack:
+            rgb = layer.render(now_ms)
+            alpha = layer.alpha
+            keep, take = scale_table(255 - alpha), scale_table(alpha)
+            blend = layer.blend
+            if blend == "normal":
+                for i in range(len(out)):
+                    out[i] = keep[out[i]] + take[rgb[i]]
+            elif blend == "add":
+                for i in range(len(out)):
+                    out[i] = min(out[i] + take[rgb[i]], 255)
+            elif blend == "max":
+                for i in range(len(out)):
+                    out[i] = max(out[i], take[rgb[i]])
+            else:
+                for i in range(len(out)):
+                    out[i] = keep[out[i]] + take[scale_table(rgb[i])[out[i]]]
+        payloads = self.payloads
+        for i, value in enumerate(out):
+            payloads[i] = ENCODED[value]
+        return payloads
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+
+from resources.lib.animation import parse_color
+from resources.lib.client import socket_path
+from resources.lib.color import DEFAULT_GAMMA, ColorPipeline
+from resources.lib.engine import PlaybackEngine
+from resources.lib.instrument import FrameInstrument, summary, write_status
+from resources.lib.interpolate import clamp_rate
+from resources.lib.resample import DEFAULT_RESAMPLE, RESAMPLE_MODES
+from resources.lib.ledbus import LedBus
+
+
+def notify_ready():
+    """Tell systemd the socket is ready when running as a Type=notify unit"""
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return
+    if address.startswith("@"):
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b"READY=1", address)
+    except OSError:
+        pass
+
+
+class LightbarDaemon:
+    """Owns the LED handles and serves play, stop, color, brightness, state and stats commands.
+
+    Everything is played by one PlaybackEngine, as in the Kodi service.
+    """
+
+    def __init__(self, bus, path=None, instrument=None):
+        self.instrument = instrument
+        self.path = path or socket_path()
+        self.engine = PlaybackEngine(bus=bus, log=log_message, instrument=instrument, shared=True)
+        # Serializes commands; state_lock guards the state and the play showing,
+        # which the engine ends from its own thread
+        self.lock = threading.Lock()
+        self.state_lock = threading.RLock()
+        # on_end callback of the play showing, and how it was requested
+        self.playing = None
+        self.play_args = None
+        self.state = {"mode": "off"}
+
+    def serve_forever(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        self.engine.start()
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            server.bind(self.path)
+            os.chmod(self.path, 0o666)
+            server.listen(8)
+            notify_ready()
+            while True:
+                conn, _ = server.accept()
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+        finally:
+            server.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            with self.lock:
+                # Like a solid color set by led.py, a color outlives the daemon
+                # (e.g. the red shutdown bar); a running animation is turned off
+                self.engine.stop()
+                self.engine.join()
+
+    def handle(self, conn):
+        try:
+            line = conn.makefile('rb').readline()
+            try:
+                command = json.loads(line)
+                handler = getattr(self, f"cmd_{command['cmd']}")
+            except (ValueError, KeyError, TypeError, AttributeError):
+                self.reply(conn, {"ok": False, "error": "invalid command"})
+                return
+            try:
+                reply = handler(command, conn)
+            except KeyError as e:
+                reply = {"ok": False, "error": f"Missing field: {e.args[0]}"}
+            except (ValueError, TypeError, OSError) as e:
+                reply = {"ok": False, "error": str(e)}
+            if reply is not None:
+                self.reply(conn, reply)
+        finally:
+            conn.close()
+
+    def reply(self, conn, reply):
+        try:
+            conn.sendall(json.dumps(reply).encode() + b"\n")
+        except OSError:
+            pass
+
+    def turn_off(self):
+        """Turn the LEDs off and forget the play showing; called with state_lock held"""
+        self.playing = None
+        self.play_args = None
+        self.state = {"mode": "off"}
+        self.engine.off()
+
+    def cmd_play(self, command, conn):
+        file_path = command['file']
+        brightness = int(command.get('brightness', 128))
+        gamma = float(command.get('gamma') or DEFAULT_GAMMA)
+        animate = bool(command.get('animate', False))
+        rate = clamp_rate(command.get('rate'))
+        resample = command.get('resample') or DEFAULT_RESAMPLE
+        number = command.get('number')
+        duration = command.get('time')
+        wait = command.get('wait')
+        if not os.path.exists(file_path):
+            return {"ok": False, "error": f"File path {file_path} does not exist"}
+        if resample not in RESAMPLE_MODES:
+            return {"ok": False, "error": f"Unknown resample mode: {resample}"}
+        if not self.engine.is_alive():
+            return {"ok": False, "error": "LED playback stopped"}
+
+        if not (command.get('infinity') or number or duration):
+            # Nothing to play, as with led.py
+            with self.lock, self.state_lock:
+                self.turn_off()
+            return {"ok": True, "finished": True} if wait else {"ok": True}
+
+        ended = threading.Event()
+
+        def on_end(finished):
+            with self.state_lock:
+                if self.playing is on_end:
+                    # Ran to completion or could not play; turn off like led.py does
+                    self.turn_off()
+            if wait:
+                self.reply(conn, {"ok": True, "finished": finished})
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            ended.set()
+
+        with self.lock, self.state_lock:
+            self.playing = on_end
+            self.play_args = dict(file_path=file_path, use_loops=animate, rate=rate, resample=resample,
+                                  number=number, duration=duration, on_end=on_end)
+            self.state = {"mode": "animation", "file": file_path, "brightness": brightness,
+                          "gamma": gamma, "animate": animate, "rate": rate,
+                          "resample": resample}
+            self.engine.play(pipeline=ColorPipeline(brightness, gamma), **self.play_args)
+
+        if not wait:
+            return {"ok": True}
+
+        # Block until playback ends (which shuts the socket down) or the client disconnects
+        try:
+            conn.recv(1)
+        except OSError:
+            pass
+        with self.state_lock:
+            if self.playing is on_end:
+                self.turn_off()
+        ended.wait()
+        return None
+
+    def cmd_stop(self, command, conn):
+        with self.lock, self.state_lock:
+            self.turn_off()
+        return {"ok": True}
+
+    def cmd_color(self, command, conn):
+        color = command.get('color')
+        if color is None:
+            return {"ok": False, "error": "Missing color"}
+        brightness = int(command.get('brightness', 128))
+        gamma = float(command.get('gamma') or DEFAULT_GAMMA)
+        rgb = parse_color(color.lstrip('#')) if isinstance(color, str) else None
+        if rgb is None:
+            return {"ok": False, "error": f"Invalid color value: {color}"}
+        with self.lock, self.state_lock:
+            self.playing = None
+            self.play_args = None
+            self.state = {"mode": "color", "color": color, "brightness": brightness, "gamma": gamma}
+            self.engine.show_color(rgb, ColorPipeline(brightness, gamma))
+        return {"ok": True}
+
+    def cmd_brightness(self, command, conn):
+        brightness = int(command['brightness'])
+        # The play may finish and turn off meanwhile, so both are read and changed under its lock
+        with self.lock, self.state_lock:
+            state = self.state
+            pipeline = ColorPipeline(brightness, state.get("gamma") or DEFAULT_GAMMA)
+            if state["mode"] == "color":
+                self.engine.show_color(parse_color(state["color"].lstrip('#')), pipeline)
+            elif state["mode"] == "animation":
+                # The same play through a new pipeline, which the engine applies in place
+                self.engine.play(pipeline=pipeline, **self.play_args)
+            state["brightness"] = brightness
+        return {"ok": True}
+
+    def cmd_state(self, command, conn):
+        with self.state_lock:
+            state = dict(self.state)
+        state["writes"] = self.engine.bus.stats()
+        if state["mode"] == "animation":
+            state["frames"] = self.engine.scheduler.stats()
+        return {"ok": True, "state": state}
+
+    def cmd_stats(self, command, conn):
+        if self.instrument is None:
+            return {"ok": False, "error": "Instrumentation is off; start the daemon with --stats-interval"}
+        return {"ok": True, "stats": self.instrument.snapshot()}
+
+
+def log_message(message):
+    print(f"lightbar: {message}", file=sys.stderr, flush=True)
+
+
+def report_stats(snapshot):
+    log_message(summary(snapshot))
+    write_status(snapshot)
+
+
+def run_daemon(path=None, stats_interval=0):
+    """Run the lightbar daemon in the foreground until terminated"""
+    try:
+        bus = LedBus()
+    except IOError as e:
+        print(f"Error opening {e.filename}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # Let SIGTERM unwind through serve_forever so the engine turns the LEDs off
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    instrument = FrameInstrument(stats_interval, report_stats) if stats_interval else None
+    LightbarDaemon(bus, path, instrument).serve_forever()
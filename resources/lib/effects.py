@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+import math
+
+from resources.lib.animation import LED_POSITIONS
+from resources.lib.color import ENCODED
+from resources.lib.interpolate import DEFAULT_FRAME_RATE, clamp_rate
+
+# Effects compute each frame from the time instead of reading it from an
+# animation file. A frame is rendered into one reused RGB buffer and encoded
+# into one reused payload list, so playing an effect allocates no buffers.
+
+MIN_SPEED = 0.1
+MAX_SPEED = 10.0
+
+# Brightness kept per position behind a moving dot, per position of distance
+TAIL = 0.3
+
+
+def shade_table(color):
+    """The color at each of 256 intensities, as 768 interleaved RGB bytes"""
+    return bytes(round(channel * k / 255) for k in range(256) for channel in color)
+
+
+def hue_table():
+    """Fully saturated colors around the hue wheel in 256 steps, as 768 interleaved RGB bytes"""
+    table = bytearray()
+    for step in range(256):
+        sector, fraction = divmod(step * 6 / 256, 1)
+        rising, falling = round(255 * fraction), round(255 * (1 - fraction))
+        table.extend(((255, rising, 0), (falling, 255, 0), (0, 255, rising),
+                      (0, falling, 255), (rising, 0, 255), (255, 0, falling))[int(sector)])
+    return bytes(table)
+
+
+def put(rgb, position, table, index):
+    """Copy entry index of a 768-byte color table to a position, without slicing"""
+    i, j = position * 3, index * 3
+    rgb[i] = table[j]
+    rgb[i + 1] = table[j + 1]
+    rgb[i + 2] = table[j + 2]
+
+
+def noise(position, step):
+    """Hashed value noise in [0, 1] for a position and time step"""
+    h = (position * 374761393 + step * 668265263) & 0xffffffff
+    h = ((h ^ (h >> 13)) * 1274126177) & 0xffffffff
+    return ((h ^ (h >> 16)) & 0xff) / 255.0
+
+
+class Effect:
+    """Base of the effects: render(time_ms, rgb) writes the frame at a time into rgb.
+
+    period is the length of one cycle in ms at the given speed, or 0 for an
+    effect that never changes.
+    """
+
+    base_period = 0
+    default_color = (255, 255, 255)
+
+    def __init__(self, color=None, speed=1.0, level=100):
+        self.color = tuple(color or self.default_color)
+        self.speed = min(max(float(speed or 1.0), MIN_SPEED), MAX_SPEED)
+        self.level = min(max(float(level), 0.0), 100.0)
+        self.period = round(self.base_period / self.speed)
+        self.shades = shade_table(self.color)
+
+    def phase(self, time_ms):
+        return (time_ms % self.period) / self.period if self.period else 0.0
+
+    def render(self, time_ms, rgb):
+        raise NotImplementedError
+
+
+class Rainbow(Effect):
+    """The hue wheel spread across the bar, turning"""
+
+    base_period = 4000
+
+    def __init__(self, color=None, speed=1.0, level=100):
+        super().__init__(color, speed, level)
+        self.hues = hue_table()
+
+    def render(self, time_ms, rgb):
+        offset = int(self.phase(time_ms) * 256)
+        for i in range(LED_POSITIONS):
+            put(rgb, i, self.hues, (offset + i * 256 // LED_POSITIONS) & 0xff)
+
+
+class Scanner(Effect):
+    """A dot sweeping back and forth with a fading tail, as on KITT"""
+
+    base_period = 2000
+    default_color = (255, 0, 0)
+
+    def render(self, time_ms, rgb):
+        sweep = self.phase(time_ms) * 2
+        forward = sweep < 1
+        head = (sweep if forward else 2 - sweep) * (LED_POSITIONS - 1)
+        for i in range(LED_POSITIONS):
+            distance = abs(i - head)
+            behind = (i < head) == forward
+            k = max(1 - distance, TAIL ** distance if behind else 0)
+            put(rgb, i, self.shades, int(k * 255))
+
+
+class Comet(Effect):
+    """A dot running across the bar and wrapping around, with a fading tail"""
+
+    base_period = 1500
+
+    def render(self, time_ms, rgb):
+        head = self.phase(time_ms) * LED_POSITIONS
+        for i in range(LED_POSITIONS):
+            behind = (head - i) % LED_POSITIONS
+            ahead = LED_POSITIONS - behind
+            k = max(TAIL ** behind, 1 - ahead if ahead < 1 else 0)
+            put(rgb, i, self.shades, int(k * 255))
+
+
+class Breathe(Effect):
+    """The whole bar fading in and out"""
+
+    base_period = 4000
+
+    def render(self, time_ms, rgb):
+        k = int((1 - math.cos(2 * math.pi * self.phase(time_ms))) * 127.5)
+        for i in range(LED_POSITIONS):
+            put(rgb, i, self.shades, k)
+
+
+class Fire(Effect):
+    """Flickering flames: smoothed noise per position, turning redder as it dims"""
+
+    # Noise steps per cycle, and the length of a step at speed 1 (ms)
+    steps = 64
+    step_ms = 100
+    base_period = steps * step_ms
+    default_color = (255, 96, 0)
+
+    def render(self, time_ms, rgb):
+        position = self.phase(time_ms) * self.steps
+        step = int(position)
+        fraction = position - step
+        blend = fraction * fraction * (3 - 2 * fraction)
+        following = (step + 1) % self.steps
+        for i in range(LED_POSITIONS):
+            k = noise(i, step) + (noise(i, following) - noise(i, step)) * blend
+            v = int((0.35 + 0.65 * k) * 255)
+            put(rgb, i, self.shades, v)
+            # Green falls off faster, so dimmer flames are redder
+            rgb[i * 3 + 1] = self.shades[v * v // 255 * 3 + 1]
+
+
+class LevelMeter(Effect):
+    """A bar filled from the left to level percent, the last position partly lit"""
+
+    default_color = (0xb3, 0xff, 0xff)
+
+    def render(self, time_ms, rgb):
+        lit = self.level * LED_POSITIONS / 100.0
+        for i in range(LED_POSITIONS):
+            put(rgb, i, self.shades, int(min(max(lit - i, 0.0), 1.0) * 255))
+
+
+EFFECTS = {
+    "rainbow": Rainbow,
+    "scanner": Scanner,
+    "comet": Comet,
+    "breathe": Breathe,
+    "fire": Fire,
+    "level": LevelMeter,
+}
+EFFECT_NAMES = tuple(EFFECTS)
+
+
+def make_effect(name, color=None, speed=1.0, level=100):
+    """An effect by name; raises ValueError for unknown names"""
+    try:
+        return EFFECTS[name](color, speed, level)
+    except KeyError:
+        raise ValueError(f"Unknown effect: {name}")
+
+
+class EffectFrames:
+    """Endless (delay, payloads) frames of an effect at a fixed rate through a color pipeline.
+
+    Every frame is rendered into the same RGB buffer and payload list, so
+    a frame must be written before the next one is taken.
+    """
+
+    def __init__(self, effect, pipeline, rate=DEFAULT_FRAME_RATE):
+        self.effect = effect
+        self.pipeline = pipeline
+        self.delay = 1000 // clamp_rate(rate)
+        self.time = 0
+        self.rgb = bytearray(LED_POSITIONS * 3)
+        self.payloads = [None] * (LED_POSITIONS * 3)
+
+    @property
+    def static(self):
+        return not self.effect.period
+
+    def cycle_frames(self):
+        """Frames in one cycle of the effect (1 for a static one)"""
+        return max(round(self.effect.period / self.delay), 1)
+
+    def render(self):
+        """Payloads of the frame at the current time"""
+        self.effect.render(self.time, self.rgb)
+        tables = self.pipeline.tables
+        payloads = self.payloads
+        for i, value in enumerate(self.rgb):
+            payloads[i] = ENCODED[tables[i % 3][value]]
+        return payloads
+
+    def __iter__(self):
+        while True:
+            yield self.delay, self.render()
+            self.time += self.delay
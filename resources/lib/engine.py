@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+
+from resources.lib.animation import (LED_POSITIONS, EditMemo, expand_frames, render_animation, render_frame,
+                                     static_frame)
+from resources.lib.compositor import OVERLAY, Compositor, Layer
+from resources.lib.effects import EffectFrames, make_effect
+from resources.lib.interpolate import DEFAULT_FRAME_RATE, pass_frames
+from resources.lib.resample import DEFAULT_RESAMPLE
+from resources.lib.ledbus import LedBus
+from resources.lib.scheduler import FrameScheduler
+from resources.lib.triggers import trigger_programs
+
+
+class PlaybackEngine(threading.Thread):
+    """Long-lived player that owns the LED handles and applies settings changes in place.
+
+    Requests are diffed against what is showing: brightness or color correction
+    changes apply on the next frame, a new animation is swapped in at a frame
+    boundary, and the handles stay open throughout so nothing blanks.
+    Generated effects play the same way, computed frame by frame. An
+    animation that never changes is written once and the thread sleeps, as
+    it does while one is played by kernel LED triggers.
+
+    Named layers (a volume level, a notification, an alert) can be shown
+    over whatever plays; while any are up every frame goes through the
+    compositor, which wakes the thread on its own only while a layer is
+    animating or due to expire.
+
+    An animation can be watched: each save of its file is picked up at the
+    end of the current loop pass, reusing what did not change.
+
+    An animation can also be played for a number of passes or seconds, as
+    led.py and the daemon do, calling back once it finishes or is replaced.
+    """
+
+    def __init__(self, bus=None, log=None, instrument=None, scheduler=None, hold=None, offload=True,
+                 shared=False):
+        super().__init__(daemon=True)
+        self.bus = bus
+        self.log = log
+        # Hand animations the kernel triggers can play to them; False always plays frames
+        self.allow_offload = offload
+        # Event set once a boot animation has handed the LEDs over; nothing is written before
+        self.hold = hold
+        # Other processes write the LEDs between requests, so each is applied from a full write
+        self.shared = shared
+        # Optional FrameInstrument; may be swapped while playing
+        self.instrument = instrument
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopping = False
+        self.pending = None
+        # The last request, made again when a watched file is saved
+        self.requested = None
+        self.layer_requests = []
+        # Pass FrameScheduler.virtual() to play at full speed
+        self.scheduler = scheduler or FrameScheduler()
+
+        # What is currently showing
+        self.mode = "off"
+        self.source = None
+        self.pipeline_key = None
+        self.blocks = None
+        # Payloads of an animation that never changes, which is written once
+        self.static = None
+        # Trigger programs of an animation the kernel plays, which are run once
+        self.programs = None
+        # EffectFrames of a generated effect, played instead of blocks
+        self.effect = None
+        self.swap = None
+        # A swap to a new version of the same file waits for the end of a loop pass
+        self.swap_at_loop = False
+        self.cursor = (0, 0, 0)
+        self.restarted = False
+        # Limits of the animation playing: passes, or seconds from its start (None for endless)
+        self.number = None
+        self.play_time = None
+        self.passes = 0
+        # Called with True once a limited animation finishes, or False once it is replaced or stopped
+        self.on_end = None
+        self.compositor = Compositor()
+        self.watch_thread = None
+        self.edit_memo = None
+
+    # Requests, safe to call from any thread
+
+    def request(self, **state):
+        with self.lock:
+            # A play replaced before it was applied never started; it ends here
+            superseded = self.pending.get("on_end") if self.pending is not None else None
+            if superseded is state.get("on_end") or superseded is self.on_end:
+                superseded = None
+            self.pending = self.requested = state
+        self.wake.set()
+        if superseded is not None:
+            superseded(False)
+
+    def play(self, file_path, pipeline, use_loops=False, rate=DEFAULT_FRAME_RATE, resample=DEFAULT_RESAMPLE,
+             watch=False, number=None, duration=None, on_end=None):
+        """Play an animation until replaced, or for number passes or duration seconds.
+
+        on_end(finished) is called once it ends. A request with the same
+        on_end changes the play in place (e.g. its brightness); another one
+        starts it over.
+        """
+        self.request(mode="animation", file=file_path, pipeline=pipeline, use_loops=use_loops, rate=rate,
+                     resample=resample, watch=watch, number=number, duration=duration, on_end=on_end)
+
+    def reload(self):
+        """Apply the last request again, so a saved edit of the file playing is picked up"""
+        with self.lock:
+            if self.pending is None:
+                self.pending = self.requested
+        self.wake.set()
+
+    def show_color(self, rgb, pipeline):
+        self.request(mode="color", rgb=bytes(rgb) * LED_POSITIONS, pipeline=pipeline)
+
+    def show_ambient(self, rgb, pipeline):
+        """Show one frame of a live source (RGB per position); later frames replace unapplied ones"""
+        self.request(mode="ambient", rgb=bytes(rgb), pipeline=pipeline)
+
+    def play_effect(self, name, pipeline, color=None, speed=1.0, level=100, rate=DEFAULT_FRAME_RATE):
+        self.request(mode="effect", effect=name, pipeline=pipeline, color=color, speed=speed, level=level, rate=rate)
+
+    def off(self):
+        self.request(mode="off")
+
+    def show_layer(self, name, source, pipeline, priority=OVERLAY, opacity=1.0, blend="normal", duration=None):
+        """Show a source (e.g. an effect) over the playback until hidden or duration ms pass"""
+        layer = Layer(source, pipeline, priority, opacity, blend, duration)
+        with self.lock:
+            self.layer_requests.append((name, layer))
+        self.wake.set()
+
+    def hide_layer(self, name):
+        with self.lock:
+            self.layer_requests.append((name, None))
+        self.wake.set()
+
+    def stop(self):
+        self.stopping = True
+        if self.hold is not None:
+            self.hold.set()
+        self.wake.set()
+
+    # Engine thread
+
+    def run(self):
+        try:
+            if self.hold is not None:
+                # Requests queue up meanwhile; the last one is applied once the LEDs are free
+                self.hold.wait()
+                if self.stopping:
+                    return
+            if self.bus is None:
+                self.bus = LedBus()
+            self.loop()
+        except OSError as e:
+            self.write_log(f"LED playback stopped: {e}")
+        finally:
+            self.update_watch(None)
+            if self.bus is not None:
+                self.log_stats()
+                try:
+                    # A solid color stays on when the service exits, an animation is turned off
+                    self.bus.close(turn_off=self.mode != "color")
+                except OSError:
+                    pass
+            with self.lock:
+                pending = self.pending.get("on_end") if self.pending is not None else None
+                self.pending = None
+            if pending is not None and pending is not self.on_end:
+                pending(False)
+            self.end_animation(False)
+
+    def loop(self):
+        frame_due = False
+        while not self.stopping:
+            instrument = self.instrument
+            if instrument is not None:
+                instrument.iteration()
+            self.wake.clear()
+            if self.apply_pending():
+                frame_due = True
+            if self.apply_layers():
+                frame_due = True
+            if self.blocks is None and self.effect is None:
+                self.idle()
+                continue
+            if self.static is not None:
+                # Nothing to animate: write the frame once and sleep until the next request or the play time ends
+                if frame_due:
+                    self.bus.write_frame(self.compose(self.static))
+                    frame_due = False
+                left = self.time_left()
+                if left is not None and (left <= 0 or not self.idle(left)):
+                    self.finish()
+                elif left is None:
+                    self.idle()
+                continue
+            if self.programs is not None:
+                # Handed to the kernel: program the triggers once and sleep until the next request
+                if frame_due and not self.offload():
+                    continue
+                frame_due = False
+                self.idle()
+                continue
+
+            if frame_due:
+                delay, payloads = self.current_frame()
+                if self.scheduler.next_frame(delay):
+                    if instrument is None:
+                        self.bus.write_frame(self.compose(payloads))
+                    else:
+                        instrument.write_frame(self.bus, self.compose(payloads), self.scheduler.late)
+                elif instrument is not None:
+                    instrument.drop_frame(self.scheduler.late)
+                frame_due = False
+
+            if self.tick_layers(self.scheduler.remaining()):
+                # A layer changed before the next frame; keep the same deadline
+                continue
+            if self.scheduler.wait(self.wake):
+                # Woken early by a request; handle it and keep the same deadline
+                continue
+            left = self.time_left()
+            if left is not None and left <= 0 and self.swap is None:
+                self.finish()
+                continue
+            self.advance()
+            frame_due = True
+
+    def apply_pending(self):
+        """Apply the latest request; returns True if the animation must (re)start its current frame"""
+        with self.lock:
+            state = self.pending
+            self.pending = None
+            # Another play: the one showing ends, even if the new one plays the same file
+            renewed = state is not None and state.get("on_end") is not self.on_end
+            if renewed:
+                ended, self.on_end = self.on_end, state.get("on_end")
+        if state is None:
+            return False
+        if renewed and ended is not None:
+            ended(False)
+        if self.shared:
+            self.bus.reset()
+
+        mode = state["mode"]
+        self.update_watch(state["file"] if state.get("watch") else None)
+        if mode == "off":
+            self.stop_animation()
+            self.bus.write_frame(self.compose((b"0\n",) * len(self.bus.fds)))
+            return False
+        if mode in ("color", "ambient"):
+            # A live source streams frames; only its first one takes over from what was showing
+            if mode != self.mode or mode == "color":
+                self.stop_animation()
+            payloads = render_frame((1 << LED_POSITIONS) - 1, state["rgb"], state["pipeline"])
+            self.bus.write_frame(self.compose(payloads))
+            self.mode = mode
+            return False
+
+        if mode == "effect":
+            return self.apply_effect(state)
+
+        file_path = state["file"]
+        pipeline = state["pipeline"]
+        use_loops = state["use_loops"]
+        rate = state["rate"]
+        resample = state["resample"]
+        try:
+            source = (file_path, os.stat(file_path).st_mtime_ns, use_loops, rate, resample)
+        except OSError as e:
+            self.write_log(f"Cannot play {file_path}: {e}")
+            self.end_animation(False)
+            return False
+        same_source = self.mode == "animation" and source == self.source and not renewed
+        if same_source and pipeline.key == self.pipeline_key:
+            return False
+
+        # Without loops every block plays once; with them, 'loop 0' blocks never play
+        blocks = [(repeat if use_loops else 1, frames)
+                  for repeat, frames in render_animation(file_path, pipeline, rate, resample, self.edit_memo)
+                  if frames and (repeat or not use_loops)]
+        if not blocks:
+            self.write_log(f"No frames to play in {file_path}")
+            self.end_animation(False)
+            return False
+        limits = (state.get("number"), state.get("duration"))
+
+        if same_source:
+            # Same animation through a new pipeline has the same layout, so keep the position
+            self.blocks = blocks
+            self.static = static_frame(blocks)
+            self.programs = self.find_programs(blocks)
+            self.pipeline_key = pipeline.key
+            return self.static is not None or self.programs is not None
+        if self.mode == "animation" and self.static is None and self.programs is None:
+            # Different animation: let the current frame finish, then swap
+            self.swap = (source, pipeline.key, blocks, *limits)
+            self.swap_at_loop = not renewed and source[0] == self.source[0] and source[2:] == self.source[2:]
+            return False
+
+        self.mode = "animation"
+        self.start_animation(source, pipeline.key, blocks, *limits)
+        return True
+
+    def apply_effect(self, state):
+        pipeline = state["pipeline"]
+        source = ("effect", state["effect"], state["color"], state["speed"], state["level"], state["rate"])
+        if self.mode == "effect" and source == self.source:
+            if pipeline.key == self.pipeline_key:
+                return False
+            # Same effect through a new pipeline: carry on from the same time
+            self.effect.pipeline = pipeline
+            self.pipeline_key = pipeline.key
+            if self.effect.static:
+                self.static = tuple(self.effect.render())
+            return self.static is not None
+
+        try:
+            effect = make_effect(state["effect"], state["color"], state["speed"], state["level"])
+        except ValueError as e:
+            self.write_log(f"Cannot play effect: {e}")
+            return False
+        self.stop_animation()
+        self.mode = "effect"
+        self.source = source
+        self.pipeline_key = pipeline.key
+        self.effect = EffectFrames(effect, pipeline, state["rate"])
+        if self.effect.static:
+            self.static = tuple(self.effect.render())
+        self.scheduler.start()
+        return True
+
+    def apply_layers(self):
+        """Apply queued layer changes; returns True if the animation must (re)start its current frame"""
+        with self.lock:
+            requests = self.layer_requests
+            self.layer_requests = []
+        if not requests:
+            return False
+
+        compositor = self.compositor
+        if not compositor.active:
+            # The bar shows the base as last written
+            compositor.set_base(self.bus.last)
+        now = self.now_ms()
+        for name, layer in requests:
+            if layer is None:
+                compositor.remove(name)
+            else:
+                compositor.add(name, layer, now)
+
+        if compositor.active and self.programs is not None:
+            # The kernel cannot blend: take the channels back and play the frames
+            self.programs = None
+            self.bus.clear_triggers()
+            self.bus.reset()
+            self.scheduler.start()
+            return True
+        if self.resume_programs():
+            return True
+        self.bus.write_frame(compositor.composite(now))
+        return False
+
+    def compose(self, payloads):
+        """The payloads to write for a frame of the playback: as they are, or under the layers"""
+        compositor = self.compositor
+        if not compositor.active:
+            return payloads
+        compositor.set_base(payloads)
+        return compositor.composite(self.now_ms())
+
+    def tick_layers(self, remaining=None):
+        """Sleep until the layers next change, if that comes within remaining seconds (None: any time).
+
+        Returns False at once if it does not; otherwise writes the new
+        composite, or returns early on a request, and returns True.
+        """
+        compositor = self.compositor
+        if not compositor.active:
+            return False
+        tick = compositor.next_tick(self.now_ms())
+        if tick is None or (remaining is not None and tick / 1000.0 >= remaining):
+            return False
+        if self.scheduler.wait_event(self.wake, tick / 1000.0):
+            return True
+        now = self.now_ms()
+        compositor.expire(now)
+        if self.resume_programs():
+            self.offload()
+        else:
+            self.bus.write_frame(compositor.composite(now))
+        return True
+
+    def resume_programs(self):
+        """Once the last layer is gone, hand the animation back to the kernel if it can play it"""
+        if self.compositor.active or self.blocks is None or self.static is not None or self.programs is not None:
+            return False
+        self.programs = self.find_programs(self.blocks)
+        return self.programs is not None
+
+    def idle(self, timeout=None):
+        """Sleep until the next request or for timeout seconds, waking for layer changes meanwhile.
+
+        Returns False if the whole timeout passed.
+        """
+        if self.tick_layers(timeout):
+            return True
+        if timeout is None:
+            return self.wake.wait()
+        return self.scheduler.wait_event(self.wake, timeout)
+
+    def now_ms(self):
+        return self.scheduler.clock() * 1000.0
+
+    def update_watch(self, file_path):
+        """Watch the file of the animation requested for saves, or stop watching with None"""
+        watching = self.watch_thread.path if self.watch_thread is not None else None
+        if file_path == watching:
+            return
+        if self.watch_thread is not None:
+            self.watch_thread.stop()
+            self.watch_thread.join()
+            self.watch_thread = None
+            self.edit_memo = None
+        if file_path is not None:
+            # Imported here: inotify through ctypes is slow to load, and led.py starts the engine at boot
+            from resources.lib.watch import WatchThread
+
+            self.watch_thread = WatchThread(file_path, self.reload)
+            self.watch_thread.start()
+            self.edit_memo = EditMemo()
+
+    def start_animation(self, source, pipeline_key, blocks, number=None, duration=None):
+        self.effect = None
+        self.source = source
+        self.pipeline_key = pipeline_key
+        self.blocks = blocks
+        self.static = static_frame(blocks)
+        self.number = number
+        self.passes = 0
+        self.play_time = duration or None
+        if self.play_time is None and number and self.static is not None:
+            # A static animation is shown once for as long as its passes would play
+            pass_ms = sum(repeat * sum(delay for delay, _ in frames) for repeat, frames in blocks)
+            self.play_time = pass_ms * number / 1000.0
+        self.programs = self.find_programs(blocks)
+        self.swap = None
+        self.swap_at_loop = False
+        self.cursor = (0, 0, 0)
+        # Set once the animation starts over, when its keyframes blend from its last frame
+        self.restarted = False
+        self.bus.clear_triggers()
+        self.scheduler.start()
+
+    def find_programs(self, blocks):
+        if not self.allow_offload or self.static is not None or self.compositor.active or self.limited():
+            return None
+        # The blocks already carry their repeat counts; the triggers repeat the pass played after a restart
+        return trigger_programs(expand_frames(blocks, use_loops=True).replay())
+
+    def offload(self):
+        """Program the kernel triggers; returns False, falling back to frame writes, if that fails"""
+        try:
+            self.bus.program_triggers(self.programs)
+            return True
+        except OSError as e:
+            self.write_log(f"LED triggers unavailable, playing frames instead: {e}")
+            self.programs = None
+            self.bus.clear_triggers()
+            self.scheduler.start()
+            return False
+
+    def limited(self):
+        return bool(self.number or self.play_time)
+
+    def time_left(self):
+        """Seconds left of an animation played for a time, or None"""
+        if self.play_time is None:
+            return None
+        return self.play_time - self.scheduler.elapsed()
+
+    def finish(self):
+        """End a limited animation once played, leaving its last frame up for the callback to replace"""
+        self.stop_animation()
+        self.end_animation(True)
+
+    def end_animation(self, finished):
+        with self.lock:
+            on_end, self.on_end = self.on_end, None
+        if on_end is not None:
+            on_end(finished)
+
+    def stop_animation(self):
+        self.mode = "off"
+        self.source = None
+        self.pipeline_key = None
+        self.blocks = None
+        self.static = None
+        self.programs = None
+        self.effect = None
+        self.swap = None
+        self.swap_at_loop = False
+        self.number = None
+        self.play_time = None
+        self.bus.clear_triggers()
+        # Re-check the hardware on the next write; playback may have been racing this change
+        self.bus.reset()
+
+    def current_frame(self):
+        if self.effect is not None:
+            return self.effect.delay, self.effect.render()
+        return self.current_pass()[self.cursor[2]]
+
+    def current_pass(self):
+        """Frames of the block pass the cursor is in"""
+        block, repeat, _ = self.cursor
+        return pass_frames(self.blocks[block][1], repeat, self.restarted and not block)
+
+    def advance(self):
+        """Move to the next frame, swapping in a queued animation at the boundary"""
+        if self.swap is not None and not self.swap_at_loop:
+            self.start_animation(*self.swap)
+            return
+        if self.effect is not None:
+            self.effect.time += self.effect.delay
+            return
+
+        block, repeat, frame = self.cursor
+        repeats = self.blocks[block][0]
+        frame += 1
+        if frame >= len(self.current_pass()):
+            if self.swap is not None:
+                # A new version of the file: start it where this loop pass ends
+                self.start_animation(*self.swap)
+                return
+            frame = 0
+            repeat += 1
+            if repeat >= repeats:
+                repeat = 0
+                block = (block + 1) % len(self.blocks)
+                if not block:
+                    self.passes += 1
+                    if self.number and self.passes >= self.number:
+                        self.finish()
+                        return
+                    self.restarted = True
+        self.cursor = (block, repeat, frame)
+
+    def write_log(self, message):
+        if self.log is not None:
+            self.log(message)
+
+    def log_stats(self):
+        writes = self.bus.stats()
+        frames = self.scheduler.stats()
+        self.write_log(f"LED writes: {writes['writes']} performed, {writes['skipped']} skipped")
+        self.write_log(f"Frames: {frames['frames']} played, {frames['dropped']} dropped, "
+                       f"lateness {frames['late_mean_ms']:.1f} ms mean / {frames['late_max_ms']:.1f} ms max, "
+                       f"jitter {frames['jitter_ms']:.1f} ms")
+
+    def stats(self):
+        stats = dict(self.scheduler.stats())
+        if self.bus is not None:
+            stats.update(self.bus.stats())
+        stats["mode"] = self.mode
+        if self.instrument is not None:
+            stats["instrument"] = self.instrument.snapshot()
+        return stats
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# Boot player and Kodi service agree on who drives the LEDs through a Unix
+# socket: the boot player listens on it while the boot animation plays, and
+# the service connects before its first write, sends "ready" and blocks until
+# the boot player answers "done" after its last frame.
+import os
+import socket
+import threading
+
+from resources.lib.color import ENCODED
+from resources.lib.compositor import DECODED
+from resources.lib.interpolate import DEFAULT_FRAME_RATE, clamp_rate
+
+DEFAULT_HANDOVER_SOCKET = "/run/lightbar-handover.sock"
+HANDOVER_ENV = "LIGHTBAR_HANDOVER"
+
+# Longest the service waits for a boot player to finish (s)
+HANDOVER_TIMEOUT = 10.0
+
+# Fade from the boot animation into the one played after it (ms)
+CROSSFADE_MS = 250
+
+
+def handover_path():
+    return os.environ.get(HANDOVER_ENV) or DEFAULT_HANDOVER_SOCKET
+
+
+class HandoverListener(threading.Thread):
+    """Waits on the handover socket for the Kodi service; ready is set once it asks for the LEDs"""
+
+    def __init__(self, path=None):
+        super().__init__(daemon=True)
+        self.path = path or handover_path()
+        self.ready = threading.Event()
+        self.conn = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.server.bind(self.path)
+            self.server.listen(1)
+        except OSError:
+            self.server.close()
+            raise
+
+    def run(self):
+        try:
+            conn, _ = self.server.accept()
+        except OSError:
+            # Closed by release()
+            return
+        # The service sends its request right after connecting
+        conn.settimeout(1.0)
+        try:
+            conn.recv(64)
+        except OSError:
+            pass
+        self.conn = conn
+        self.ready.set()
+
+    def release(self):
+        """Stop listening and tell a waiting service the LEDs are its own; returns True if one was waiting"""
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+        try:
+            # Wakes the thread if it is still blocked in accept()
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.join()
+        self.server.close()
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return False
+        try:
+            conn.sendall(b"done\n")
+        except OSError:
+            pass
+        conn.close()
+        return True
+
+
+def request_handover(path=None, timeout=HANDOVER_TIMEOUT):
+    """Ask a boot player holding the LEDs to hand them over and wait until it has.
+
+    Returns False at once if no boot player is listening.
+    """
+    path = path or handover_path()
+    if not os.path.exists(path):
+        return False
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    try:
+        conn.connect(path)
+        conn.sendall(b"ready\n")
+        conn.recv(64)
+    except OSError:
+        return False
+    finally:
+        conn.close()
+    return True
+
+
+def crossfade(payloads, frames, duration_ms=CROSSFADE_MS, rate=DEFAULT_FRAME_RATE):
+    """Frames that fade from the payloads on the LEDs into an animation over duration_ms, then play the rest of it.
+
+    Channels never written (None) fade in from off. Frames are cut into
+    steps of one frame at rate while the fade lasts.
+    """
+    step = 1000 // clamp_rate(rate)
+    old = [0 if payload is None else DECODED[payload] for payload in payloads]
+    target = list(old)
+    elapsed = 0
+    for delay, new in frames:
+        if elapsed >= duration_ms:
+            yield delay, new
+            continue
+        for i, payload in enumerate(new):
+            if payload is not None:
+                target[i] = DECODED[payload]
+        while delay > 0 and elapsed < duration_ms:
+            tick = min(step, delay, duration_ms - elapsed)
+            if delay - tick < step // 2:
+                # Not worth a step of its own
+                tick = delay
+            elapsed += tick
+            delay -= tick
+            k = min(elapsed / duration_ms, 1.0)
+            yield tick, [ENCODED[round(a + (b - a) * k)] for a, b in zip(old, target)]
+        if delay > 0:
+            yield delay, new
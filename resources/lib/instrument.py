@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import time
+from bisect import bisect_left
+
+# Status file the instrumented players write their stats to
+DEFAULT_STATS_FILE = "/run/lightbar-stats.json"
+STATS_FILE_ENV = "LIGHTBAR_STATS_FILE"
+
+# Histogram bucket upper bounds; values above the last fall in an overflow bucket
+WRITE_BOUNDS_US = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+LATE_BOUNDS_MS = (0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100)
+
+
+def stats_file():
+    return os.environ.get(STATS_FILE_ENV) or DEFAULT_STATS_FILE
+
+
+class Histogram:
+    """Counts per fixed bucket; recording a value never allocates"""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of values, or None if above all bounds or empty"""
+        total = sum(self.counts)
+        if not total:
+            return None
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= fraction * total:
+                return self.bounds[i] if i < len(self.bounds) else None
+        return None
+
+    def snapshot(self):
+        return {"bounds": list(self.bounds), "counts": list(self.counts),
+                "p50": self.percentile(0.5), "p99": self.percentile(0.99)}
+
+
+class FrameInstrument:
+    """Write latency, lateness, drops, writes and loop iterations of a playback loop.
+
+    Players hold None instead of an instrument when instrumentation is off, so
+    the disabled cost is one check per frame. report is called with a
+    snapshot every interval seconds (0 for never).
+    """
+
+    def __init__(self, interval=0, report=None, clock=time.monotonic):
+        self.interval = interval
+        self.report = report
+        self.clock = clock
+        self.write_us = Histogram(WRITE_BOUNDS_US)
+        self.late_ms = Histogram(LATE_BOUNDS_MS)
+        self.started = clock()
+        self.next_report = self.started + interval
+        self.frames = 0
+        self.dropped = 0
+        self.writes = 0
+        self.skipped = 0
+        self.iterations = 0
+
+    def write_frame(self, bus, payloads, late):
+        """Write a frame through the bus, timing it; late is how far behind its deadline it started (s)"""
+        writes, skipped = bus.writes, bus.skipped
+        start = time.perf_counter()
+        bus.write_frame(payloads)
+        self.write_us.add((time.perf_counter() - start) * 1e6)
+        self.late_ms.add(late * 1000.0)
+        self.frames += 1
+        self.writes += bus.writes - writes
+        self.skipped += bus.skipped - skipped
+        self.tick()
+
+    def drop_frame(self, late):
+        self.late_ms.add(late * 1000.0)
+        self.dropped += 1
+        self.tick()
+
+    def iteration(self):
+        self.iterations += 1
+
+    def tick(self):
+        if self.interval and self.report is not None:
+            now = self.clock()
+            if now >= self.next_report:
+                self.next_report = now + self.interval
+                self.report(self.snapshot())
+
+    def snapshot(self):
+        return {
+            "uptime_s": self.clock() - self.started,
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "writes": self.writes,
+            "skipped": self.skipped,
+            "iterations": self.iterations,
+            "write_us": self.write_us.snapshot(),
+            "late_ms": self.late_ms.snapshot(),
+        }
+
+
+def format_percentile(histogram, key, unit):
+    """A percentile of a histogram snapshot as its bucket bound, the overflow bound, or '-' if it is empty"""
+    if not any(histogram["counts"]):
+        return "-"
+    value = histogram[key]
+    return f">{histogram['bounds'][-1]}{unit}" if value is None else f"<={value}{unit}"
+
+
+def summary(snapshot):
+    """One-line summary of a snapshot, for logs"""
+    write, late = snapshot["write_us"], snapshot["late_ms"]
+    return (f"{snapshot['frames']} frames ({snapshot['dropped']} dropped), "
+            f"{snapshot['writes']} writes ({snapshot['skipped']} skipped), {snapshot['iterations']} iterations; "
+            f"write p50 {format_percentile(write, 'p50', 'us')} p99 {format_percentile(write, 'p99', 'us')}; "
+            f"late p50 {format_percentile(late, 'p50', 'ms')} p99 {format_percentile(late, 'p99', 'ms')}")
+
+
+def write_status(snapshot, path=None):
+    """Write a snapshot to the JSON status file atomically; failures are ignored"""
+    target = path or stats_file()
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f, indent=1)
+        os.replace(tmp, target)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+
+def read_status(path=None):
+    """The last snapshot written to the status file, or None"""
+    try:
+        with open(path or stats_file(), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
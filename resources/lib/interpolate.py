@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# A '~' in front of a frame line makes it a keyframe that is blended into
+# from whatever is showing, over the frame's delay:
+#
+#   ~400:ff0000,ff0000,ff0000,ff0000,ff0000
+#   ~1000@smooth:000000,000000,000000,000000,000000
+#
+# The flags travel in the spare bits of the frame's position mask.
+BLEND = 0x80
+EASING_SHIFT = 5
+EASING_MASK = 0x60
+POSITION_MASK = 0x1f
+
+EASINGS = {"linear": 0, "in": 1, "out": 2, "smooth": 3}
+
+# In-between frames per second. Every frame is 15 sysfs writes going out over
+# I2C to the LED driver, which stops keeping up somewhere above 50 per second.
+DEFAULT_FRAME_RATE = 30
+MAX_FRAME_RATE = 50
+
+
+def parse_blend(delay_str):
+    """Flags for a '~delay[@easing]' prefix as (delay string, flags); raises ValueError for unknown easings"""
+    delay_str, _, easing = delay_str[1:].partition('@')
+    try:
+        return delay_str, BLEND | EASINGS[easing or "linear"] << EASING_SHIFT
+    except KeyError:
+        raise ValueError(f"Unknown easing: {easing}")
+
+
+def ease(easing, t):
+    if easing == 1:
+        return t * t
+    if easing == 2:
+        return t * (2.0 - t)
+    if easing == 3:
+        return t * t * (3.0 - 2.0 * t)
+    return t
+
+
+def clamp_rate(rate):
+    return min(max(int(rate or DEFAULT_FRAME_RATE), 1), MAX_FRAME_RATE)
+
+
+def has_keyframes(blocks):
+    return any(mask & BLEND for _, frames in blocks for _, mask, _ in frames)
+
+
+class Pass(list):
+    """Expanded frames of a block's first pass.
+
+    Keyframes blend from whatever is showing, so a block can play differently
+    when it comes round again: again holds the frames of its later loop
+    passes and, on the first block, restart those played when the whole
+    animation starts over. Either is None where it plays the same.
+    """
+    again = None
+    restart = None
+
+
+def pass_frames(frames, repeat=0, restarted=False):
+    """The frames of one pass over a block: the first, a later loop pass, or the first after a restart"""
+    if repeat:
+        variant = getattr(frames, 'again', None)
+    elif restarted:
+        variant = getattr(frames, 'restart', None)
+    else:
+        return frames
+    return frames if variant is None else variant
+
+
+class Interpolator:
+    """Expands keyframes into in-between frames at a fixed output rate, tracking what is showing"""
+
+    def __init__(self, rate=DEFAULT_FRAME_RATE, size=15):
+        self.rate = clamp_rate(rate)
+        self.shown = bytes(size)
+
+    def merge(self, mask, rgb):
+        """The full frame showing after rgb is written to the positions in mask"""
+        if mask & POSITION_MASK == POSITION_MASK:
+            return rgb
+        shown = bytearray(self.shown)
+        for i in range(len(rgb) // 3):
+            if mask & (1 << i):
+                shown[i * 3:i * 3 + 3] = rgb[i * 3:i * 3 + 3]
+        return bytes(shown)
+
+    def expand(self, frames):
+        """Plain (delay, mask, rgb) frames for a list that may contain keyframes"""
+        out = []
+        for delay, mask, rgb in frames:
+            positions = mask & POSITION_MASK
+            target = self.merge(positions, rgb)
+            if mask & BLEND and delay > 0:
+                out.extend(self.steps(delay, positions, target, (mask & EASING_MASK) >> EASING_SHIFT))
+            else:
+                out.append((delay, positions, rgb))
+            self.shown = target
+        return out
+
+    def expand_block(self, repeat, frames):
+        """A Pass of frames whose later loop passes, if any, blend from the end of the one before"""
+        seed = self.shown
+        expanded = Pass(self.expand(frames))
+        if repeat > 1 and self.shown != seed and has_keyframes(((repeat, frames),)):
+            expanded.again = self.expand(frames)
+        return expanded
+
+    def steps(self, delay, mask, target, easing):
+        """Blend from what is showing to target over delay ms, ending exactly on target"""
+        count = max(1, min(round(delay * self.rate / 1000.0), delay))
+        pairs = [(start, end - start) for start, end in zip(self.shown, target)]
+        frames = []
+        elapsed = 0
+        for i in range(1, count + 1):
+            weight = ease(easing, i / count)
+            rgb = target if i == count else bytes(round(start + diff * weight) for start, diff in pairs)
+            # Spread the delay so the steps add up to it exactly
+            end = delay * i // count
+            frames.append((end - elapsed, mask, rgb))
+            elapsed = end
+        return frames
+
+
+def interpolate_blocks(blocks, rate=DEFAULT_FRAME_RATE):
+    """Blocks with keyframes expanded into Passes, or the same blocks if there are none.
+
+    The animation starts from black; when it starts over, the first block
+    blends from the last frame instead, so looping fades have no seam.
+    """
+    if not has_keyframes(blocks):
+        return blocks
+    interpolator = Interpolator(rate)
+    start = interpolator.shown
+    expanded = [(repeat, interpolator.expand_block(repeat, frames)) for repeat, frames in blocks]
+    if interpolator.shown != start and has_keyframes(blocks[:1]):
+        expanded[0][1].restart = interpolator.expand(blocks[0][1])
+    return expanded
@@ -1,36 +1,20 @@
 import xbmc
 import xbmcaddon
 import xbmcvfs
+import json
 import os
-import sys
-import time
 import threading
 
-# Default maximum brightness (255 if not specified)
-MAX_BRIGHTNESS = 128
+from resources.lib.ambilight import DEFAULT_AMBILIGHT_RATE, DEFAULT_SMOOTHING_MS, AmbilightSource
+from resources.lib.catalog import ANIMATIONS_DIR, load_catalog
+from resources.lib.color import DEFAULT_BALANCE, DEFAULT_GAMMA, ColorPipeline, percent_to_level
+from resources.lib.compositor import OVERLAY
+from resources.lib.effects import EFFECT_NAMES, make_effect
+from resources.lib.engine import PlaybackEngine
+from resources.lib.instrument import FrameInstrument, summary, write_status
+from resources.lib.interpolate import DEFAULT_FRAME_RATE
+from resources.lib.resample import DEFAULT_RESAMPLE, RESAMPLE_MODES
 
-# Define LED paths for RGB channels
-LED_PATHS = [
-    "/sys/class/leds/led13/brightness", # Red 1st position
-    "/sys/class/leds/led14/brightness", # Green 1st position
-    "/sys/class/leds/led15/brightness", # Blue 1st position
-
-    "/sys/class/leds/led10/brightness", # Red 2nd position
-    "/sys/class/leds/led11/brightness", # Green 2nd position
-    "/sys/class/leds/led12/brightness", # Blue 2nd position
-
-    "/sys/class/leds/led7/brightness",  # Red 3rd position
-    "/sys/class/leds/led8/brightness",  # Green 3rd position
-    "/sys/class/leds/led9/brightness",  # Blue 3rd position
-
-    "/sys/class/leds/led4/brightness",  # Red 4th position
-    "/sys/class/leds/led5/brightness",  # Green 4th position
-    "/sys/class/leds/led6/brightness",  # Blue 4th position
-            
-    "/sys/class/leds/led1/brightness",  # Red 5th position
-    "/sys/class/leds/led2/brightness",  # Green 5th position
-    "/sys/class/leds/led3/brightness",  # Blue 5th position
-]
 
 class LEDMonitor(xbmc.Monitor):
     def __init__(self, thread=None):
@@ -38,128 +22,123 @@ class LEDMonitor(xbmc.Monitor):
         self.effect_thread = thread
 
     def onSettingsChanged(self):
-        if self.effect_thread is not None:
-            self.effect_thread.stop()
-            self.effect_thread.join()
-            self.effect_thread = None
-
-        self.effect_thread = setup()
-
-def read_frames_from_file(file_path):
-    """Read animation frames from a file, ignoring lines that start with 'loop', '#' or are blank"""
-    if not os.path.exists(file_path):
-        print(f"File path {file_path} does not exist", file=sys.stderr)
-        sys.exit(1)
-    with open(file_path, 'r') as f:
-        lines = f.read().splitlines()
-    # Ignore lines that start with 'loop', '#' or are blank
-    frames = [line for line in lines if line.strip() and not (line.strip().lower().startswith('loop') or line.strip().startswith('#'))]
-    return frames
-
-def convert_hex_to_rgb(hex_value):
-    """Convert 3 or 6-character hex value to RGB brightness values"""
-    if len(hex_value) == 3:
-        # Convert 3-character hex to 6-character hex
-        hex_value = ''.join([c*2 for c in hex_value])
-    elif len(hex_value) == 6:
-        # No conversion needed for 6-character hex
-        pass
-    else:
-        raise ValueError(f"Invalid hex value length: {hex_value}")
-    
-    try:
-        red = int(hex_value[0:2], 16)
-        green = int(hex_value[2:4], 16)
-        blue = int(hex_value[4:6], 16)
-    except ValueError as e:
-        raise ValueError(f"Error converting hex value to RGB: {hex_value} - {e}")
-
-    # Scale values to MAX_BRIGHTNESS
-    red = int(red * MAX_BRIGHTNESS / 255)
-    green = int(green * MAX_BRIGHTNESS / 255)
-    blue = int(blue * MAX_BRIGHTNESS / 255)
-    
-    return red, green, blue
-
-def set_brightness(led_file_handles, frame, delay, stop_event):
-    """Set the brightness for all LEDs and apply delay"""
-    hex_values = frame.split(',')
-    for i in range(min(len(hex_values), len(LED_PATHS) // 3)):
-        hex_value = hex_values[i]
-        if len(hex_value) not in {3, 6}:
-            continue
-        
-        try:
-            red, green, blue = convert_hex_to_rgb(hex_value)
-        except ValueError:
-            continue
-
-        led_file_handles[i * 3].write(f"{red}\n")
-        led_file_handles[i * 3 + 1].write(f"{green}\n")
-        led_file_handles[i * 3 + 2].write(f"{blue}\n")
-
-    # Flush the file handles to ensure the values are written
-    for handle in led_file_handles:
-        handle.flush()
-
-    # Use the full delay in seconds
-    delay_seconds = delay / 1000.0
-    end_time = time.time() + delay_seconds
-    while time.time() < end_time:
-        if stop_event.is_set():
-            break
-        time.sleep(0.01)  # Check for stop event every 10ms to stay responsive
-
-def run_animation(animation_file, brightness, stop_event):
-    frames = read_frames_from_file(animation_file)
-    global MAX_BRIGHTNESS
-    MAX_BRIGHTNESS = int((brightness / 100.0) * 255)
-
-    # Open LED paths once and keep the file handles open
-    led_file_handles = []
-    for path in LED_PATHS:
-        try:
-            handle = open(path, 'w')
-            led_file_handles.append(handle)
-        except IOError as e:
-            print(f"Error opening {path}: {e}", file=sys.stderr)
-            sys.exit(1)
+        # The engine diffs the new settings against what is showing and
+        # applies them in place, without restarting playback. Rendered frames
+        # are cached per pipeline and file mtime, so no cache needs clearing.
+        self.effect_thread = setup(self.effect_thread)
 
-    try:
-        while not stop_event.is_set():
-            for frame_line in frames:
-                if stop_event.is_set():
-                    break
-                delay_str, frame = frame_line.split(':', 1)
-                try:
-                    delay = int(delay_str)
-                except ValueError:
-                    continue
-
-                set_brightness(led_file_handles, frame, delay, stop_event)
-    finally:
-        # Turn off all LEDs and close file handles
-        for handle in led_file_handles:
+    def onNotification(self, sender, method, data):
+        if method == 'Application.OnVolumeChanged' and _volume_pipeline is not None and self.effect_thread:
             try:
-                handle.write("0\n")
-                handle.flush()
-                handle.close()
-            except IOError as e:
-                print(f"Error turning off LEDs: {e}", file=sys.stderr)
-                sys.exit(1)
-
-class AnimationThread(threading.Thread):
-    def __init__(self, animation_file, brightness):
+                volume = json.loads(data)
+            except ValueError:
+                return
+            show_volume(self.effect_thread, volume.get('volume', 0), volume.get('muted', False))
+
+class AmbilightPlayer(xbmc.Player):
+    """Follows the screen colors while a video plays, when enabled, and restores the set lights after"""
+
+    def __init__(self, engine):
         super().__init__()
-        self.animation_file = animation_file
-        self.brightness = brightness
-        self.stop_event = threading.Event()
+        self.engine = engine
+        self.enabled = False
+        self.rate = DEFAULT_AMBILIGHT_RATE
+        self.smoothing_ms = DEFAULT_SMOOTHING_MS
+        self.pipeline = None
+        self.source = None
+
+    def update(self, enabled, rate, smoothing_ms, pipeline):
+        """Apply the settings; returns True if the ambilight is driving the LEDs"""
+        restart = (rate, smoothing_ms) != (self.rate, self.smoothing_ms)
+        self.enabled, self.rate, self.smoothing_ms, self.pipeline = enabled, rate, smoothing_ms, pipeline
+        if not (enabled and self.isPlayingVideo()):
+            self.stop_source()
+            return False
+        if restart:
+            self.stop_source()
+        self.start_source()
+        return True
+
+    def start_source(self):
+        if self.source is None:
+            self.source = AmbilightSource(xbmc.RenderCapture(), self.show, self.rate, self.smoothing_ms)
+            self.source.start()
+
+    def stop_source(self):
+        source, self.source = self.source, None
+        if source is not None:
+            source.stop()
+            source.join()
+            log(f"Ambilight stopped: {source.stats()}")
+
+    def show(self, rgb):
+        # Pipeline changes from the settings apply to the next frame
+        self.engine.show_ambient(rgb, self.pipeline)
+
+    def onAVStarted(self):
+        if self.enabled and self.isPlayingVideo():
+            self.start_source()
+
+    def onPlayBackStopped(self):
+        if self.source is not None:
+            self.stop_source()
+            setup(self.engine)
+
+    onPlayBackEnded = onPlayBackStopped
+    onPlayBackError = onPlayBackStopped
+
+# Metadata index of the bundled animations, loaded on first use
+_catalog = None
+_catalog_lock = threading.Lock()
+
+# Player callbacks driving the ambilight, created with the engine
+_ambilight = None
+
+# Color pipeline of the volume overlay, or None while it is turned off
+_volume_pipeline = None
+
+# How long the volume stays on the bar after a change (ms)
+VOLUME_OVERLAY_MS = 2000
+
+def animation_info(file_path):
+    """Catalog metadata for a bundled animation, or None for files outside the addon"""
+    global _catalog
+    if os.path.dirname(os.path.abspath(file_path)) != ANIMATIONS_DIR:
+        return None
+    with _catalog_lock:
+        if _catalog is None:
+            # Forking the Kodi process is unsafe, so any rebuild runs in-process
+            _catalog = load_catalog(workers=1)
+    return _catalog.get(file_path)
+
+def warn_invalid_lines(file_path):
+    """Log a warning if a bundled animation has lines that do not parse"""
+    info = animation_info(file_path)
+    if info is not None and not info['valid']:
+        xbmc.log(f"[lightbar] {file_path} has {info['invalid_lines']} invalid line(s)", xbmc.LOGWARNING)
+
+def log(message):
+    xbmc.log(f"[lightbar] {message}", xbmc.LOGDEBUG)
 
-    def run(self):
-        run_animation(self.animation_file, self.brightness, self.stop_event)
+def report_stats(snapshot):
+    xbmc.log(f"[lightbar] Frame stats: {summary(snapshot)}", xbmc.LOGINFO)
+    write_status(snapshot)
 
-    def stop(self):
-        self.stop_event.set()
+def update_instrument(engine, interval):
+    """Attach, replace or remove the engine's frame instrumentation for a report interval (0 for off)"""
+    current = engine.instrument.interval if engine.instrument is not None else 0
+    if interval != current:
+        engine.instrument = FrameInstrument(interval, report_stats) if interval > 0 else None
+
+def show_volume(engine, volume, muted=False):
+    """Show a volume level over whatever the bar is playing, for a moment"""
+    meter = make_effect('level', (255, 0, 0) if muted else None, level=volume)
+    engine.show_layer('volume', meter, _volume_pipeline, priority=OVERLAY, duration=VOLUME_OVERLAY_MS)
+
+def stop_ambilight():
+    """Stop following the screen, e.g. before the service exits"""
+    if _ambilight is not None:
+        _ambilight.stop_source()
 
 def hex_to_rgb(hex_color):
     # Remove any leading '#' character
@@ -167,23 +146,62 @@ def hex_to_rgb(hex_color):
     # Convert hex to RGB
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
-def set_led_color(red, green, blue, brightness):
-    # Map the brightness percentage to 0-255 range
-    brightness = int((brightness / 100.0) * 255)
-    red = int((red / 255.0) * brightness)
-    green = int((green / 255.0) * brightness)
-    blue = int((blue / 255.0) * brightness)
-    
-    # Apply color and brightness to LEDs
-    for i in range(1, 16, 3):
-        with open(f'/sys/class/leds/led{i}/brightness', 'w') as f:
-            f.write(str(red))
-        with open(f'/sys/class/leds/led{i+1}/brightness', 'w') as f:
-            f.write(str(green))
-        with open(f'/sys/class/leds/led{i+2}/brightness', 'w') as f:
-            f.write(str(blue))
-
-def setup():
+def configured_color(color_name, hex_color):
+    """RGB of the LED Color setting"""
+    if color_name == 'hex color code':
+        # Use hex color code as provided, handle missing '#'
+        hex_color = hex_color.lstrip('#') if hex_color else 'FFFFFF'
+        hex_color = f'#{hex_color}'
+        try:
+            rgb_color = hex_to_rgb(hex_color)
+        except ValueError:
+            # If hex color conversion fails, default to white
+            rgb_color = (255, 255, 255)
+    else:
+        # Use predefined color names
+        color_map = {
+            'white': '#FFFFFF',
+            'red': '#FF0000',
+            'orange': '#FF3300',
+            'yellow': '#FFFF00',
+            'light green': '#33FF00',
+            'green': '#00FF00',
+            'cyan': '#00FF33',
+            'light blue': '#00FFFF',
+            'blue': '#0066FF',
+            'dark blue': '#0000FF',
+            'indigo': '#3300FF',
+            'purple': '#FF00FF',
+            'magenta': '#FF0033'
+        }
+        hex_color = color_map.get(color_name, '#FFFFFF')
+        try:
+            rgb_color = hex_to_rgb(hex_color)
+        except ValueError:
+            # If color mapping or conversion fails, default to white
+            rgb_color = (255, 255, 255)
+    return rgb_color
+
+def read_color_correction(addon):
+    """Gamma and white balance gains from the addon settings, falling back to no correction"""
+    try:
+        gamma = float(addon.getSetting('gamma'))
+    except ValueError:
+        gamma = DEFAULT_GAMMA
+    balance = []
+    for setting, default in zip(('balance_red', 'balance_green', 'balance_blue'), DEFAULT_BALANCE):
+        try:
+            balance.append(float(addon.getSetting(setting)) / 100.0)
+        except ValueError:
+            balance.append(default)
+    return gamma, tuple(balance)
+
+def setup(engine=None, hold=None):
+    """Apply the addon settings to the LEDs through a long-lived playback engine.
+
+    Pass the engine returned by a previous call to update it in place. A new
+    engine writes nothing until the hold event, if given, is set.
+    """
     addon = xbmcaddon.Addon(id='service.firecube_lightbar')
     
     # Retrieve settings
@@ -193,53 +211,65 @@ def setup():
     brightness = int(addon.getSetting('brightness'))  # Combined brightness slider value
     enable_animation = addon.getSetting('enable_animation') == 'true'
     animation_file = xbmcvfs.translatePath(addon.getSetting('animation'))
+    gamma, balance = read_color_correction(addon)
+    try:
+        frame_rate = int(float(addon.getSetting('frame_rate')))
+    except ValueError:
+        frame_rate = DEFAULT_FRAME_RATE
+    try:
+        stats_interval = int(float(addon.getSetting('stats_interval')))
+    except ValueError:
+        stats_interval = 0
+    resample = addon.getSetting('resample')
+    if resample not in RESAMPLE_MODES:
+        resample = DEFAULT_RESAMPLE
+    watch_animation = addon.getSetting('watch_animation') == 'true'
+    ambilight = addon.getSetting('ambilight') == 'true'
+    try:
+        ambilight_rate = int(float(addon.getSetting('ambilight_rate')))
+    except ValueError:
+        ambilight_rate = DEFAULT_AMBILIGHT_RATE
+    try:
+        smoothing_ms = int(float(addon.getSetting('ambilight_smoothing')))
+    except ValueError:
+        smoothing_ms = DEFAULT_SMOOTHING_MS
+    effect = addon.getSetting('effect')
+    try:
+        effect_speed = float(addon.getSetting('effect_speed'))
+    except ValueError:
+        effect_speed = 1.0
+    try:
+        effect_level = float(addon.getSetting('effect_level'))
+    except ValueError:
+        effect_level = 100
+    volume_overlay = addon.getSetting('volume_overlay') == 'true'
+    pipeline = ColorPipeline(percent_to_level(brightness), gamma, balance)
+
+    global _ambilight, _volume_pipeline
+    if engine is None:
+        engine = PlaybackEngine(log=log, hold=hold)
+        engine.start()
+    if _ambilight is None or _ambilight.engine is not engine:
+        _ambilight = AmbilightPlayer(engine)
+    update_instrument(engine, stats_interval)
+    _volume_pipeline = pipeline if volume_overlay and not enable_led_controller else None
 
+    if _ambilight.update(ambilight and not enable_led_controller, ambilight_rate, smoothing_ms, pipeline):
+        # A video is playing; the set color or animation comes back when it stops
+        return engine
     if enable_led_controller:
         # Set all LEDs to off (black) if the LED controller is enabled
-        set_led_color(0, 0, 0, 100)
-        return None
-
-    if enable_animation and animation_file:
-        animation_thread = AnimationThread(animation_file, brightness)
-        animation_thread.start()
-        return animation_thread
+        engine.off()
+    elif enable_animation and animation_file:
+        engine.play(animation_file, pipeline, rate=frame_rate, resample=resample, watch=watch_animation)
+        # A cold catalog index build takes a while and only serves a warning, so keep it off the first write
+        threading.Thread(target=warn_invalid_lines, args=(animation_file,), daemon=True).start()
+    elif effect in EFFECT_NAMES:
+        engine.play_effect(effect, pipeline, configured_color(color_name, hex_color), effect_speed, effect_level,
+                           rate=frame_rate)
     else:
-        if color_name == 'hex color code':
-            # Use hex color code as provided, handle missing '#'
-            hex_color = hex_color.lstrip('#') if hex_color else 'FFFFFF'
-            hex_color = f'#{hex_color}'
-            try:
-                rgb_color = hex_to_rgb(hex_color)
-            except ValueError:
-                # If hex color conversion fails, default to white
-                rgb_color = (255, 255, 255)
-        else:
-            # Use predefined color names
-            color_map = {
-                'white': '#FFFFFF',
-                'red': '#FF0000',
-                'orange': '#FF3300',
-                'yellow': '#FFFF00',
-                'light green': '#33FF00',
-                'green': '#00FF00',
-                'cyan': '#00FF33',
-                'light blue': '#00FFFF',
-                'blue': '#0066FF',
-                'dark blue': '#0000FF',
-                'indigo': '#3300FF',
-                'purple': '#FF00FF',
-                'magenta': '#FF0033'
-            }
-            hex_color = color_map.get(color_name, '#FFFFFF')
-            try:
-                rgb_color = hex_to_rgb(hex_color)
-            except ValueError:
-                # If color mapping or conversion fails, default to white
-                rgb_color = (255, 255, 255)
-
-        red, green, blue = rgb_color
-        set_led_color(red, green, blue, brightness)
-        return None
+        engine.show_color(configured_color(color_name, hex_color), pipeline)
+    return engine
 
 
 # Start the main loop
@@ -250,6 +280,7 @@ if __name__ == "__main__":
         while not monitor.waitForAbort(1):
             pass
     finally:
+        stop_ambilight()
         if animation_thread:
             animation_thread.stop()
             animation_thread.join()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+import os
+
+# Default location of the LED class devices
+SYSFS_LEDS = "/sys/class/leds"
+
+# Set to a directory laid out like /sys/class/leds to drive a fake LED tree
+LEDS_ROOT_ENV = "LIGHTBAR_LEDS_ROOT"
+
+# Present while kernel triggers play an animation, so the next process to
+# open the bus knows to take the channels back
+TRIGGER_MARKER = "/run/lightbar-triggers"
+TRIGGER_MARKER_NAME = ".lightbar-triggers"
+
+# LED device numbers for the RGB channels, from the 1st to the 5th position
+LED_ORDER = [
+    13, 14, 15,  # 1st position
+    10, 11, 12,  # 2nd position
+    7, 8, 9,     # 3rd position
+    4, 5, 6,     # 4th position
+    1, 2, 3,     # 5th position
+]
+
+
+def leds_root():
+    return os.environ.get(LEDS_ROOT_ENV) or SYSFS_LEDS
+
+
+def led_paths(root=None):
+    """Brightness file paths for all channels, in frame order"""
+    root = root or leds_root()
+    return [os.path.join(root, f"led{n}", "brightness") for n in LED_ORDER]
+
+
+LED_PATHS = led_paths(SYSFS_LEDS)
+
+
+def make_led_tree(root):
+    """Create a directory mimicking the /sys/class/leds layout, for running off-device.
+
+    Trigger attributes are plain files, so trigger programming is recorded
+    in them rather than played.
+    """
+    for n in LED_ORDER:
+        os.makedirs(os.path.join(root, f"led{n}"), exist_ok=True)
+        with open(os.path.join(root, f"led{n}", "brightness"), 'w') as f:
+            f.write("0\n")
+        with open(os.path.join(root, f"led{n}", "trigger"), 'w') as f:
+            f.write("none\n")
+    return root
+
+
+def read_led_tree(root):
+    """Read back the current value of every channel in a fake LED tree, in frame order"""
+    values = []
+    for path in led_paths(root):
+        with open(path, 'rb') as f:
+            values.append(int(f.readline()))
+    return values
+
+
+def read_led_triggers(root):
+    """Read back the trigger attributes of every channel in a fake LED tree, in frame order"""
+    channels = []
+    for path in led_paths(root):
+        device = os.path.dirname(path)
+        attributes = {}
+        for name in ("trigger", "delay_on", "delay_off", "pattern"):
+            try:
+                with open(os.path.join(device, name), 'r') as f:
+                    attributes[name] = f.read().strip()
+            except FileNotFoundError:
+                pass
+        channels.append(attributes)
+    return channels
+
+
+def trigger_marker(paths):
+    """Marker path for the LED tree the brightness paths belong to"""
+    root = os.path.dirname(os.path.dirname(paths[0]))
+    return TRIGGER_MARKER if root == SYSFS_LEDS else os.path.join(root, TRIGGER_MARKER_NAME)
+
+
+class LedBus:
+    """Writes frames to the LED brightness files, skipping channels whose value did not change.
+
+    Each channel is held as a raw file descriptor and written with a single
+    pwrite at offset 0, with no Python-level buffering. Pass root to point the
+    bus at a directory that mimics /sys/class/leds.
+
+    Channels can also be handed to kernel triggers (see triggers.py); any
+    left running by an earlier process are cleared when the bus opens.
+    """
+
+    def __init__(self, paths=None, root=None):
+        if paths is None:
+            paths = led_paths(root)
+        self.paths = list(paths)
+        self.marker = trigger_marker(self.paths)
+        self.fds = []
+        try:
+            for path in paths:
+                self.fds.append(os.open(path, os.O_WRONLY | os.O_CLOEXEC))
+        except OSError:
+            self.close(turn_off=False)
+            raise
+
+        # Last payload committed per channel; None until first written
+        self.last = [None] * len(self.fds)
+        # Replaced by a TraceRecorder to record every write
+        self.pwrite = os.pwrite
+        self.writes = 0
+        self.skipped = 0
+
+        self.triggered = os.path.exists(self.marker)
+        if self.triggered:
+            self.clear_triggers()
+
+    def write_frame(self, payloads):
+        """Write one payload per channel; None leaves the channel untouched"""
+        last = self.last
+        fds = self.fds
+        pwrite = self.pwrite
+        for i, payload in enumerate(payloads):
+            if payload is None:
+                continue
+            if payload is last[i] or payload == last[i]:
+                self.skipped += 1
+                continue
+            pwrite(fds[i], payload, 0)
+            last[i] = payload
+            self.writes += 1
+
+    def fill(self, payload):
+        """Write the same payload to every channel"""
+        self.write_frame((payload,) * len(self.fds))
+
+    def reset(self):
+        """Forget committed values so the next frame is written in full"""
+        self.last = [None] * len(self.fds)
+
+    def program_triggers(self, programs):
+        """Run one trigger program per channel; None leaves the channel to frame writes.
+
+        Raises OSError if a trigger is missing from the kernel, with the
+        channels programmed so far still running; clear_triggers() takes them back.
+        """
+        with open(self.marker, 'w'):
+            pass
+        self.triggered = True
+        self.reset()
+        for path, program in zip(self.paths, programs):
+            device = os.path.dirname(path)
+            for attribute, value in program or ():
+                with open(os.path.join(device, attribute), 'w') as f:
+                    f.write(f"{value}\n")
+
+    def clear_triggers(self):
+        """Stop all triggers, which turns the channels off, and return them to frame writes"""
+        if not self.triggered:
+            return
+        for path in self.paths:
+            with open(os.path.join(os.path.dirname(path), "trigger"), 'w') as f:
+                f.write("none\n")
+        self.triggered = False
+        try:
+            os.unlink(self.marker)
+        except FileNotFoundError:
+            pass
+        self.reset()
+        # The kernel turns a channel off when its trigger is removed
+        self.fill(b"0\n")
+
+    def stats(self):
+        return {"writes": self.writes, "skipped": self.skipped}
+
+    def close(self, turn_off=True):
+        """Optionally turn off all LEDs, then close the descriptors"""
+        try:
+            if turn_off:
+                self.clear_triggers()
+                self.reset()
+                self.fill(b"0\n")
+        finally:
+            for fd in self.fds:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+            self.fds = []
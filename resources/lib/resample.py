@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+import math
+from functools import lru_cache
+
+# How frames with more colors than the bar has positions (e.g. the 12-LED
+# Echo ring animations) are mapped onto it:
+#   box     average the sources each position covers
+#   linear  interpolate between the two nearest sources
+#   ring    treat the sources as a ring seen edge-on and project it onto the bar
+#   first   keep the first colors and drop the rest
+RESAMPLE_MODES = ("box", "linear", "ring", "first")
+DEFAULT_RESAMPLE = "box"
+
+
+def box_weights(sources, targets):
+    scale = sources / targets
+    rows = []
+    for j in range(targets):
+        start, end = j * scale, (j + 1) * scale
+        row = []
+        for i in range(int(start), min(math.ceil(end), sources)):
+            overlap = min(end, i + 1) - max(start, i)
+            if overlap > 0:
+                row.append((i, overlap / scale))
+        rows.append(row)
+    return rows
+
+
+def linear_weights(sources, targets):
+    rows = []
+    for j in range(targets):
+        # Centre of the target position in source coordinates
+        x = min(max((j + 0.5) * sources / targets - 0.5, 0.0), sources - 1.0)
+        left = int(x)
+        frac = x - left
+        row = [(left, 1.0 - frac)]
+        if frac > 0:
+            row.append((left + 1, frac))
+        rows.append(row)
+    return rows
+
+
+def ring_weights(sources, targets):
+    # Source 0 at the top of the ring; x runs from -1 (left) to 1 (right)
+    xs = [math.sin(2 * math.pi * i / sources) for i in range(sources)]
+    width = 2.0 / targets
+    rows = []
+    for j in range(targets):
+        centre = -1.0 + (j + 0.5) * width
+        weights = [(i, 1.0 - abs(x - centre) / width) for i, x in enumerate(xs)]
+        rows.append([(i, weight) for i, weight in weights if weight > 1e-9])
+    return rows
+
+
+def first_weights(sources, targets):
+    return [[(j, 1.0)] for j in range(min(sources, targets))]
+
+
+WEIGHTS = {"box": box_weights, "linear": linear_weights, "ring": ring_weights, "first": first_weights}
+
+
+@lru_cache(maxsize=None)
+def weight_matrix(sources, targets, mode=DEFAULT_RESAMPLE):
+    """Sparse targets x sources matrix as rows of (source, weight) pairs, computed once per shape and mode"""
+    try:
+        rows = WEIGHTS[mode](sources, targets)
+    except KeyError:
+        raise ValueError(f"Unknown resample mode: {mode}")
+    return tuple(tuple(row) for row in rows)
+
+
+def resample(colors, targets, mode=DEFAULT_RESAMPLE):
+    """Map source colors (RGB tuples, None if invalid) onto targets positions as (mask, rgb bytes).
+
+    Invalid sources drop out and the remaining weights are renormalised; a
+    position with no valid source at all is left out of the mask.
+    """
+    mask = 0
+    rgb = bytearray(targets * 3)
+    for j, row in enumerate(weight_matrix(len(colors), targets, mode)):
+        total = red = green = blue = 0.0
+        for i, weight in row:
+            color = colors[i]
+            if color is None:
+                continue
+            total += weight
+            red += color[0] * weight
+            green += color[1] * weight
+            blue += color[2] * weight
+        if total <= 0:
+            continue
+        mask |= 1 << j
+        rgb[j * 3:j * 3 + 3] = (round(red / total), round(green / total), round(blue / total))
+    return mask, bytes(rgb)
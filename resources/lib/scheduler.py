@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import math
+import time
+
+
+def wait_on_event(event, timeout):
+    return event.wait(timeout)
+
+
+class VirtualClock:
+    """Time that only passes when slept through, for playing animations without real sleeps.
+
+    Waiting on an event returns at once if it is set and otherwise skips
+    ahead by the whole timeout.
+    """
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+    def wait(self, event, timeout):
+        if event.is_set():
+            return True
+        self.sleep(timeout)
+        return event.is_set()
+
+
+class FrameScheduler:
+    """Paces frames against absolute monotonic deadlines measured from the animation start.
+
+    Write time and oversleep are absorbed by the next frame instead of adding
+    up. Frames whose display window has already passed are dropped so playback
+    catches up; if it falls more than max_lag seconds behind (e.g. after a
+    suspend) the timeline is restarted from now instead.
+
+    clock, sleep and wait_event (waits on an event with a timeout) can be
+    replaced, e.g. by a VirtualClock.
+    """
+
+    def __init__(self, clock=time.monotonic, sleep=time.sleep, max_lag=1.0, wait_event=None):
+        self.clock = clock
+        self.sleep = sleep
+        self.max_lag = max_lag
+        self.wait_event = wait_event or wait_on_event
+        self.start()
+
+    @classmethod
+    def virtual(cls, virtual_clock=None):
+        """A scheduler on a virtual clock, which plays at full speed with exact timing"""
+        virtual_clock = virtual_clock or VirtualClock()
+        return cls(virtual_clock.clock, virtual_clock.sleep, wait_event=virtual_clock.wait)
+
+    def start(self):
+        """Restart the timeline and clear the stats"""
+        self.started = self.clock()
+        self.deadline = self.started
+        self.frames = 0
+        self.dropped = 0
+        self.resyncs = 0
+        self.late_sum = 0.0
+        self.late_sq_sum = 0.0
+        self.late_max = 0.0
+        # Lateness (s) of the most recent frame
+        self.late = 0.0
+
+    def resync(self):
+        """Restart the timeline from now, keeping the stats, e.g. after waiting on a slow frame source"""
+        self.deadline = self.clock()
+        self.resyncs += 1
+
+    def elapsed(self):
+        return self.clock() - self.started
+
+    def next_frame(self, delay):
+        """Advance the timeline by delay ms; returns False if the frame should be dropped"""
+        now = self.clock()
+        frame_start = self.deadline
+        if now - frame_start > self.max_lag:
+            frame_start = now
+            self.resyncs += 1
+        self.deadline = frame_start + delay / 1000.0
+
+        late = self.late = max(now - frame_start, 0.0)
+        self.frames += 1
+        self.late_sum += late
+        self.late_sq_sum += late * late
+        if late > self.late_max:
+            self.late_max = late
+
+        if delay > 0 and now >= self.deadline:
+            self.dropped += 1
+            return False
+        return True
+
+    def remaining(self):
+        """Seconds left until the current frame deadline"""
+        return self.deadline - self.clock()
+
+    def wait(self, stop_event=None):
+        """Sleep until the current frame deadline; returns True if stop_event was set.
+
+        With a stop event the thread blocks on the event itself, so it wakes
+        once per frame or immediately when stopped.
+        """
+        remaining = self.remaining()
+        if stop_event is not None:
+            return self.wait_event(stop_event, remaining) if remaining > 0 else stop_event.is_set()
+        if remaining > 0:
+            self.sleep(remaining)
+        return False
+
+    def stats(self):
+        """Frame count, drops and lateness (ms) of frame writes against their deadlines"""
+        frames = self.frames or 1
+        mean = self.late_sum / frames
+        variance = max(self.late_sq_sum / frames - mean * mean, 0.0)
+        return {
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "resyncs": self.resyncs,
+            "late_mean_ms": mean * 1000.0,
+            "late_max_ms": self.late_max * 1000.0,
+            "jitter_ms": math.sqrt(variance) * 1000.0,
+        }
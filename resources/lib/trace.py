@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import sys
+import time
+
+# A trace is a header followed by one record per brightness write that
+# reached a channel: microseconds since the previous record, the channel in
+# frame order and the value written. Skipped (unchanged) writes are not in it.
+TRACE_MAGIC = b"LBT1"
+TRACE_HEADER = struct.Struct("<4sB")
+RECORD = struct.Struct("<IBB")
+
+# Mismatches listed by a diff before it stops
+DIFF_LIMIT = 20
+
+
+class TraceRecorder:
+    """Records every write an LedBus makes, with timestamps from clock, and saves them on close"""
+
+    def __init__(self, path, clock=None):
+        self.path = path
+        self.clock = clock or time.monotonic
+        self.started = self.clock()
+        self.last = 0
+        self.channels = {}
+        self.records = bytearray()
+
+    def attach(self, bus):
+        """Route the bus's writes through the recorder"""
+        self.channels = {fd: i for i, fd in enumerate(bus.fds)}
+        bus.pwrite = self.pwrite
+
+    def pwrite(self, fd, payload, offset):
+        now = round((self.clock() - self.started) * 1e6)
+        self.records += RECORD.pack(now - self.last, self.channels[fd], int(payload))
+        self.last = now
+        return os.pwrite(fd, payload, offset)
+
+    def close(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(TRACE_HEADER.pack(TRACE_MAGIC, len(self.channels)))
+            f.write(self.records)
+        os.replace(tmp, self.path)
+
+
+def read_trace(path):
+    """The writes in a trace file as (time us, channel, value), with absolute times"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, _ = TRACE_HEADER.unpack_from(data)
+    if magic != TRACE_MAGIC:
+        raise ValueError(f"Not a lightbar trace: {path}")
+    writes = []
+    now = 0
+    for delta, channel, value in RECORD.iter_unpack(memoryview(data)[TRACE_HEADER.size:]):
+        now += delta
+        writes.append((now, channel, value))
+    return writes
+
+
+def diff_traces(expected, actual, limit=DIFF_LIMIT):
+    """Up to limit (index, expected write, actual write) mismatches; a missing write is None"""
+    mismatches = []
+    for i in range(max(len(expected), len(actual))):
+        want = expected[i] if i < len(expected) else None
+        got = actual[i] if i < len(actual) else None
+        if want != got:
+            mismatches.append((i, want, got))
+            if len(mismatches) >= limit:
+                break
+    return mismatches
+
+
+def trace_summary(writes):
+    """Write count, duration and writes per channel of a trace"""
+    per_channel = {}
+    for _, channel, _ in writes:
+        per_channel[channel] = per_channel.get(channel, 0) + 1
+    return {
+        "writes": len(writes),
+        "duration_ms": writes[-1][0] / 1000.0 if writes else 0.0,
+        "per_channel": [per_channel.get(channel, 0) for channel in range(max(per_channel, default=-1) + 1)],
+    }
+
+
+def format_write(write):
+    return "-" if write is None else f"{write[0] / 1000.0:10.3f} ms  channel {write[1]:2}  value {write[2]:3}"
+
+
+def main(argv):
+    if len(argv) == 2 and argv[0] == "show":
+        for write in read_trace(argv[1]):
+            print(format_write(write))
+        return 0
+    if len(argv) == 2 and argv[0] == "summary":
+        summary = trace_summary(read_trace(argv[1]))
+        print(f"{summary['writes']} writes over {summary['duration_ms']:.1f} ms; per channel: "
+              f"{' '.join(str(count) for count in summary['per_channel'])}")
+        return 0
+    if len(argv) == 3 and argv[0] == "diff":
+        expected, actual = read_trace(argv[1]), read_trace(argv[2])
+        mismatches = diff_traces(expected, actual)
+        for i, want, got in mismatches:
+            print(f"write {i}: {format_write(want)}  !=  {format_write(got)}")
+        if mismatches:
+            print(f"Traces differ ({len(expected)} vs {len(actual)} writes)", file=sys.stderr)
+            return 1
+        print(f"Traces match ({len(expected)} writes)")
+        return 0
+    print("Usage: python3 -m resources.lib.trace show|summary TRACE | diff EXPECTED ACTUAL", file=sys.stderr)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+# Every LED class device can run a kernel trigger on its own: "timer" blinks
+# between off and a brightness, "pattern" steps and ramps through a list of
+# brightness/duration pairs. An animation that loops forever and fits these
+# is handed to the kernel once, and nothing in Python wakes up until the next
+# change. Everything else is played frame by frame as before.
+#
+# A program is the list of (attribute, value) writes that sets one channel
+# up, in order; None leaves the channel alone.
+
+# Brightness levels a ramp may be off from the frames it replaces
+TOLERANCE = 4
+
+# The kernel rounds every duration up to whole jiffies and updates ramps in
+# 50 ms steps; shorter entries would play noticeably slower than written
+MIN_ENTRY_MS = 20
+
+# Limits of the pattern trigger: tuples per pattern, and the sysfs page the
+# pattern is written in
+MAX_PATTERN_ENTRIES = 1024
+MAX_PATTERN_CHARS = 4095
+
+# Frames looked at before giving up on an animation
+MAX_CLASSIFY_FRAMES = 4096
+
+
+def channel_rows(frames, limit=MAX_CLASSIFY_FRAMES):
+    """One pass of frames as (delays, brightness rows), with equal neighbours merged, or None if too long.
+
+    Rows hold a value per channel; a channel that is never written is None.
+    """
+    delays = []
+    rows = []
+    current = None
+    for count, (delay, payloads) in enumerate(frames):
+        if count >= limit:
+            return None
+        if current is None:
+            current = [None] * len(payloads)
+        for i, payload in enumerate(payloads):
+            if payload is not None:
+                current[i] = int(payload)
+        if delay <= 0:
+            continue
+        if rows and rows[-1] == current:
+            delays[-1] += delay
+        else:
+            delays.append(delay)
+            rows.append(list(current))
+    if not rows:
+        return None
+
+    # Channels not written until later in the pass show their last value from the pass before
+    last = rows[-1]
+    for row in rows:
+        for i, value in enumerate(row):
+            if value is None:
+                row[i] = last[i]
+    if len(rows) > 1 and rows[-1] == rows[0]:
+        # The loop ends where it starts; the phase of a loop that never ends does not matter
+        delays[0] += delays.pop()
+        rows.pop()
+    return delays, rows
+
+
+def fit_ramp(rows, times, start):
+    """End of the longest run of rows from start that a linear ramp per channel follows within TOLERANCE.
+
+    A ramp from row i ends on row j, reached at times[j]; rows wrap around so
+    the last ramp may end on the first row. Returns start + 1 if no ramp
+    covers more than one row.
+    """
+    count = len(rows)
+    first = rows[start]
+    channels = [c for c, value in enumerate(first) if value is not None]
+    lows = dict.fromkeys(channels, float("-inf"))
+    highs = dict.fromkeys(channels, float("inf"))
+    best = start + 1
+    for end in range(start + 1, count + 1):
+        row = rows[end % count]
+        span = times[end] - times[start]
+        # The ramp must land exactly on its end row...
+        if end > start + 1 and all(lows[c] <= (row[c] - first[c]) / span <= highs[c] for c in channels):
+            best = end
+        # ...and pass within TOLERANCE of every row it covers on the way
+        for c in channels:
+            lows[c] = max(lows[c], (row[c] - first[c] - TOLERANCE) / span)
+            highs[c] = min(highs[c], (row[c] - first[c] + TOLERANCE) / span)
+            if lows[c] > highs[c]:
+                return best
+    return best
+
+
+def blink_programs(delays, rows):
+    """Timer trigger programs if every changing channel blinks off and on in step, else None"""
+    on_row = None
+    programs = []
+    for first, second in zip(*rows):
+        if first is None or first == second:
+            programs.append(None if first is None else static_program(first))
+            continue
+        if min(first, second):
+            return None
+        channel_on = 0 if first else 1
+        if on_row is not None and channel_on != on_row:
+            return None
+        on_row = channel_on
+        # The timer takes its on level from the brightness the LED has when it starts
+        programs.append([("trigger", "none"), ("brightness", max(first, second)), ("trigger", "timer"),
+                         ("delay_on", delays[on_row]), ("delay_off", delays[1 - on_row])])
+    return programs
+
+
+def static_program(value):
+    return [("trigger", "none"), ("brightness", value)]
+
+
+def pattern_programs(delays, rows):
+    """Pattern trigger programs for rows, or None if they do not fit the trigger"""
+    count = len(rows)
+    times = [0]
+    for delay in delays:
+        times.append(times[-1] + delay)
+
+    # Segments shared by every channel, so all patterns have the same
+    # entries and timer rounding cannot drift the channels apart
+    segments = []
+    start = 0
+    while start < count:
+        end = fit_ramp(rows, times, start)
+        duration = times[end] - times[start]
+        if duration < MIN_ENTRY_MS:
+            return None
+        segments.append((start, duration, end > start + 1))
+        start = end
+
+    programs = []
+    for c, first in enumerate(rows[0]):
+        if first is None:
+            programs.append(None)
+            continue
+        if all(row[c] == first for row in rows):
+            programs.append(static_program(first))
+            continue
+        entries = []
+        for row, duration, ramp in segments:
+            value = rows[row][c]
+            if ramp:
+                # Ramps linearly to the value of the next entry
+                entries.append(f"{value} {duration}")
+            else:
+                # Holds, then jumps
+                entries.append(f"{value} {duration} {value} 0")
+        pattern = " ".join(entries)
+        if pattern.count(" ") + 1 > MAX_PATTERN_ENTRIES * 2 or len(pattern) > MAX_PATTERN_CHARS:
+            return None
+        programs.append([("trigger", "none"), ("trigger", "pattern"), ("pattern", pattern)])
+    return programs
+
+
+def trigger_programs(frames):
+    """Per-channel trigger programs that play one pass of frames on repeat, or None if they cannot.
+
+    Only for animations that loop until stopped: a program runs until the
+    channel's trigger is changed.
+    """
+    found = channel_rows(frames)
+    if found is None:
+        return None
+    delays, rows = found
+    if len(rows) == 1:
+        return [None if value is None else static_program(value) for value in rows[0]]
+    if len(rows) == 2:
+        programs = blink_programs(delays, rows)
+        if programs is not None and min(delays) >= MIN_ENTRY_MS:
+            return programs
+    return pattern_programs(delays, rows)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+# inotify(7) flags; the directory is watched so saves that replace the file
+# (write to a temporary name, then rename) are seen as well as in-place writes
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT = struct.Struct("iIII")
+
+# How often the fallback checks the file's modification time (s)
+POLL_INTERVAL = 0.5
+
+
+def open_inotify(directory):
+    """An inotify descriptor watching a directory for finished writes and renames, or None if unavailable"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class FileWatcher:
+    """Tells when a file has been saved, through inotify or, without it, by polling its modification time.
+
+    changed() checks without blocking; wait() blocks until the file changes
+    or stop() is called.
+    """
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL):
+        self.path = os.path.abspath(path)
+        self.name = os.fsencode(os.path.basename(self.path))
+        self.poll_interval = poll_interval
+        self.signature = self.stat()
+        self.polled = time.monotonic()
+        self.fd = open_inotify(os.path.dirname(self.path))
+        # Written to by stop() to wake a blocked wait()
+        self.wake_r, self.wake_w = os.pipe()
+        self.stopped = False
+
+    @property
+    def polling(self):
+        return self.fd is None
+
+    def stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def changed(self):
+        """True if the file was saved since the last check"""
+        if self.fd is not None:
+            return self.read_events()
+        now = time.monotonic()
+        if now - self.polled < self.poll_interval:
+            return False
+        self.polled = now
+        signature = self.stat()
+        # A file that is gone is mid-save; it counts once it is back
+        if signature is None or signature == self.signature:
+            return False
+        self.signature = signature
+        return True
+
+    def read_events(self):
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                _, _, _, length = EVENT.unpack_from(data, offset)
+                offset += EVENT.size
+                if data[offset:offset + length].rstrip(b"\0") == self.name:
+                    changed = True
+                offset += length
+
+    def wait(self, timeout=None):
+        """Block until the file is saved; returns False on timeout or once stopped"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.stopped:
+            if self.changed():
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            if self.fd is None:
+                remaining = self.poll_interval if remaining is None else min(remaining, self.poll_interval)
+                select.select([self.wake_r], [], [], remaining)
+            else:
+                select.select([self.fd, self.wake_r], [], [], remaining)
+        return False
+
+    def stop(self):
+        """Wake a blocked wait() for good; safe to call from another thread"""
+        if not self.stopped:
+            self.stopped = True
+            os.write(self.wake_w, b"\0")
+
+    def close(self):
+        self.stop()
+        for fd in (self.fd, self.wake_r, self.wake_w):
+            if fd is not None:
+                os.close(fd)
+        self.fd = self.wake_r = self.wake_w = None
+
+
+class WatchThread(threading.Thread):
+    """Calls on_change from its own thread each time a file is saved, until stopped"""
+
+    def __init__(self, path, on_change, poll_interval=POLL_INTERVAL):
+        super().__init__(daemon=True)
+        self.path = path
+        self.on_change = on_change
+        self.watcher = FileWatcher(path, poll_interval)
+
+    def run(self):
+        try:
+            while self.watcher.wait():
+                self.on_change()
+        finally:
+            self.watcher.close()
+
+    def stop(self):
+        self.watcher.stop()
@@ -1,31 +1,55 @@
+import threading
+import time
+
 import xbmc
 import xbmcaddon
 import xbmcgui
-from resources.lib.led_controller import LEDMonitor, setup
-
-# Optional one-time setup hook
-try:
-    from resources.install.setup import (
-        install_service_once,
-        ensure_shutdown_script,
-        ensure_lightbar_alias
-    )
-    install_service_once()
-    ensure_shutdown_script()
-    ensure_lightbar_alias()
-except Exception as e:
-    xbmc.log(f"[lightbar setup error] {e}", xbmc.LOGERROR)
+from resources.lib.handover import request_handover
+from resources.lib.led_controller import LEDMonitor, setup, stop_ambilight
+
+
+def run_first_time_setup(version):
+    """Install the boot units, shutdown hook and shell alias unless already done for this version"""
+    start = time.monotonic()
+    try:
+        from resources.install.setup import run_setup_once
+        ran = run_setup_once(version)
+    except Exception as e:
+        xbmc.log(f"[lightbar setup error] {e}", xbmc.LOGERROR)
+        return
+    state = "ran" if ran else "already current"
+    xbmc.log(f"[lightbar] Setup {state} ({(time.monotonic() - start) * 1000:.1f} ms)", xbmc.LOGDEBUG)
+
+
+def take_over_leds(handed_over):
+    """Wait for a boot animation still holding the LEDs (and its closing animation) to let go of them"""
+    start = time.monotonic()
+    if request_handover():
+        xbmc.log(f"[lightbar] Boot animation handed over after {(time.monotonic() - start) * 1000:.1f} ms",
+                 xbmc.LOGDEBUG)
+    handed_over.set()
 
 
 class LEDService(xbmc.Monitor):
     def __init__(self):
         super(LEDService, self).__init__()
-        self.animation_thread = setup()
+        start = time.monotonic()
+        # The engine starts now but holds its first write until a boot animation has handed over
+        handed_over = threading.Event()
+        threading.Thread(target=take_over_leds, args=(handed_over,), daemon=True).start()
+        self.animation_thread = setup(hold=handed_over)
         self.monitor = LEDMonitor(self.animation_thread)
+        xbmc.log(f"[lightbar] LED playback requested {(time.monotonic() - start) * 1000:.1f} ms after service start",
+                 xbmc.LOGDEBUG)
+
+        # Setup may stat, read and write files and reload systemd; keep it off the path to the first LED write
+        version = xbmcaddon.Addon().getAddonInfo('version')
+        threading.Thread(target=run_first_time_setup, args=(version,), daemon=True).start()
 
     def run(self):
         while not self.abortRequested():
             if self.monitor.waitForAbort(5):
+                stop_ambilight()
                 if self.animation_thread is not None:
                     self.animation_thread.stop()
                     self.animation_thread.join()
@@ -34,4 +58,3 @@ class LEDService(xbmc.Monitor):
 if __name__ == '__main__':
     service = LEDService()
     service.run()
-